@@ -0,0 +1,215 @@
+"""
+Static, pre-rendered lecture artifacts.
+
+Chapters, summary and quiz for a video almost never change once
+generated, so export_artifacts.py writes them out as one JSON document
+per video. The backend and any static file server or CDN can serve
+these documents without calling a provider:
+
+    ARTIFACTS_DIR/v1/<video_id>/<hash>.json      the artifact, never rewritten
+    ARTIFACTS_DIR/v1/<video_id>/<hash>.json.gz   the same bytes, gzipped
+    ARTIFACTS_DIR/v1/<video_id>/latest.json      {"hash", "file", "transcript_hash", "exported_at"}
+
+The file name is a hash of the artifact's bytes, so a URL always refers
+to the same content and can be cached forever. Only the small latest.json
+pointer changes when a video is re-exported. "v1" is ARTIFACT_VERSION;
+it is bumped when the document's shape changes, so old and new readers
+never see each other's files. Each artifact records the content hash of
+the transcript it was generated from. A lookup with a different
+transcript (the captions changed, or other languages were requested)
+misses, and the endpoint generates as usual.
+
+/analyze, /generate-quiz and /lecture-bundle read artifacts as their
+first tier, and GET /artifacts/<video_id> serves them with the gzipped
+copy and an ETag.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi.responses import FileResponse, Response
+
+import metrics
+
+ARTIFACTS_DIR = os.getenv("ARTIFACTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts"))
+ARTIFACT_VERSION = 1
+# Older artifacts kept per video, so URLs already handed out keep working for a while
+ARTIFACT_KEEP = int(os.getenv("ARTIFACT_KEEP", 3))
+# How long clients and CDNs may reuse latest.json before checking for a re-export
+ARTIFACT_LATEST_MAX_AGE = int(os.getenv("ARTIFACT_LATEST_MAX_AGE", 300))
+ARTIFACT_HASH_CHARS = 16
+LATEST = "latest.json"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# YouTube video IDs; anything else never becomes part of a path
+VIDEO_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+HASH_PATTERN = re.compile(rf"^[0-9a-f]{{{ARTIFACT_HASH_CHARS}}}$")
+
+# Artifacts read recently: video_id -> (latest.json mtime_ns, hash, artifact)
+_loaded: "OrderedDict[str, Tuple[int, str, dict]]" = OrderedDict()
+LOADED_LIMIT = 256
+
+
+def video_dir(video_id: str) -> str:
+    if not VIDEO_ID_PATTERN.match(video_id):
+        raise ValueError(f"Invalid video ID for an artifact: {video_id!r}")
+    return os.path.join(ARTIFACTS_DIR, f"v{ARTIFACT_VERSION}", video_id)
+
+
+def build_artifact(transcript: dict, duration: str, duration_seconds: float, chapters: list, summary: str, quiz: list) -> dict:
+    return {
+        "version": ARTIFACT_VERSION,
+        "video_id": transcript["video_id"],
+        "transcript_hash": transcript["content_hash"],
+        "language_code": transcript.get("language_code"),
+        "duration": duration,
+        "duration_seconds": duration_seconds,
+        "chapters": chapters,
+        "summary": summary,
+        "quiz": quiz
+    }
+
+
+def encode(artifact: dict) -> Tuple[str, bytes]:
+    """(hash, bytes) of an artifact; the same content always gives the same hash"""
+    body = json.dumps(artifact, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(body).hexdigest()[:ARTIFACT_HASH_CHARS], body
+
+
+def _write_atomic(path: str, data: bytes):
+    # Readers (and static servers) only ever see complete files
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_artifact(artifact: dict) -> str:
+    """Write an artifact and point latest.json at it; returns its hash"""
+    directory = video_dir(artifact["video_id"])
+    os.makedirs(directory, exist_ok=True)
+    artifact_hash, body = encode(artifact)
+    path = os.path.join(directory, f"{artifact_hash}.json")
+    if not os.path.exists(path):
+        # mtime=0 keeps the gzipped bytes identical across exports
+        _write_atomic(f"{path}.gz", gzip.compress(body, compresslevel=9, mtime=0))
+        _write_atomic(path, body)
+    _write_atomic(os.path.join(directory, LATEST), json.dumps({
+        "hash": artifact_hash,
+        "file": f"{artifact_hash}.json",
+        "transcript_hash": artifact["transcript_hash"],
+        "exported_at": time.time()
+    }).encode("utf-8"))
+    _prune(directory, artifact_hash)
+    return artifact_hash
+
+
+def _prune(directory: str, current: str):
+    """Keep the current artifact and the ARTIFACT_KEEP most recent older ones"""
+    older = []
+    for name in os.listdir(directory):
+        if name.endswith(".json") and name != LATEST and name != f"{current}.json":
+            older.append((os.stat(os.path.join(directory, name)).st_mtime, name))
+    for _, name in sorted(older, reverse=True)[ARTIFACT_KEEP:]:
+        for path in (os.path.join(directory, name), os.path.join(directory, f"{name}.gz")):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def rebase(video_id: str, transcript_hash: str) -> Optional[str]:
+    """Re-export the latest artifact for a re-timed transcript with the same text; returns the new hash"""
+    loaded = load_artifact(video_id)
+    if loaded is None:
+        return None
+    return write_artifact({**loaded[1], "transcript_hash": transcript_hash})
+
+
+def load_artifact(video_id: str) -> Optional[Tuple[str, dict]]:
+    """(hash, artifact) of the latest export for a video, None if there is none"""
+    try:
+        latest_path = os.path.join(video_dir(video_id), LATEST)
+        mtime_ns = os.stat(latest_path).st_mtime_ns
+    except (ValueError, FileNotFoundError):
+        return None
+    loaded = _loaded.get(video_id)
+    if loaded is not None and loaded[0] == mtime_ns:
+        _loaded.move_to_end(video_id)
+        return loaded[1], loaded[2]
+    try:
+        with open(latest_path, encoding="utf-8") as f:
+            artifact_hash = json.load(f)["hash"]
+        with open(os.path.join(os.path.dirname(latest_path), f"{artifact_hash}.json"), encoding="utf-8") as f:
+            artifact = json.load(f)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️  Unreadable artifact for {video_id}: {str(e)[:200]}")
+        return None
+    _loaded[video_id] = (mtime_ns, artifact_hash, artifact)
+    if len(_loaded) > LOADED_LIMIT:
+        _loaded.popitem(last=False)
+    return artifact_hash, artifact
+
+
+def lookup(video_id: str, transcript_hash: str, endpoint: str) -> Optional[dict]:
+    """The artifact for a video if it was generated from this transcript"""
+    loaded = load_artifact(video_id)
+    if loaded is None:
+        metrics.incr("artifacts", f"miss:{endpoint}")
+        return None
+    artifact = loaded[1]
+    if artifact.get("version") != ARTIFACT_VERSION or artifact.get("transcript_hash") != transcript_hash:
+        metrics.incr("artifacts", f"stale:{endpoint}")
+        return None
+    metrics.incr("artifacts", f"hit:{endpoint}")
+    return artifact
+
+
+def _not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+def serve(video_id: str, artifact_hash: Optional[str], accept_encoding: str, if_none_match: Optional[str]) -> Response:
+    """
+    Response for one artifact file: the latest export when artifact_hash is
+    None (revalidated after ARTIFACT_LATEST_MAX_AGE), otherwise that exact
+    export (cacheable forever). The gzipped copy is sent when the client
+    accepts it.
+    """
+    if artifact_hash is None:
+        loaded = load_artifact(video_id)
+        if loaded is None:
+            return Response(status_code=404)
+        artifact_hash = loaded[0]
+        cache_control = f"public, max-age={ARTIFACT_LATEST_MAX_AGE}"
+    else:
+        cache_control = IMMUTABLE
+    try:
+        path = os.path.join(video_dir(video_id), f"{artifact_hash}.json")
+    except ValueError:
+        return Response(status_code=404)
+    if not HASH_PATTERN.match(artifact_hash) or not os.path.exists(path):
+        return Response(status_code=404)
+
+    etag = f'"{artifact_hash}"'
+    headers = {"etag": etag, "cache-control": cache_control, "vary": "accept-encoding"}
+    if _not_modified(if_none_match, etag):
+        metrics.incr("artifacts", "served_not_modified")
+        return Response(status_code=304, headers=headers)
+    if "gzip" in (accept_encoding or "").lower() and os.path.exists(f"{path}.gz"):
+        metrics.incr("artifacts", "served_gzip")
+        return FileResponse(f"{path}.gz", media_type="application/json", headers={**headers, "content-encoding": "gzip"})
+    metrics.incr("artifacts", "served")
+    return FileResponse(path, media_type="application/json", headers=headers)
@@ -0,0 +1,620 @@
+"""
+Bulk attendance check-in.
+
+At class start hundreds of students check in within a minute. Instead of
+every phone writing its own attendance_records row (and deciding for
+itself whether it is on campus), check-ins are sent here and grouped into
+micro-batches: a batch is written when ATTENDANCE_BATCH_SIZE check-ins
+are waiting or ATTENDANCE_BATCH_WAIT_MS after the first one arrived.
+
+For each batch the distances to the campus geofence are computed at once
+with a vectorized haversine (NumPy), location_verified is decided on the
+server, and the verified rows are written with a single multi-row upsert
+on (session_id, student_email), the unique key attendance_records has had
+since migration 20251228000000. The first check-in of a student wins; later
+ones are reported as already marked. If the batch write fails, its rows
+are retried one by one so a single bad row cannot fail everyone else.
+
+Present/late/absent counts per session, per class and per student are
+kept in stats tables that triggers update in the same transaction as
+every attendance write (check-ins here, status changes made elsewhere),
+so the stats endpoints read one precomputed row instead of aggregating
+attendance_records. REFRESH_STATS_SQL / refresh_attendance_stats()
+recompute them from scratch.
+
+Records go to Supabase (PostgREST) when SUPABASE_URL is set and to a
+local SQLite file otherwise, which also serves as the stand-in for
+bench_attendance.py and bench_attendance_stats.py.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
+import numpy as np
+
+import metrics
+from cache import CACHE_DIR
+
+ATTENDANCE_BATCH_SIZE = int(os.getenv("ATTENDANCE_BATCH_SIZE", 200))
+ATTENDANCE_BATCH_WAIT_SECONDS = float(os.getenv("ATTENDANCE_BATCH_WAIT_MS", 50)) / 1000
+ATTENDANCE_MAX_INFLIGHT_BATCHES = int(os.getenv("ATTENDANCE_MAX_INFLIGHT_BATCHES", 4))
+ATTENDANCE_DB_PATH = os.getenv("ATTENDANCE_DB_PATH", os.path.join(CACHE_DIR, "attendance.db"))
+SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
+SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_KEY", "")
+
+# Same defaults as the app (screens/6.DashboardScreen.js)
+DEFAULT_CAMPUS_LOCATION = {"latitude": 31.649174, "longitude": 74.818695, "elevation": 228}
+ALLOWED_DISTANCE_METERS = float(os.getenv("ATTENDANCE_ALLOWED_DISTANCE", 200))
+MAX_GPS_ACCURACY_METERS = float(os.getenv("ATTENDANCE_MAX_GPS_ACCURACY", 200))
+# The campus location setting is re-read at most this often
+CAMPUS_TTL_SECONDS = 60
+EARTH_RADIUS_METERS = 6_371_008.8
+
+RECORD_COLUMNS = (
+    "session_id", "student_id", "student_email", "student_name", "status", "marked_at",
+    "distance_from_campus", "gps_accuracy", "location_verified"
+)
+ATTENDANCE_STATUSES = ("present", "late", "absent")
+
+
+
+def _record_stats_sql(row: str, sign: str) -> str:
+    """Statements applying one attendance_records row (NEW or OLD) to the stats tables"""
+    counts = ", ".join(
+        f"{status} = {{table}}.{status} {sign} ({row}.status = '{status}')" for status in ATTENDANCE_STATUSES
+    )
+    return f"""
+        UPDATE attendance_session_stats SET {counts.format(table="attendance_session_stats")}
+         WHERE session_id = {row}.session_id;
+        UPDATE attendance_class_stats SET {counts.format(table="attendance_class_stats")}
+         WHERE class_id = (SELECT class_id FROM attendance_session_stats WHERE session_id = {row}.session_id);
+        INSERT INTO attendance_student_stats (class_id, student_email, {", ".join(ATTENDANCE_STATUSES)})
+        SELECT class_id, {row}.student_email, {", ".join(f"{sign}({row}.status = '{status}')" for status in ATTENDANCE_STATUSES)}
+          FROM attendance_session_stats
+         WHERE session_id = {row}.session_id AND {row}.student_email IS NOT NULL
+        ON CONFLICT (class_id, student_email) DO UPDATE
+           SET {", ".join(f"{status} = {status} + excluded.{status}" for status in ATTENDANCE_STATUSES)};"""
+
+
+# Same tables as migration 20261019000000_create_attendance_stats.sql, kept up to
+# date by row triggers (SQLite has no statement-level triggers)
+STATS_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS attendance_session_stats (
+    session_id TEXT PRIMARY KEY,
+    class_id TEXT NOT NULL,
+    present INTEGER NOT NULL DEFAULT 0,
+    late INTEGER NOT NULL DEFAULT 0,
+    absent INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS attendance_class_stats (
+    class_id TEXT PRIMARY KEY,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    present INTEGER NOT NULL DEFAULT 0,
+    late INTEGER NOT NULL DEFAULT 0,
+    absent INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS attendance_student_stats (
+    class_id TEXT NOT NULL,
+    student_email TEXT NOT NULL,
+    present INTEGER NOT NULL DEFAULT 0,
+    late INTEGER NOT NULL DEFAULT 0,
+    absent INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (class_id, student_email)
+);
+CREATE INDEX IF NOT EXISTS idx_attendance_student_stats_email ON attendance_student_stats (student_email);
+
+CREATE TRIGGER IF NOT EXISTS attendance_records_stats_insert AFTER INSERT ON attendance_records
+BEGIN{_record_stats_sql("NEW", "+")}
+END;
+CREATE TRIGGER IF NOT EXISTS attendance_records_stats_delete AFTER DELETE ON attendance_records
+BEGIN{_record_stats_sql("OLD", "-")}
+END;
+CREATE TRIGGER IF NOT EXISTS attendance_records_stats_update AFTER UPDATE ON attendance_records
+BEGIN{_record_stats_sql("OLD", "-")}{_record_stats_sql("NEW", "+")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS attendance_sessions_stats_insert AFTER INSERT ON attendance_sessions
+WHEN NEW.class_id IS NOT NULL
+BEGIN
+    INSERT INTO attendance_class_stats (class_id, sessions) VALUES (NEW.class_id, 1)
+    ON CONFLICT (class_id) DO UPDATE SET sessions = sessions + 1;
+    INSERT OR IGNORE INTO attendance_session_stats (session_id, class_id) VALUES (NEW.id, NEW.class_id);
+END;
+CREATE TRIGGER IF NOT EXISTS attendance_sessions_stats_delete BEFORE DELETE ON attendance_sessions
+BEGIN
+    UPDATE attendance_student_stats
+       SET {", ".join(f"{status} = attendance_student_stats.{status} - r.{status}" for status in ATTENDANCE_STATUSES)}
+      FROM (SELECT student_email, {", ".join(f"SUM(status = '{status}') AS {status}" for status in ATTENDANCE_STATUSES)}
+              FROM attendance_records
+             WHERE session_id = OLD.id AND student_email IS NOT NULL
+             GROUP BY student_email) AS r
+     WHERE attendance_student_stats.class_id = OLD.class_id AND attendance_student_stats.student_email = r.student_email;
+    UPDATE attendance_class_stats
+       SET sessions = attendance_class_stats.sessions - 1,
+           {", ".join(f"{status} = attendance_class_stats.{status} - s.{status}" for status in ATTENDANCE_STATUSES)}
+      FROM attendance_session_stats AS s
+     WHERE s.session_id = OLD.id AND attendance_class_stats.class_id = s.class_id;
+    DELETE FROM attendance_session_stats WHERE session_id = OLD.id;
+END;
+"""
+
+# Recomputes the stats tables from attendance_records (refresh_attendance_stats() in the migration)
+REFRESH_STATS_SQL = f"""
+DELETE FROM attendance_student_stats;
+DELETE FROM attendance_class_stats;
+DELETE FROM attendance_session_stats;
+INSERT INTO attendance_session_stats (session_id, class_id, {", ".join(ATTENDANCE_STATUSES)})
+SELECT s.id, s.class_id, {", ".join(f"COALESCE(SUM(r.status = '{status}'), 0)" for status in ATTENDANCE_STATUSES)}
+  FROM attendance_sessions AS s
+  LEFT JOIN attendance_records AS r ON r.session_id = s.id
+ WHERE s.class_id IS NOT NULL
+ GROUP BY s.id, s.class_id;
+INSERT INTO attendance_class_stats (class_id, sessions, {", ".join(ATTENDANCE_STATUSES)})
+SELECT class_id, COUNT(*), {", ".join(f"SUM({status})" for status in ATTENDANCE_STATUSES)}
+  FROM attendance_session_stats
+ GROUP BY class_id;
+INSERT INTO attendance_student_stats (class_id, student_email, {", ".join(ATTENDANCE_STATUSES)})
+SELECT s.class_id, r.student_email, {", ".join(f"SUM(r.status = '{status}')" for status in ATTENDANCE_STATUSES)}
+  FROM attendance_records AS r
+  JOIN attendance_session_stats AS s ON s.session_id = r.session_id
+ WHERE r.student_email IS NOT NULL
+ GROUP BY s.class_id, r.student_email;
+"""
+
+def geofence_distances(
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    altitudes: np.ndarray,
+    campus: dict
+) -> np.ndarray:
+    """
+    Distance in meters from each point to the campus center (haversine).
+    Where an altitude is known (not NaN) and the campus has an elevation,
+    the height difference is included, as the app does.
+    """
+    lat1 = np.radians(latitudes)
+    lat2 = np.radians(campus["latitude"])
+    dlat = lat2 - lat1
+    dlon = np.radians(campus["longitude"] - longitudes)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    horizontal = 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    elevation = campus.get("elevation")
+    if elevation is None:
+        return horizontal
+    height = np.nan_to_num(altitudes - float(elevation), nan=0.0)
+    return np.sqrt(horizontal ** 2 + height ** 2)
+
+
+def verify_locations(check_ins: List[dict], campus: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (distances, verified) arrays for a batch of check-ins"""
+    latitudes = np.fromiter((c["latitude"] for c in check_ins), dtype=float, count=len(check_ins))
+    longitudes = np.fromiter((c["longitude"] for c in check_ins), dtype=float, count=len(check_ins))
+    altitudes = np.fromiter(
+        (np.nan if c.get("altitude") is None else c["altitude"] for c in check_ins), dtype=float, count=len(check_ins)
+    )
+    accuracies = np.fromiter(
+        (np.inf if c.get("accuracy") is None else c["accuracy"] for c in check_ins), dtype=float, count=len(check_ins)
+    )
+    distances = geofence_distances(latitudes, longitudes, altitudes, campus)
+    verified = (distances <= ALLOWED_DISTANCE_METERS) & (accuracies <= MAX_GPS_ACCURACY_METERS)
+    return distances, verified
+
+
+class SQLiteAttendanceStore:
+    """Local stand-in with the same attendance_records columns and upsert key"""
+
+    def __init__(self, path: str = ATTENDANCE_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS attendance_sessions (
+                id TEXT PRIMARY KEY,
+                class_id TEXT,
+                is_active INTEGER NOT NULL DEFAULT 1
+            )"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS attendance_records (
+                id INTEGER PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                student_id TEXT,
+                student_email TEXT,
+                student_name TEXT,
+                status TEXT NOT NULL DEFAULT 'present',
+                marked_at TEXT,
+                distance_from_campus REAL,
+                gps_accuracy REAL,
+                location_verified INTEGER DEFAULT 0,
+                UNIQUE (session_id, student_email)
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_sessions_class ON attendance_sessions (class_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_records_email ON attendance_records (student_email)")
+        conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.executescript(STATS_SCHEMA)
+        conn.commit()
+
+    def _closed_sessions(self, session_ids: List[str]) -> Set[str]:
+        rows = self._connect().execute(
+            f"SELECT id FROM attendance_sessions WHERE is_active = 0 AND id IN ({','.join('?' * len(session_ids))})",
+            session_ids
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def _upsert(self, rows: List[dict]) -> Set[Tuple[str, str]]:
+        placeholders = "(" + ",".join("?" * len(RECORD_COLUMNS)) + ")"
+        conn = self._connect()
+        with conn:
+            inserted = conn.execute(
+                f"""INSERT INTO attendance_records ({','.join(RECORD_COLUMNS)})
+                    VALUES {','.join([placeholders] * len(rows))}
+                    ON CONFLICT (session_id, student_email) DO NOTHING
+                    RETURNING session_id, student_email""",
+                [row[column] for row in rows for column in RECORD_COLUMNS]
+            ).fetchall()
+        return {(session_id, student_email) for session_id, student_email in inserted}
+
+    def _campus_location(self) -> Optional[dict]:
+        row = self._connect().execute("SELECT value FROM settings WHERE key = 'campus_location'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _rows(self, sql: str, params: tuple = ()) -> List[dict]:
+        cursor = self._connect().execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _refresh_stats(self):
+        self._connect().executescript(f"BEGIN; {REFRESH_STATS_SQL} COMMIT;")
+
+    async def campus_location(self) -> Optional[dict]:
+        return await asyncio.to_thread(self._campus_location)
+
+    async def closed_sessions(self, session_ids: List[str]) -> Set[str]:
+        # Sessions the stand-in does not know about are treated as open
+        return await asyncio.to_thread(self._closed_sessions, session_ids)
+
+    async def upsert(self, rows: List[dict]) -> Set[Tuple[str, str]]:
+        """Insert rows in one statement; returns the (session_id, student_email) pairs that were new"""
+        return await asyncio.to_thread(self._upsert, rows)
+
+    async def session_stats(self, session_id: str) -> Optional[dict]:
+        rows = await asyncio.to_thread(
+            self._rows, "SELECT * FROM attendance_session_stats WHERE session_id = ?", (session_id,)
+        )
+        return rows[0] if rows else None
+
+    async def class_stats(self, class_id: str) -> Optional[dict]:
+        rows = await asyncio.to_thread(
+            self._rows, "SELECT * FROM attendance_class_stats WHERE class_id = ?", (class_id,)
+        )
+        return rows[0] if rows else None
+
+    async def student_stats(self, student_email: str) -> List[dict]:
+        """One row per class the student has records in, with the class's session count"""
+        return await asyncio.to_thread(
+            self._rows,
+            """SELECT st.*, c.sessions FROM attendance_student_stats AS st
+               JOIN attendance_class_stats AS c ON c.class_id = st.class_id
+               WHERE st.student_email = ?""",
+            (student_email,)
+        )
+
+    async def refresh_stats(self):
+        await asyncio.to_thread(self._refresh_stats)
+
+
+class SupabaseAttendanceStore:
+    """attendance_records in Supabase, written through PostgREST"""
+
+    def __init__(self, url: str = SUPABASE_URL, key: str = SUPABASE_KEY):
+        self.url = f"{url}/rest/v1"
+        self.headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(headers=self.headers, timeout=30.0)
+        return self._client
+
+    async def campus_location(self) -> Optional[dict]:
+        response = await self.client.get(
+            f"{self.url}/settings", params={"key": "eq.campus_location", "select": "value"}
+        )
+        response.raise_for_status()
+        rows = response.json()
+        return rows[0]["value"] if rows else None
+
+    async def closed_sessions(self, session_ids: List[str]) -> Set[str]:
+        response = await self.client.get(
+            f"{self.url}/attendance_sessions",
+            params={"id": f"in.({','.join(session_ids)})", "select": "id,is_active"}
+        )
+        response.raise_for_status()
+        known = {row["id"]: row["is_active"] for row in response.json()}
+        return {session_id for session_id in session_ids if not known.get(session_id, False)}
+
+    async def upsert(self, rows: List[dict]) -> Set[Tuple[str, str]]:
+        # One INSERT ... ON CONFLICT (session_id, student_email) DO NOTHING for the whole batch;
+        # only the inserted rows come back
+        response = await self.client.post(
+            f"{self.url}/attendance_records",
+            params={"on_conflict": "session_id,student_email", "select": "session_id,student_email"},
+            headers={"Prefer": "resolution=ignore-duplicates,return=representation"},
+            json=rows
+        )
+        response.raise_for_status()
+        return {(row["session_id"], row["student_email"]) for row in response.json()}
+
+    async def _select(self, table: str, params: dict) -> List[dict]:
+        response = await self.client.get(f"{self.url}/{table}", params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def session_stats(self, session_id: str) -> Optional[dict]:
+        rows = await self._select("attendance_session_stats", {
+            "session_id": f"eq.{session_id}", "select": "session_id,class_id,present,late,absent"
+        })
+        return rows[0] if rows else None
+
+    async def class_stats(self, class_id: str) -> Optional[dict]:
+        rows = await self._select("attendance_class_stats", {
+            "class_id": f"eq.{class_id}", "select": "class_id,sessions,present,late,absent"
+        })
+        return rows[0] if rows else None
+
+    async def student_stats(self, student_email: str) -> List[dict]:
+        rows = await self._select("attendance_student_stats", {
+            "student_email": f"eq.{student_email}",
+            "select": "class_id,student_email,present,late,absent,attendance_class_stats(sessions)"
+        })
+        for row in rows:
+            row["sessions"] = (row.pop("attendance_class_stats", None) or {}).get("sessions", 0)
+        return rows
+
+    async def refresh_stats(self):
+        response = await self.client.post(f"{self.url}/rpc/refresh_attendance_stats", json={})
+        response.raise_for_status()
+
+
+class CheckInBatcher:
+    """Collects concurrent check-ins and writes them in batches"""
+
+    def __init__(
+        self,
+        store,
+        batch_size: int = ATTENDANCE_BATCH_SIZE,
+        wait_seconds: float = ATTENDANCE_BATCH_WAIT_SECONDS,
+        max_inflight: int = ATTENDANCE_MAX_INFLIGHT_BATCHES
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.wait_seconds = wait_seconds
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._max_inflight = max_inflight
+        self._campus: Optional[Tuple[float, dict]] = None
+
+    async def submit(self, check_in: dict) -> dict:
+        """Queue one check-in and wait for its batch to be written"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((check_in, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.wait_seconds, self._flush)
+        # A client that gives up does not take its check-in out of the batch
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.wait_seconds, self._flush)
+        if batch:
+            asyncio.ensure_future(self._write(batch))
+
+    async def campus(self) -> dict:
+        if self._campus is not None and self._campus[0] > time.monotonic():
+            return self._campus[1]
+        try:
+            campus = await self.store.campus_location() or DEFAULT_CAMPUS_LOCATION
+        except Exception as e:
+            print(f"⚠️  Could not load campus location, using the default: {str(e)[:200]}")
+            campus = DEFAULT_CAMPUS_LOCATION
+        self._campus = (time.monotonic() + CAMPUS_TTL_SECONDS, campus)
+        return campus
+
+    async def _write(self, batch: List[Tuple[dict, asyncio.Future]]):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_inflight)
+        async with self._slots:
+            started = time.perf_counter()
+            try:
+                results = await self._process([check_in for check_in, _ in batch])
+            except Exception as e:
+                print(f"❌ Attendance batch of {len(batch)} failed: {str(e)[:200]}")
+                metrics.incr("attendance", "failed_batches")
+                results = [{"status": "error", "detail": str(e)} for _ in batch]
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            metrics.incr("attendance", "batches")
+            metrics.incr("attendance", "check_ins", len(batch))
+            metrics.observe_latency("attendance:batch", time.perf_counter() - started)
+
+    async def _process(self, check_ins: List[dict]) -> List[dict]:
+        campus = await self.campus()
+        distances, verified = verify_locations(check_ins, campus)
+        closed = await self.store.closed_sessions(sorted({c["session_id"] for c in check_ins}))
+
+        results: List[dict] = []
+        rows: Dict[Tuple[str, str], dict] = {}
+        marked_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        for check_in, distance, ok in zip(check_ins, distances.tolist(), verified.tolist()):
+            result = {
+                "distance_from_campus": round(distance, 1),
+                "gps_accuracy": check_in.get("accuracy"),
+                "allowed_distance": ALLOWED_DISTANCE_METERS,
+                "location_verified": ok
+            }
+            if check_in["session_id"] in closed:
+                result["status"] = "session_closed"
+            elif not ok:
+                result["status"] = "rejected"
+            else:
+                key = (check_in["session_id"], check_in["student_email"])
+                # A student who checks in twice in one batch gets one row
+                rows.setdefault(key, {
+                    "session_id": check_in["session_id"],
+                    "student_id": check_in.get("student_id"),
+                    "student_email": check_in["student_email"],
+                    "student_name": check_in.get("student_name"),
+                    "status": "present",
+                    "marked_at": marked_at,
+                    "distance_from_campus": result["distance_from_campus"],
+                    "gps_accuracy": check_in.get("accuracy"),
+                    "location_verified": True
+                })
+                result["key"] = key
+            results.append(result)
+
+        inserted, failed = await self._upsert(list(rows.values()))
+        claimed: Set[Tuple[str, str]] = set()
+        for result in results:
+            key = result.pop("key", None)
+            if key is None:
+                continue
+            if key in failed:
+                result["status"] = "error"
+            elif key in inserted and key not in claimed:
+                result["status"] = "marked"
+                claimed.add(key)
+            else:
+                result["status"] = "already_marked"
+
+        for status in ("marked", "already_marked", "rejected", "session_closed", "error"):
+            count = sum(1 for result in results if result["status"] == status)
+            if count:
+                metrics.incr("attendance", status, count)
+        return results
+
+    async def _upsert(self, rows: List[dict]) -> Tuple[Set[Tuple[str, str]], Set[Tuple[str, str]]]:
+        """Write rows in one statement, or row by row if that fails; returns (inserted, failed)"""
+        if not rows:
+            return set(), set()
+        try:
+            return await self.store.upsert(rows), set()
+        except Exception as e:
+            print(f"⚠️  Attendance batch upsert failed, retrying {len(rows)} rows one by one: {str(e)[:200]}")
+            metrics.incr("attendance", "batch_retries")
+
+        inserted: Set[Tuple[str, str]] = set()
+        failed: Set[Tuple[str, str]] = set()
+        for row in rows:
+            key = (row["session_id"], row["student_email"])
+            try:
+                inserted |= await self.store.upsert([row])
+            except Exception as e:
+                print(f"❌ Could not mark attendance for {row.get('student_email')}: {str(e)[:200]}")
+                failed.add(key)
+        return inserted, failed
+
+
+def _rates(counts: dict, total: int) -> dict:
+    return {status: round(counts[status] / total, 4) if total else 0.0 for status in ATTENDANCE_STATUSES}
+
+
+def session_summary(row: dict) -> dict:
+    """Counts and rates for one session (rates are shares of its records)"""
+    total = sum(row[status] for status in ATTENDANCE_STATUSES)
+    return {
+        "session_id": row["session_id"],
+        "class_id": row["class_id"],
+        **{status: row[status] for status in ATTENDANCE_STATUSES},
+        "total": total,
+        "rates": _rates(row, total)
+    }
+
+
+def class_summary(row: dict) -> dict:
+    """Counts and rates over all sessions of a class"""
+    total = sum(row[status] for status in ATTENDANCE_STATUSES)
+    attended = row["present"] + row["late"]
+    return {
+        "class_id": row["class_id"],
+        "sessions": row["sessions"],
+        **{status: row[status] for status in ATTENDANCE_STATUSES},
+        "total": total,
+        "rates": _rates(row, total),
+        "average_attendance": round(attended / row["sessions"], 2) if row["sessions"] else 0.0
+    }
+
+
+def student_summary(student_email: str, rows: List[dict]) -> dict:
+    """
+    Per-class and overall counts for a student. Sessions of a class without
+    any record of the student count as absent.
+    """
+    classes = []
+    for row in rows:
+        recorded = sum(row[status] for status in ATTENDANCE_STATUSES)
+        counts = {
+            "present": row["present"],
+            "late": row["late"],
+            "absent": row["absent"] + max(0, row["sessions"] - recorded)
+        }
+        sessions = max(row["sessions"], recorded)
+        classes.append({
+            "class_id": row["class_id"],
+            "sessions": sessions,
+            **counts,
+            "rates": _rates(counts, sessions),
+            "attendance_rate": round((counts["present"] + counts["late"]) / sessions, 4) if sessions else 0.0
+        })
+
+    sessions = sum(item["sessions"] for item in classes)
+    totals = {status: sum(item[status] for item in classes) for status in ATTENDANCE_STATUSES}
+    return {
+        "student_email": student_email,
+        "sessions": sessions,
+        **totals,
+        "rates": _rates(totals, sessions),
+        "attendance_rate": round((totals["present"] + totals["late"]) / sessions, 4) if sessions else 0.0,
+        "classes": classes
+    }
+
+
+def create_store():
+    if SUPABASE_URL and SUPABASE_KEY:
+        return SupabaseAttendanceStore()
+    return SQLiteAttendanceStore()
+
+
+attendance_store = create_store()
+check_in_batcher = CheckInBatcher(attendance_store)
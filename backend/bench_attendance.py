@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Check-ins per second for the bulk attendance endpoint.
+
+Simulates a class start: --students check-ins arrive at once for one
+session, scattered around the campus (some outside the geofence). Each
+mode writes to a fresh SQLite stand-in (attendance.SQLiteAttendanceStore):
+
+- batched:  the CheckInBatcher used by POST /attendance/check-in
+            (vectorized geofence, one multi-row upsert per batch)
+- per-row:  what the app did before, one distance check and one
+            single-row insert per student, --concurrency at a time
+
+Every store call waits --round-trip-ms first, standing in for the
+network round trip to Supabase that a local SQLite file does not have
+(0 measures SQLite alone).
+
+With --url the same check-ins are POSTed to a running server instead
+(it writes wherever that server is configured to).
+
+Usage:
+    python bench_attendance.py --students 500 1000 5000
+    python bench_attendance.py --students 500 --url http://127.0.0.1:8000
+"""
+import argparse
+import asyncio
+import math
+import os
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="bench-attendance-"))
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+
+from attendance import (  # noqa: E402
+    ALLOWED_DISTANCE_METERS, DEFAULT_CAMPUS_LOCATION, EARTH_RADIUS_METERS,
+    CheckInBatcher, SQLiteAttendanceStore
+)
+
+
+class RoundTripStore(SQLiteAttendanceStore):
+    """SQLite store that waits a fixed round trip before every call"""
+
+    def __init__(self, path: str, round_trip: float):
+        super().__init__(path)
+        self.round_trip = round_trip
+        self.calls = 0
+
+    async def _round_trip(self):
+        self.calls += 1
+        await asyncio.sleep(self.round_trip)
+
+    async def campus_location(self):
+        await self._round_trip()
+        return await super().campus_location()
+
+    async def closed_sessions(self, session_ids):
+        await self._round_trip()
+        return await super().closed_sessions(session_ids)
+
+    async def upsert(self, rows):
+        await self._round_trip()
+        return await super().upsert(rows)
+
+
+def make_check_ins(count: int, session_id: str, seed: int = 7) -> list:
+    rng = np.random.default_rng(seed)
+    # Offsets up to ~300 m, so roughly half the class is outside a 200 m fence
+    north = rng.uniform(-300, 300, count)
+    east = rng.uniform(-300, 300, count)
+    latitude = DEFAULT_CAMPUS_LOCATION["latitude"] + np.degrees(north / EARTH_RADIUS_METERS)
+    longitude = DEFAULT_CAMPUS_LOCATION["longitude"] + np.degrees(
+        east / (EARTH_RADIUS_METERS * math.cos(math.radians(DEFAULT_CAMPUS_LOCATION["latitude"])))
+    )
+    return [
+        {
+            "session_id": session_id,
+            "student_id": str(uuid.UUID(int=i + 1)),
+            "student_email": f"student{i}@example.edu",
+            "student_name": f"Student {i}",
+            "latitude": float(latitude[i]),
+            "longitude": float(longitude[i]),
+            "altitude": None,
+            "accuracy": float(rng.uniform(5, 60))
+        }
+        for i in range(count)
+    ]
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+
+async def run_batched(check_ins: list, store: SQLiteAttendanceStore) -> Counter:
+    batcher = CheckInBatcher(store)
+    results = await asyncio.gather(*(batcher.submit(check_in) for check_in in check_ins))
+    return Counter(result["status"] for result in results)
+
+
+async def run_per_row(check_ins: list, store: SQLiteAttendanceStore, concurrency: int) -> Counter:
+    campus = DEFAULT_CAMPUS_LOCATION
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check_in_one(check_in: dict) -> str:
+        async with semaphore:
+            distance = haversine(check_in["latitude"], check_in["longitude"], campus["latitude"], campus["longitude"])
+            if distance > ALLOWED_DISTANCE_METERS:
+                return "rejected"
+            inserted = await store.upsert([{
+                "session_id": check_in["session_id"],
+                "student_id": check_in["student_id"],
+                "student_email": check_in["student_email"],
+                "student_name": check_in["student_name"],
+                "status": "present",
+                "marked_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "distance_from_campus": round(distance, 1),
+                "gps_accuracy": check_in["accuracy"],
+                "location_verified": True
+            }])
+            return "marked" if inserted else "already_marked"
+
+    return Counter(await asyncio.gather(*(check_in_one(check_in) for check_in in check_ins)))
+
+
+async def run_http(check_ins: list, url: str, concurrency: int) -> Counter:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0) as client:
+        async def check_in_one(check_in: dict) -> str:
+            async with semaphore:
+                response = await client.post("/attendance/check-in", json=check_in)
+                return response.json().get("status", str(response.status_code))
+
+        return Counter(await asyncio.gather(*(check_in_one(check_in) for check_in in check_ins)))
+
+
+def report(name: str, count: int, seconds: float, statuses: Counter, calls: str = "-"):
+    summary = ", ".join(f"{status} {n}" for status, n in sorted(statuses.items()))
+    print(f"{name:<10}{count:>9}{seconds:>9.3f}{count / seconds:>12.0f}{calls:>10}   {summary}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, nargs="+", default=[500, 1000, 5000])
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent clients for per-row and HTTP modes")
+    parser.add_argument("--round-trip-ms", type=float, default=20, help="simulated database round trip per call")
+    parser.add_argument("--url", help="benchmark a running server instead of in-process modes")
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'students':>9}{'seconds':>9}{'check-ins/s':>12}{'db calls':>10}   results")
+    for count in args.students:
+        check_ins = make_check_ins(count, str(uuid.uuid4()))
+        if args.url:
+            started = time.perf_counter()
+            statuses = await run_http(check_ins, args.url, args.concurrency)
+            report("http", count, time.perf_counter() - started, statuses)
+            continue
+
+        with tempfile.TemporaryDirectory() as directory:
+            started = time.perf_counter()
+            store = RoundTripStore(os.path.join(directory, "batched.db"), args.round_trip_ms / 1000)
+            statuses = await run_batched(check_ins, store)
+            report("batched", count, time.perf_counter() - started, statuses, str(store.calls))
+
+            started = time.perf_counter()
+            store = RoundTripStore(os.path.join(directory, "per_row.db"), args.round_trip_ms / 1000)
+            statuses = await run_per_row(check_ins, store, args.concurrency)
+            report("per-row", count, time.perf_counter() - started, statuses, str(store.calls))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
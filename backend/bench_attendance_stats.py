@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Attendance stats: precomputed rows vs. aggregating attendance_records.
+
+Builds a semester in a fresh SQLite stand-in (attendance.SQLiteAttendanceStore):
+--classes classes with --sessions sessions each and --students students
+per class, who check in present, late or absent (or not at all). Then
+edits statuses and deletes a few sessions, the way instructors do, and
+
+1. checks that the trigger-maintained stats match a full recompute
+   (REFRESH_STATS_SQL)
+2. times reading session, class and student stats from the stats tables
+   against fetching the records and counting them, as the app screens did,
+   and counts the rows each read returns (what crosses the network when
+   the app reads from Supabase)
+
+Usage:
+    python bench_attendance_stats.py --classes 10 --sessions 40 --students 60
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="bench-attendance-stats-"))
+
+from attendance import (  # noqa: E402
+    ATTENDANCE_STATUSES, SQLiteAttendanceStore, class_summary, session_summary, student_summary
+)
+
+STATS_TABLES = ("attendance_session_stats", "attendance_class_stats", "attendance_student_stats")
+
+
+def build_semester(conn: sqlite3.Connection, classes: int, sessions: int, students: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    semester = {"classes": [], "sessions": [], "students": []}
+    for c in range(classes):
+        class_id = str(uuid.uuid4())
+        emails = [f"student{c}-{i}@example.edu" for i in range(students)]
+        semester["classes"].append(class_id)
+        semester["students"].extend(emails)
+        for _ in range(sessions):
+            session_id = str(uuid.uuid4())
+            semester["sessions"].append(session_id)
+            with conn:
+                conn.execute("INSERT INTO attendance_sessions (id, class_id, is_active) VALUES (?, ?, 0)", (session_id, class_id))
+                # One multi-row insert per session, like a check-in batch
+                rows = [
+                    (session_id, email, rng.choices(ATTENDANCE_STATUSES, weights=(80, 10, 5))[0])
+                    for email in emails if rng.random() < 0.9
+                ]
+                conn.executemany(
+                    "INSERT INTO attendance_records (session_id, student_email, status) VALUES (?, ?, ?)", rows
+                )
+    return semester
+
+
+def edit_semester(conn: sqlite3.Connection, semester: dict, seed: int = 11):
+    rng = random.Random(seed)
+    with conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM attendance_records ORDER BY random() LIMIT 500")]
+        for record_id in ids:
+            conn.execute(
+                "UPDATE attendance_records SET status = ? WHERE id = ?", (rng.choice(ATTENDANCE_STATUSES), record_id)
+            )
+        conn.execute("DELETE FROM attendance_records WHERE id IN (SELECT id FROM attendance_records ORDER BY random() LIMIT 100)")
+    for session_id in rng.sample(semester["sessions"], 3):
+        with conn:
+            conn.execute("DELETE FROM attendance_sessions WHERE id = ?", (session_id,))
+            # The stand-in has no ON DELETE CASCADE
+            conn.execute("DELETE FROM attendance_records WHERE session_id = ?", (session_id,))
+        semester["sessions"].remove(session_id)
+
+
+def snapshot(conn: sqlite3.Connection) -> dict:
+    return {table: sorted(conn.execute(f"SELECT * FROM {table}").fetchall()) for table in STATS_TABLES}
+
+
+def counts(rows) -> dict:
+    counter = Counter(status for (status,) in rows)
+    return {status: counter[status] for status in ATTENDANCE_STATUSES}
+
+
+def scan_session(conn: sqlite3.Connection, session_id: str) -> tuple:
+    class_id = conn.execute("SELECT class_id FROM attendance_sessions WHERE id = ?", (session_id,)).fetchone()[0]
+    rows = conn.execute("SELECT status FROM attendance_records WHERE session_id = ?", (session_id,)).fetchall()
+    return session_summary({"session_id": session_id, "class_id": class_id, **counts(rows)}), len(rows)
+
+
+def scan_class(conn: sqlite3.Connection, class_id: str) -> tuple:
+    sessions = conn.execute("SELECT COUNT(*) FROM attendance_sessions WHERE class_id = ?", (class_id,)).fetchone()[0]
+    rows = conn.execute(
+        """SELECT r.status FROM attendance_records AS r
+           JOIN attendance_sessions AS s ON s.id = r.session_id WHERE s.class_id = ?""",
+        (class_id,)
+    ).fetchall()
+    return class_summary({"class_id": class_id, "sessions": sessions, **counts(rows)}), len(rows)
+
+
+def scan_student(conn: sqlite3.Connection, student_email: str) -> tuple:
+    records = conn.execute(
+        """SELECT s.class_id, r.status FROM attendance_records AS r
+           JOIN attendance_sessions AS s ON s.id = r.session_id WHERE r.student_email = ?""",
+        (student_email,)
+    ).fetchall()
+    rows = []
+    for class_id in sorted({class_id for class_id, _ in records}):
+        sessions = conn.execute("SELECT COUNT(*) FROM attendance_sessions WHERE class_id = ?", (class_id,)).fetchone()[0]
+        rows.append({
+            "class_id": class_id,
+            "sessions": sessions,
+            **counts([(status,) for row_class, status in records if row_class == class_id])
+        })
+    return student_summary(student_email, rows), len(records)
+
+
+async def timed(label: str, keys: list, precomputed, scan):
+    started = time.perf_counter()
+    fast = [await precomputed(key) for key in keys]
+    precomputed_ms = (time.perf_counter() - started) * 1000 / len(keys)
+    started = time.perf_counter()
+    # Through a thread as well, like the store's reads
+    slow = [await asyncio.to_thread(scan, key) for key in keys]
+    scan_ms = (time.perf_counter() - started) * 1000 / len(keys)
+    for (a, precomputed_rows), (b, _) in zip(fast, slow):
+        if "classes" in a:
+            a["classes"].sort(key=lambda item: item["class_id"])
+        assert a == b, f"{label} stats differ from the records:\n{a}\n{b}"
+    precomputed_rows = sum(rows for _, rows in fast) / len(keys)
+    scan_rows = sum(rows for _, rows in slow) / len(keys)
+    print(
+        f"{label:<10}{precomputed_ms:>14.3f}{scan_ms:>12.3f}{scan_ms / precomputed_ms:>9.1f}x"
+        f"{precomputed_rows:>12.1f}{scan_rows:>12.1f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--classes", type=int, default=10)
+    parser.add_argument("--sessions", type=int, default=40, help="sessions per class")
+    parser.add_argument("--students", type=int, default=60, help="students per class")
+    parser.add_argument("--reads", type=int, default=200, help="stats reads timed per kind")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteAttendanceStore(os.path.join(directory, "attendance.db"))
+        conn = sqlite3.connect(store.path, check_same_thread=False)
+
+        started = time.perf_counter()
+        semester = build_semester(conn, args.classes, args.sessions, args.students)
+        edit_semester(conn, semester)
+        records = conn.execute("SELECT COUNT(*) FROM attendance_records").fetchone()[0]
+        print(f"{records} records in {len(semester['sessions'])} sessions, written in {time.perf_counter() - started:.2f}s")
+
+        maintained = snapshot(conn)
+        await store.refresh_stats()
+        assert snapshot(conn) == maintained, "trigger-maintained stats differ from a full recompute"
+        print("trigger-maintained stats match a full recompute\n")
+
+        rng = random.Random(3)
+        print(f"{'stats':<10}{'precomputed ms':>14}{'scan ms':>12}{'speedup':>9}{'rows (pre)':>12}{'rows (scan)':>12}")
+
+        async def session(key):
+            return session_summary(await store.session_stats(key)), 1
+
+        async def klass(key):
+            return class_summary(await store.class_stats(key)), 1
+
+        async def student(key):
+            rows = await store.student_stats(key)
+            return student_summary(key, rows), len(rows)
+
+        await timed("session", rng.choices(semester["sessions"], k=args.reads), session, lambda key: scan_session(conn, key))
+        await timed("class", rng.choices(semester["classes"], k=args.reads), klass, lambda key: scan_class(conn, key))
+        await timed("student", rng.choices(semester["students"], k=args.reads), student, lambda key: scan_student(conn, key))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Compare the lecture screen's three-call flow with /lecture-bundle.
+
+Against a running server, for each video this times the old flow
+(/video-info, then /analyze and /generate-quiz as the app issues them)
+and /lecture-bundle in both modes, and reads the prompt token and LLM
+call counters from /metrics around each run to show what each flow sent
+to the providers. The transcript (and any section summaries) are warmed
+first so every flow pays only for its own generation.
+
+Usage:
+    python bench_bundle.py --url http://127.0.0.1:8000 --video https://youtu.be/VIDEO_ID --runs 3
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def counters(client: httpx.AsyncClient) -> dict:
+    snapshot = (await client.get("/metrics")).json()["counters"]
+    return {
+        "tokens": sum(snapshot.get("prompt_tokens", {}).values()),
+        "calls": sum(snapshot.get("llm_calls", {}).values())
+    }
+
+
+async def three_calls(client: httpx.AsyncClient, video_url: str, title: str, provider: str):
+    body = {"video_url": video_url, "video_title": title, "api_provider": provider}
+    (await client.post("/video-info", json={"video_url": video_url})).raise_for_status()
+    analyze, quiz = await asyncio.gather(
+        client.post("/analyze", json={"video_url": video_url, "api_provider": provider}),
+        client.post("/generate-quiz", json=body)
+    )
+    analyze.raise_for_status()
+    quiz.raise_for_status()
+
+
+async def bundle(client: httpx.AsyncClient, video_url: str, title: str, provider: str, mode: str):
+    response = await client.post("/lecture-bundle", json={
+        "video_url": video_url, "video_title": title, "api_provider": provider, "mode": mode
+    })
+    response.raise_for_status()
+
+
+async def measure(client: httpx.AsyncClient, flow, runs: int) -> dict:
+    latencies = []
+    before = await counters(client)
+    for _ in range(runs):
+        started = time.perf_counter()
+        await flow()
+        latencies.append(time.perf_counter() - started)
+    after = await counters(client)
+    return {
+        "p50": statistics.median(latencies),
+        "max": max(latencies),
+        "tokens": (after["tokens"] - before["tokens"]) / runs,
+        "calls": (after["calls"] - before["calls"]) / runs
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--video", action="append", required=True, help="video URL (repeatable)")
+    parser.add_argument("--title", default="Lecture")
+    parser.add_argument("--provider", default="gemini")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=300.0) as client:
+        for video_url in args.video:
+            # Warm the transcript and section summaries shared by every flow
+            await bundle(client, video_url, args.title, args.provider, "combined")
+
+            flows = {
+                "video-info + analyze + generate-quiz": lambda: three_calls(client, video_url, args.title, args.provider),
+                "lecture-bundle (combined)": lambda: bundle(client, video_url, args.title, args.provider, "combined"),
+                "lecture-bundle (concurrent)": lambda: bundle(client, video_url, args.title, args.provider, "concurrent")
+            }
+            print(f"\n{video_url} ({args.runs} runs each)")
+            print(f"{'flow':<40}{'p50 s':>8}{'max s':>8}{'calls':>7}{'prompt tokens':>15}")
+            for name, flow in flows.items():
+                result = await measure(client, flow, args.runs)
+                print(f"{name:<40}{result['p50']:>8.2f}{result['max']:>8.2f}{result['calls']:>7.1f}{result['tokens']:>15.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
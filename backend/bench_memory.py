@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Peak memory of the /analyze pipeline as transcripts grow.
+
+For synthetic transcripts of increasing length this measures, with
+tracemalloc, the memory allocated on top of the cached segments while
+(1) assembling the chapter prompt text and (2) writing the response
+body, once the way /analyze used to do it (list comprehension, one
+pydantic model per segment, whole body encoded at once) and once with
+the generator pipeline in streaming.py.
+
+The prompt has to exist as one string for the provider, so its cost
+grows with the transcript in both cases; the streamed response should
+stay flat at about STREAM_CHUNK_BYTES however long the transcript is.
+
+Usage:
+    python bench_memory.py --segments 2000 10000 50000
+"""
+import argparse
+import json
+import os
+import tempfile
+import tracemalloc
+
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="bench-memory-"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from main import Chapter, TranscriptSegment, VideoResponse, format_timestamp, timestamped_text  # noqa: E402
+from streaming import json_chunks, segment_items  # noqa: E402
+
+CHAPTERS = [Chapter(timestamp="00:00", title="Introduction", summary="What the lab covers.")]
+
+
+def make_segments(count: int) -> list:
+    return [
+        {"text": f"caption line {i} explaining step {i % 40} of the lab setup", "start": i * 2.5, "duration": 2.5}
+        for i in range(count)
+    ]
+
+
+def old_prompt(segments: list) -> int:
+    text = "\n".join([
+        f"[{format_timestamp(segment['start'])}] {segment['text']}"
+        for segment in segments
+    ])
+    return len(text)
+
+
+def new_prompt(segments: list) -> int:
+    return len(timestamped_text(segments))
+
+
+def old_response(segments: list) -> int:
+    response = VideoResponse(
+        video_id="bench",
+        transcript=[TranscriptSegment(**segment) for segment in segments],
+        chapters=CHAPTERS,
+        summary="Summary"
+    )
+    return len(json.dumps(jsonable_encoder(response), ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def new_response(segments: list) -> int:
+    body = {
+        "video_id": "bench",
+        "transcript": segment_items(segments),
+        "chapters": [chapter.model_dump() for chapter in CHAPTERS],
+        "summary": "Summary"
+    }
+    return sum(len(chunk) for chunk in json_chunks(body))
+
+
+def peak(step, segments: list) -> tuple:
+    tracemalloc.start()
+    size = step(segments)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, peak_bytes
+
+
+def mb(value: int) -> str:
+    return f"{value / 1024 / 1024:.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, nargs="+", default=[2000, 10000, 50000])
+    args = parser.parse_args()
+
+    print(f"{'segments':>9}{'prompt MB':>11}{'old peak':>10}{'new peak':>10}{'body MB':>9}{'old peak':>10}{'new peak':>10}")
+    for count in args.segments:
+        segments = make_segments(count)
+        prompt_size, old_prompt_peak = peak(old_prompt, segments)
+        _, new_prompt_peak = peak(new_prompt, segments)
+        body_size, old_body_peak = peak(old_response, segments)
+        new_body_size, new_body_peak = peak(new_response, segments)
+        assert new_body_size == body_size, "streamed body differs from the model-encoded one"
+        print(
+            f"{count:>9}{mb(prompt_size):>11}{mb(old_prompt_peak):>10}{mb(new_prompt_peak):>10}"
+            f"{mb(body_size):>9}{mb(old_body_peak):>10}{mb(new_body_peak):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
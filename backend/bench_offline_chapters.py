@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Time the offline chapter engine (offline_chapters.py).
+
+Runs extract_chapters on every cached transcript (the longest first),
+or on a synthetic lecture of the given length when nothing is cached or
+--synthetic is passed. The synthetic lecture switches topic every
+--topic-minutes, so the printed chapter starts can be checked against
+the known boundaries.
+
+Usage:
+    python bench_offline_chapters.py --limit 5 --runs 20
+    python bench_offline_chapters.py --synthetic 120 --topic-minutes 15
+"""
+import argparse
+import random
+import statistics
+import time
+
+from offline_chapters import extract_chapters
+from transcripts import cached_transcripts
+
+TOPICS = [
+    "gradient descent learning rate loss minimum step",
+    "neural network layer activation neuron weights bias",
+    "backpropagation chain rule derivative error signal",
+    "convolution kernel image filter pixel stride padding",
+    "recurrent sequence hidden state memory lstm",
+    "attention query key value transformer head softmax",
+    "overfitting regularization dropout validation noise",
+    "optimizer adam momentum schedule warmup decay batch"
+]
+FILLER = "so the we are going to look at this and then you can see that it is what happens when".split()
+SEGMENT_SECONDS = 8.0
+
+
+def synthetic_segments(minutes: float, topic_minutes: float) -> list:
+    rng = random.Random(0)
+    segments = []
+    for i in range(int(minutes * 60 / SEGMENT_SECONDS)):
+        start = i * SEGMENT_SECONDS
+        topic = TOPICS[int(start // (topic_minutes * 60)) % len(TOPICS)].split()
+        words = [rng.choice(topic) if rng.random() < 0.35 else rng.choice(FILLER) for _ in range(rng.randint(8, 14))]
+        segments.append({"text": " ".join(words), "start": start, "duration": SEGMENT_SECONDS})
+    return segments
+
+
+def bench(label: str, segments: list, runs: int):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = extract_chapters(segments)
+        timings.append(time.perf_counter() - started)
+    minutes = (segments[-1]["start"] if segments else 0) / 60
+    print(f"{label}: {len(segments)} segments, {minutes:.0f} min, "
+          f"p50 {statistics.median(timings) * 1000:.1f} ms, max {max(timings) * 1000:.1f} ms")
+    for chapter in result["chapters"]:
+        print(f"  [{chapter['timestamp_seconds'] // 60:>3}:{chapter['timestamp_seconds'] % 60:02d}] {chapter['title']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time offline chapter extraction")
+    parser.add_argument("--limit", type=int, default=5, help="Cached transcripts to run (longest first)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--synthetic", type=float, help="Minutes of synthetic lecture instead of cached transcripts")
+    parser.add_argument("--topic-minutes", type=float, default=15)
+    args = parser.parse_args()
+
+    transcripts = [] if args.synthetic else sorted(
+        cached_transcripts(), key=lambda transcript: len(transcript["segments"]), reverse=True
+    )[:args.limit]
+    if not transcripts:
+        minutes = args.synthetic or 120
+        bench(f"synthetic ({args.topic_minutes:g} min topics)", synthetic_segments(minutes, args.topic_minutes), args.runs)
+        return
+    for transcript in transcripts:
+        bench(transcript["video_id"], transcript["segments"], args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for serve.py across worker counts.
+
+Starts the server with 1, 2, 4, ... workers against a temporary shared
+cache seeded with one video's metadata, drives /video-info (a cache hit
+served from SQLite) from several client processes, and prints requests
+per second and scaling efficiency for each worker count.
+
+Usage:
+    python bench_serving.py --workers 1 2 4 --duration 10
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BENCH_VIDEO_ID = "benchVideo01"
+
+
+def seed_cache(cache_dir: str):
+    os.environ["CACHE_DIR"] = cache_dir
+    from cache import PersistentCache
+    PersistentCache(os.path.join(cache_dir, "cache.db")).set("video_meta", BENCH_VIDEO_ID, {
+        "video_id": BENCH_VIDEO_ID,
+        "title": None,
+        "duration_seconds": 3600,
+        "source": "bench"
+    })
+
+
+async def drive(url: str, connections: int, duration: float) -> int:
+    done = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        async def worker():
+            nonlocal done
+            while time.monotonic() < deadline:
+                response = await client.post(url, json={"video_url": f"https://youtu.be/{BENCH_VIDEO_ID}"})
+                if response.status_code == 200:
+                    done += 1
+        await asyncio.gather(*(worker() for _ in range(connections)))
+    return done
+
+
+def client_process(url: str, connections: int, duration: float, results):
+    results.put(asyncio.run(drive(url, connections, duration)))
+
+
+def wait_healthy(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not become healthy")
+
+
+def run(workers: int, port: int, cache_dir: str, clients: int, connections: int, duration: float) -> float:
+    env = dict(os.environ, CACHE_DIR=cache_dir)
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port), "--host", "127.0.0.1"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_healthy(port)
+        results = multiprocessing.Queue()
+        url = f"http://127.0.0.1:{port}/video-info"
+        processes = [
+            multiprocessing.Process(target=client_process, args=(url, connections, duration, results))
+            for _ in range(clients)
+        ]
+        for process in processes:
+            process.start()
+        total = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        return total / duration
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serve.py throughput by worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=max((os.cpu_count() or 2) // 2, 1), help="Load generator processes")
+    parser.add_argument("--connections", type=int, default=32, help="Connections per load generator")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        seed_cache(cache_dir)
+        baseline = None
+        for workers in args.workers:
+            throughput = run(workers, args.port, cache_dir, args.clients, args.connections, args.duration)
+            baseline = baseline or throughput / workers
+            efficiency = throughput / (baseline * workers) * 100
+            print(f"{workers:>3} workers: {throughput:8.0f} req/s  ({efficiency:.0f}% of linear)")
+
+
+if __name__ == "__main__":
+    main()
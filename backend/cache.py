@@ -0,0 +1,131 @@
+"""
+Persistent key/value cache backed by SQLite.
+
+Values are stored as JSON under a (namespace, key) pair with an optional
+expiry time, so cached results survive restarts instead of being
+recomputed on every request. The database runs in WAL mode so every
+worker process started by serve.py shares it: readers never block the
+writer, and a result stored by one worker is visible to the others.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional
+
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(CACHE_DIR, "cache.db"))
+
+
+class PersistentCache:
+    """Small JSON key/value store with per-entry TTLs"""
+
+    def __init__(self, path: str = CACHE_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # sqlite3 connections must not be shared between threads, and the
+        # endpoints call into the cache from worker threads as well
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL makes NORMAL durable against application crashes, and it
+            # avoids an fsync on every cache write
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries(expires_at)")
+        conn.commit()
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired"""
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return default
+        return json.loads(value)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a JSON-serializable value, optionally expiring after ttl seconds"""
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        conn = self._connect()
+        conn.execute(
+            """INSERT INTO cache_entries (namespace, key, value, expires_at, updated_at)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(namespace, key) DO UPDATE SET
+                   value = excluded.value,
+                   expires_at = excluded.expires_at,
+                   updated_at = excluded.updated_at""",
+            (namespace, key, json.dumps(value), expires_at, now)
+        )
+        conn.commit()
+
+    def add(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Store value only if the key is missing or expired; returns whether it was stored"""
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        conn = self._connect()
+        cursor = conn.execute(
+            """INSERT INTO cache_entries (namespace, key, value, expires_at, updated_at)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(namespace, key) DO UPDATE SET
+                   value = excluded.value,
+                   expires_at = excluded.expires_at,
+                   updated_at = excluded.updated_at
+               WHERE cache_entries.expires_at IS NOT NULL AND cache_entries.expires_at <= ?""",
+            (namespace, key, json.dumps(value), expires_at, now, now)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+
+    def delete(self, namespace: str, key: str):
+        conn = self._connect()
+        conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+        conn.commit()
+
+    def keys(self, namespace: str) -> List[str]:
+        """List the live keys in a namespace"""
+        rows = self._connect().execute(
+            "SELECT key FROM cache_entries WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge_expired(self) -> int:
+        """Delete expired entries and return how many were removed"""
+        conn = self._connect()
+        cursor = conn.execute(
+            "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (time.time(),)
+        )
+        conn.commit()
+        return cursor.rowcount
+
+
+cache = PersistentCache()
@@ -0,0 +1,224 @@
+"""
+Provider-side context caching for repeated questions on the same content.
+
+The large, shared part of a prompt (a video transcript or a note body) is
+uploaded once as Gemini cached content, keyed by a hash of the model and
+content and owned by the pool key that created it, and each question
+afterwards only sends the question text.
+Content that is too small to cache, models without caching support and
+providers without an equivalent API fall back to sending the full prompt.
+"""
+import hashlib
+import os
+import time
+from typing import Optional, Set
+
+import google.genai as genai
+from google.genai import types
+
+import metrics
+import usage
+from cache import cache
+from credentials import gemini_pool, is_quota_error, is_rate_limit_error
+from deadlines import bounded, shared
+
+CONTEXT_CACHE_NAMESPACE = "context_cache"
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() != "false"
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL", 3600))
+# Gemini rejects cached content below a model-specific minimum token count
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", 1024))
+
+# Models that rejected cache creation, so we stop trying for this process
+_unsupported_models: Set[str] = set()
+# Cache creations currently running, so concurrent first questions share one
+_inflight: dict = {}
+
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)"""
+    return len(text) // 4
+
+
+def _find_entry(model: str, key_hash: str) -> Optional[dict]:
+    """Find a live cache for this content under any pool key that is not quarantined"""
+    for credential in gemini_pool.keys:
+        entry = cache.get(CONTEXT_CACHE_NAMESPACE, f"{model}:{credential.id}:{key_hash}")
+        if entry is not None and not credential.quarantined_until > time.time():
+            return entry
+    return None
+
+
+async def _create(client, key_id: str, model: str, system_instruction: str, context: str, key_hash: str) -> Optional[dict]:
+    """Create a provider cache for this context, returning its record"""
+    try:
+        cached_content = await client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name=f"campus-{key_hash[:16]}",
+                system_instruction=system_instruction,
+                contents=[context],
+                ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s"
+            )
+        )
+    except Exception as e:
+        error_str = str(e)
+        if is_quota_error(error_str):
+            raise
+        print(f"⚠️  Context caching unavailable for {model}: {error_str[:200]}")
+        if "400" in error_str or "INVALID_ARGUMENT" in error_str or "not supported" in error_str.lower():
+            _unsupported_models.add(model)
+        return None
+
+    # Cached content belongs to the key's project, so the record is per key.
+    # Forget it a little before the provider expires the cache.
+    entry = {
+        "name": cached_content.name,
+        "model": model,
+        "key_id": key_id,
+        "content_hash": key_hash
+    }
+    cache.set(CONTEXT_CACHE_NAMESPACE, f"{model}:{key_id}:{key_hash}", entry, ttl=max(CONTEXT_CACHE_TTL_SECONDS - 60, 1))
+    print(f"✓ Created context cache {cached_content.name} for {model}")
+    return entry
+
+
+async def _find_or_create(model: str, system_instruction: str, context: str, key_hash: str) -> Optional[dict]:
+    # Another worker may have created it while this one was waiting
+    entry = _find_entry(model, key_hash)
+    if entry is not None:
+        return entry
+    with gemini_pool.lease(is_rate_limit_error) as credential:
+        client = genai.Client(api_key=credential.key)
+        return await _create(client, credential.id, model, system_instruction, context, key_hash)
+
+
+async def _cache_entry(model: str, system_instruction: str, context: str, key_hash: str) -> Optional[dict]:
+    """
+    The live provider cache for this context, created when there is none.
+    Concurrent first questions on the same content share one creation, so
+    no cache is created only to be orphaned and billed until it expires.
+    """
+    entry = _find_entry(model, key_hash)
+    if entry is not None:
+        return entry
+    if model in _unsupported_models or estimate_tokens(system_instruction + context) < CONTEXT_CACHE_MIN_TOKENS:
+        return None
+    return await bounded(
+        shared(_inflight, f"{model}:{key_hash}", lambda: _find_or_create(model, system_instruction, context, key_hash)),
+        "context cache creation"
+    )
+
+
+def _record(endpoint: str, cached: bool, elapsed: float, response):
+    group = f"context_cache:{endpoint}"
+    metrics.incr(group, "requests")
+    metrics.incr(group, "hits" if cached else "misses")
+    metrics.observe_latency(f"{endpoint}:{'cached' if cached else 'uncached'}", elapsed)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        metrics.incr(group, "prompt_tokens", usage.prompt_token_count or 0)
+        metrics.incr(group, "cached_tokens", usage.cached_content_token_count or 0)
+
+
+async def generate_with_context(
+    model: str,
+    endpoint: str,
+    system_instruction: str,
+    context: str,
+    question: str,
+    full_prompt: str
+) -> str:
+    """
+    Answer a question over a large shared context, reusing a provider-side
+    cache of the context when possible and falling back to full_prompt
+    """
+    start = time.monotonic()
+    key_hash = content_hash(system_instruction, context)
+    entry = await _cache_entry(model, system_instruction, context, key_hash) if CONTEXT_CACHE_ENABLED else None
+
+    # Use the key that owns the cache, otherwise the least-loaded key
+    with gemini_pool.lease(is_rate_limit_error, key_id=entry["key_id"] if entry else None) as credential:
+        client = genai.Client(api_key=credential.key)
+        cache_name = entry["name"] if entry else None
+        if cache_name:
+            try:
+                response = await client.aio.models.generate_content(
+                    model=model,
+                    contents=question,
+                    config=types.GenerateContentConfig(cached_content=cache_name)
+                )
+                _record(endpoint, True, time.monotonic() - start, response)
+                usage.record_gemini(model, response, question)
+                return response.text
+            except Exception as e:
+                error_str = str(e)
+                if is_quota_error(error_str):
+                    raise
+                # The provider cache expired or was deleted under us
+                print(f"⚠️  Context cache {cache_name} unusable, sending full prompt: {error_str[:200]}")
+                cache.delete(CONTEXT_CACHE_NAMESPACE, f"{model}:{credential.id}:{key_hash}")
+
+        response = await client.aio.models.generate_content(model=model, contents=full_prompt)
+        _record(endpoint, False, time.monotonic() - start, response)
+        usage.record_gemini(model, response, full_prompt)
+        return response.text
+
+
+async def evict_context_cache(key_hash: str) -> int:
+    """Delete every provider cache created for this content hash; returns how many"""
+    evicted = 0
+    for key in cache.keys(CONTEXT_CACHE_NAMESPACE):
+        if not key.endswith(f":{key_hash}"):
+            continue
+        entry = cache.get(CONTEXT_CACHE_NAMESPACE, key)
+        cache.delete(CONTEXT_CACHE_NAMESPACE, key)
+        if entry is None:
+            continue
+        credential = gemini_pool.get(entry.get("key_id"))
+        if credential is not None:
+            try:
+                await genai.Client(api_key=credential.key).aio.caches.delete(name=entry["name"])
+            except Exception as e:
+                print(f"⚠️  Could not delete context cache {entry['name']}: {str(e)[:200]}")
+        evicted += 1
+    return evicted
+
+
+def list_context_caches() -> list:
+    """Live context cache records"""
+    entries = []
+    for key in cache.keys(CONTEXT_CACHE_NAMESPACE):
+        entry = cache.get(CONTEXT_CACHE_NAMESPACE, key)
+        if entry is not None:
+            entries.append(entry)
+    return entries
+
+
+def context_cache_report() -> dict:
+    """Per-endpoint input-token and latency savings from context caching"""
+    counters = metrics.snapshot()["counters"]
+    report = {}
+    for group, values in counters.items():
+        if not group.startswith("context_cache:"):
+            continue
+        endpoint = group.split(":", 1)[1]
+        cached_p50 = metrics.latency_percentile(f"{endpoint}:cached", 50)
+        uncached_p50 = metrics.latency_percentile(f"{endpoint}:uncached", 50)
+        report[endpoint] = {
+            "requests": int(values.get("requests", 0)),
+            "hits": int(values.get("hits", 0)),
+            "prompt_tokens": int(values.get("prompt_tokens", 0)),
+            "input_tokens_saved": int(values.get("cached_tokens", 0)),
+            "p50_latency_cached": cached_p50,
+            "p50_latency_uncached": uncached_p50,
+            "p50_latency_saved": (uncached_p50 - cached_p50) if cached_p50 is not None and uncached_p50 is not None else None
+        }
+    return report
@@ -0,0 +1,182 @@
+"""
+API key pools with per-key quota tracking.
+
+Each provider can be given several keys (GEMINI_API_KEYS /
+OPENROUTER_API_KEYS, comma-separated, plus the single-key variables).
+Requests go to the key with the most remaining per-minute quota, and a
+key that returns 429 is quarantined for a while, with the quarantine
+growing on consecutive 429s. Throughput therefore scales with the number
+of keys instead of being capped by one key's quota.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+KEY_QUARANTINE_SECONDS = float(os.getenv("KEY_QUARANTINE_SECONDS", 60))
+KEY_QUARANTINE_MAX_SECONDS = float(os.getenv("KEY_QUARANTINE_MAX_SECONDS", 900))
+
+
+def is_quota_error(error_str: str) -> bool:
+    return "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower()
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether a failed call hit the key's quota, so the key should be quarantined"""
+    return is_quota_error(str(getattr(error, "detail", error)))
+
+
+def load_keys(provider: str) -> List[str]:
+    """Read PROVIDER_API_KEYS and PROVIDER_API_KEY, dropping blanks and duplicates"""
+    prefix = provider.upper()
+    raw = os.getenv(f"{prefix}_API_KEYS", "").split(",") + [os.getenv(f"{prefix}_API_KEY", "")]
+    keys = []
+    for key in raw:
+        key = key.strip()
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+class KeyState:
+    def __init__(self, provider: str, key: str):
+        self.key = key
+        # Stable, non-secret identifier for logs, metrics and cache records
+        self.id = f"{provider}-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:8]}"
+        self.recent = deque()
+        self.in_flight = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.consecutive_rate_limits = 0
+        self.quarantined_until = 0.0
+
+    def used_last_minute(self, now: float) -> int:
+        while self.recent and self.recent[0] <= now - 60:
+            self.recent.popleft()
+        return len(self.recent)
+
+
+class CredentialPool:
+    """Least-loaded selection over a provider's keys"""
+
+    def __init__(self, provider: str, keys: List[str], rpm_per_key: int):
+        self.provider = provider
+        self.rpm_per_key = rpm_per_key
+        self.keys = [KeyState(provider, key) for key in keys]
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.keys)
+
+    def get(self, key_id: str) -> Optional[KeyState]:
+        return next((state for state in self.keys if state.id == key_id), None)
+
+    def acquire(self, key_id: Optional[str] = None) -> KeyState:
+        """Reserve the key with the most remaining quota (or a specific key)"""
+        if not self.keys:
+            raise HTTPException(status_code=500, detail=f"{self.provider.capitalize()} API key not configured")
+
+        now = time.time()
+        with self._lock:
+            if key_id is not None:
+                candidates = [state for state in self.keys if state.id == key_id]
+            else:
+                candidates = self.keys
+            available = [state for state in candidates if state.quarantined_until <= now]
+            if not available:
+                retry_after = min(state.quarantined_until for state in candidates) - now if candidates else KEY_QUARANTINE_SECONDS
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"All {self.provider.capitalize()} API keys hit their quota (429); retry in {int(retry_after) + 1}s"
+                )
+            state = max(
+                available,
+                key=lambda s: (self.rpm_per_key - s.used_last_minute(now) - s.in_flight, -s.requests)
+            )
+            state.recent.append(now)
+            state.in_flight += 1
+            state.requests += 1
+            return state
+
+    def release(self, state: KeyState, rate_limited: bool = False):
+        with self._lock:
+            state.in_flight -= 1
+            if rate_limited:
+                state.rate_limited += 1
+                state.consecutive_rate_limits += 1
+                quarantine = min(
+                    KEY_QUARANTINE_SECONDS * 2 ** (state.consecutive_rate_limits - 1),
+                    KEY_QUARANTINE_MAX_SECONDS
+                )
+                state.quarantined_until = time.time() + quarantine
+                print(f"⚠️  {state.id} rate limited, quarantined for {int(quarantine)}s")
+            else:
+                state.consecutive_rate_limits = 0
+
+    @contextmanager
+    def lease(self, is_rate_limit, key_id: Optional[str] = None):
+        """
+        Hold a key for one request. is_rate_limit(exception) decides whether
+        a failure was a 429 and should quarantine the key.
+        """
+        state = self.acquire(key_id)
+        try:
+            yield state
+        except Exception as e:
+            self.release(state, rate_limited=is_rate_limit(e))
+            raise
+        except BaseException:
+            self.release(state)
+            raise
+        else:
+            self.release(state)
+
+    def all_quarantined(self) -> bool:
+        now = time.time()
+        return bool(self.keys) and all(state.quarantined_until > now for state in self.keys)
+
+    def headroom(self) -> float:
+        """Share of the pool's per-minute quota still free (0 when every key is quarantined)"""
+        if not self.keys:
+            return 0.0
+        now = time.time()
+        with self._lock:
+            free = sum(
+                max(self.rpm_per_key - state.used_last_minute(now) - state.in_flight, 0)
+                for state in self.keys if state.quarantined_until <= now
+            )
+        return free / (self.rpm_per_key * len(self.keys))
+
+    def usage(self) -> List[dict]:
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "key_id": state.id,
+                    "requests": state.requests,
+                    "rate_limited": state.rate_limited,
+                    "in_flight": state.in_flight,
+                    "used_last_minute": state.used_last_minute(now),
+                    "remaining_last_minute": max(self.rpm_per_key - state.used_last_minute(now), 0),
+                    "quarantined_for": max(round(state.quarantined_until - now, 1), 0)
+                }
+                for state in self.keys
+            ]
+
+
+# Each worker process tracks usage on its own, so it gets an equal share
+# of every key's per-minute quota
+WORKER_COUNT = max(int(os.getenv("WEB_CONCURRENCY", 1)), 1)
+
+gemini_pool = CredentialPool("gemini", load_keys("gemini"), max(int(os.getenv("GEMINI_KEY_RPM", 15)) // WORKER_COUNT, 1))
+openrouter_pool = CredentialPool("openrouter", load_keys("openrouter"), max(int(os.getenv("OPENROUTER_KEY_RPM", 60)) // WORKER_COUNT, 1))
+
+
+def credential_usage() -> Dict[str, List[dict]]:
+    return {"gemini": gemini_pool.usage(), "openrouter": openrouter_pool.usage()}
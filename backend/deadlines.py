@@ -0,0 +1,242 @@
+"""
+Request deadlines and cancellation.
+
+Every HTTP request gets a deadline: REQUEST_TIMEOUT seconds from arrival,
+or less when the client sends an X-Request-Timeout header (seconds). The
+deadline is kept in a context variable, so code further down (transcript
+fetches, provider calls) can bound its waits with bounded() without
+passing it around.
+
+DeadlineMiddleware runs each request as a task and cancels it when the
+client disconnects or the deadline passes, so abandoned requests stop
+holding provider calls and key quota. Work shared between requests
+(singleflight lookups) runs through shared(): it has no deadline of its
+own, each waiter bounds only its own wait, and it is cancelled once the
+last waiter is gone. Its provider calls run in the highest priority
+class among its current waiters (scheduler.py).
+
+Cancellations and the time they reclaimed (estimated from the route's
+median latency) are counted in the "cancellation" metrics group.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+import metrics
+from scheduler import bind_priority, current_priority, share_priority, update_priority
+
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT", 300))
+# Requests may ask for a shorter deadline, never a longer one
+DEADLINE_HEADER = b"x-request-timeout"
+# Extra time given to the handler after its deadline so its own 504 wins the race
+DEADLINE_GRACE_SECONDS = 0.5
+
+# Absolute deadline (time.monotonic()) of the request being served, if any
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+# HTTP requests this worker is handling right now
+_active_requests = 0
+
+
+def active_requests() -> int:
+    """HTTP requests in progress in this worker; background jobs wait for this to drop"""
+    return _active_requests
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline, None without one"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+async def bounded(awaitable: Awaitable[Any], what: str) -> Any:
+    """Await within the current deadline; raises a 504 when it passes"""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        metrics.incr("cancellation", f"deadline:{what}")
+        raise HTTPException(status_code=504, detail=f"Request deadline exceeded before {what}")
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        metrics.incr("cancellation", f"deadline:{what}")
+        raise HTTPException(status_code=504, detail=f"Request deadline exceeded during {what}")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters", "priority", "classes")
+
+    def __init__(self, classes: list):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # Priority of the work's provider calls: the highest class among the
+        # waiters' (see scheduler.share_priority)
+        self.classes = classes
+        self.priority = share_priority(classes)
+
+
+def _landed(inflight: Dict[str, _Flight], key: str, flight: _Flight):
+    if inflight.get(key) is flight:
+        del inflight[key]
+    if not flight.task.cancelled():
+        # Mark the exception as retrieved when nobody else was waiting
+        flight.task.exception()
+
+
+async def shared(inflight: Dict[str, _Flight], key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run work() once for all concurrent callers with the same key. A caller
+    that is cancelled only stops waiting; the work itself is cancelled
+    when no caller is left.
+    """
+    priority_class = current_priority()
+    flight = inflight.get(key)
+    if flight is None:
+        # Shared work must not inherit the deadline of whichever request
+        # started it, and runs in the highest priority of those waiting for it
+        flight = _Flight([priority_class])
+        context = contextvars.copy_context()
+        context.run(_deadline.set, None)
+        context.run(bind_priority, flight.priority)
+        flight.task = asyncio.get_running_loop().create_task(work(), context=context)
+        flight.task.add_done_callback(lambda task: _landed(inflight, key, flight))
+        inflight[key] = flight
+    else:
+        # A student joining a background job's work raises its priority
+        flight.classes.append(priority_class)
+        update_priority(flight.priority, flight.classes)
+
+    flight.waiters += 1
+    try:
+        return await asyncio.shield(flight.task)
+    finally:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+            metrics.incr("cancellation", "shared_work_cancelled")
+        elif not flight.task.done():
+            # ...and lowers it again when the student stops waiting
+            flight.classes.remove(priority_class)
+            update_priority(flight.priority, flight.classes)
+
+
+def _route(scope: dict) -> str:
+    # The router stores the matched route in the scope; its path template
+    # keeps metric names bounded (/transcript/{video_id:path}, not every ID)
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("path", "")
+
+
+def _request_timeout(scope: dict) -> float:
+    for name, value in scope.get("headers", ()):
+        if name == DEADLINE_HEADER:
+            try:
+                return max(0.0, min(float(value), REQUEST_TIMEOUT_SECONDS))
+            except ValueError:
+                break
+    return REQUEST_TIMEOUT_SECONDS
+
+
+def _has_body(scope: dict) -> bool:
+    if scope.get("method") in ("GET", "HEAD"):
+        return False
+    return any(name in (b"content-length", b"transfer-encoding") for name, _ in scope.get("headers", ()))
+
+
+class DeadlineMiddleware:
+    """ASGI middleware: per-request deadline plus cancellation on disconnect or timeout"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        global _active_requests
+        timeout = _request_timeout(scope)
+        started = time.monotonic()
+        token = _deadline.set(started + timeout)
+        _active_requests += 1
+        body_received = asyncio.Event()
+        if not _has_body(scope):
+            # Nothing for the handler to read: listen for a disconnect right away
+            body_received.set()
+        response = {"status": None, "complete": False}
+
+        async def receive_request():
+            message = await receive()
+            if message["type"] == "http.disconnect" or not message.get("more_body", False):
+                body_received.set()
+            return message
+
+        async def send_response(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response["complete"] = True
+            await send(message)
+
+        async def watch_disconnect():
+            # Only listen once the handler has read the body, so no request data is taken from it
+            await body_received.wait()
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+
+        handler = asyncio.ensure_future(self.app(scope, receive_request, send_response))
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            done, _ = await asyncio.wait(
+                {handler, watcher},
+                timeout=timeout + DEADLINE_GRACE_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if handler in done or (watcher in done and response["complete"]):
+                # A disconnect after the response was sent is not a cancellation
+                await handler
+                if response["status"] is not None and response["status"] < 400:
+                    metrics.observe_latency(f"http:{_route(scope)}", time.monotonic() - started)
+                return
+
+            reason = "client_disconnect" if watcher in done else "deadline"
+            handler.cancel()
+            try:
+                await handler
+            except asyncio.CancelledError:
+                pass
+            elapsed = time.monotonic() - started
+            route = _route(scope)
+            metrics.incr("cancellation", reason)
+            metrics.incr("cancellation", f"{reason}:{route}")
+            # Estimated from how long this route usually takes; until that is
+            # known, the work could have run until its deadline
+            typical = metrics.latency_percentile(f"http:{route}", 50)
+            expected = min(typical, timeout) if typical is not None else timeout
+            metrics.incr("cancellation", "reclaimed_seconds", max(0.0, expected - elapsed))
+            metrics.observe_latency(f"cancelled:{reason}", elapsed)
+            print(f"🛑 Cancelled {scope.get('method')} {scope.get('path')} after {elapsed:.1f}s ({reason.replace('_', ' ')})")
+
+            if reason == "deadline" and response["status"] is None:
+                await send({
+                    "type": "http.response.start",
+                    "status": 504,
+                    "headers": [(b"content-type", b"application/json")]
+                })
+                await send({"type": "http.response.body", "body": b'{"detail":"Request deadline exceeded"}'})
+        finally:
+            watcher.cancel()
+            if not handler.done():
+                handler.cancel()
+            _deadline.reset(token)
+            _active_requests -= 1
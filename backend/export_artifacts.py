@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Export static chapter, summary and quiz artifacts for lecture videos.
+
+Generates each video's chapters, summary and quiz with one combined
+call (like /lecture-bundle) and writes them to ARTIFACTS_DIR as
+content-hashed JSON plus a gzipped copy (see artifacts.py). After that,
+/analyze, /generate-quiz and /lecture-bundle answer those videos
+without calling a provider, and the directory can be served as-is by a
+static file server or CDN.
+
+Videos whose artifact was generated from their current transcript are
+skipped, unless --force is given.
+
+Usage:
+    python export_artifacts.py https://youtu.be/VIDEO_ID ... --concurrency 2
+    python export_artifacts.py --file videos.txt     # one URL or ID per line
+    python export_artifacts.py --cached              # every cached transcript
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import artifacts
+from main import export_artifact, extract_video_id, load_transcript
+from metadata import get_video_metadata
+from transcripts import cached_transcripts
+
+
+def video_ids(args) -> list:
+    values = list(args.videos)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            values += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if args.cached:
+        values += [transcript["video_id"] for transcript in cached_transcripts()]
+
+    ids = []
+    for value in values:
+        try:
+            video_id = extract_video_id(value)
+        except ValueError:
+            video_id = value
+        if video_id not in ids:
+            ids.append(video_id)
+    return ids
+
+
+async def export(ids: list, provider: str, concurrency: int, force: bool) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"current": 0, "exported": 0, "failed": 0, "bytes": 0, "gzip_bytes": 0}
+
+    async def run(index: int, video_id: str):
+        label = f"[{index + 1}/{len(ids)}] {video_id}"
+        async with semaphore:
+            try:
+                transcript = await load_transcript(video_id)
+                loaded = artifacts.load_artifact(video_id)
+                if not force and loaded is not None and loaded[1]["transcript_hash"] == transcript["content_hash"]:
+                    counts["current"] += 1
+                    return
+                title = (await get_video_metadata(video_id)).get("title") or ""
+                artifact_hash = await export_artifact(transcript, title, provider)
+                path = os.path.join(artifacts.video_dir(video_id), f"{artifact_hash}.json")
+                counts["exported"] += 1
+                counts["bytes"] += os.path.getsize(path)
+                counts["gzip_bytes"] += os.path.getsize(f"{path}.gz")
+                print(f"✓ {label} -> {os.path.relpath(path, artifacts.ARTIFACTS_DIR)}")
+            except Exception as e:
+                counts["failed"] += 1
+                detail = getattr(e, "detail", None) or str(e)
+                print(f"❌ {label}: {str(detail)[:200]}")
+
+    await asyncio.gather(*(run(i, video_id) for i, video_id in enumerate(ids)))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export static chapter, summary and quiz artifacts")
+    parser.add_argument("videos", nargs="*", help="YouTube URLs or video IDs")
+    parser.add_argument("--file", help="File with one URL or video ID per line")
+    parser.add_argument("--cached", action="store_true", help="Export every video with a cached transcript")
+    parser.add_argument("--provider", default="gemini", choices=["gemini", "openrouter"])
+    parser.add_argument("--concurrency", type=int, default=2, help="Maximum videos generated in parallel")
+    parser.add_argument("--force", action="store_true", help="Re-export even when the artifact is current")
+    args = parser.parse_args()
+
+    ids = video_ids(args)
+    if not ids:
+        parser.error("no videos given (pass URLs, --file or --cached)")
+    print(f"📦 Exporting artifacts for {len(ids)} videos to {artifacts.ARTIFACTS_DIR}")
+    start = time.monotonic()
+    counts = asyncio.run(export(ids, args.provider, args.concurrency, args.force))
+    print(f"Done in {time.monotonic() - start:.1f}s: {counts}")
+
+
+if __name__ == "__main__":
+    main()
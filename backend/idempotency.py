@@ -0,0 +1,243 @@
+"""
+Idempotency keys for the AI POST endpoints.
+
+Mobile clients on flaky Wi-Fi retry /analyze, /generate-quiz and
+/ai-question after a timeout, and every retry used to start a new paid
+LLM call even though the first one finished on the server. A request
+with an Idempotency-Key header (any string of up to 255 characters that
+the client reuses for retries of the same action) is handled once:
+
+- its work runs detached from the request that started it, so it keeps
+  going when that client times out or disconnects (still within the
+  original request's deadline)
+- a retry that arrives while the work is running attaches to it, in
+  this worker directly, in another worker through the claim stored in
+  the persistent cache
+- work nobody waits for is cancelled after IDEMPOTENCY_GRACE seconds
+  without a retry, so a student who left the screen does not keep a
+  paid LLM call running (deadlines.py)
+- a completed 2xx response (status, headers and body) is stored for
+  IDEMPOTENCY_TTL seconds and replayed byte for byte, with an
+  Idempotent-Replayed: true header
+
+Reusing a key with a different request body is rejected with 422. Other
+responses are not stored, so a retry after an error runs again.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+from typing import Iterable, List, Optional, Tuple
+
+import metrics
+from cache import cache
+from deadlines import REQUEST_TIMEOUT_SECONDS
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = (b"idempotent-replayed", b"true")
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+# Larger responses are still returned to every waiter, just not stored for replay
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", 8 * 1024 * 1024))
+# A claim outlives the longest the claimed work can run, in case its worker dies
+CLAIM_TTL_SECONDS = REQUEST_TIMEOUT_SECONDS + 30
+# How long work keeps running without a waiter, for the client's retry to attach
+IDEMPOTENCY_GRACE_SECONDS = float(os.getenv("IDEMPOTENCY_GRACE", 5))
+# How often a retry checks on work running in another worker
+POLL_SECONDS = 0.25
+NAMESPACE = "idempotency"
+
+# (status, headers, body)
+Result = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+
+
+def _header(scope: dict, name: bytes) -> Optional[str]:
+    for header, value in scope.get("headers", ()):
+        if header == name:
+            return value.decode("latin-1").strip()
+    return None
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    """The whole request body, or None if the client disconnected while sending it"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+def _encode(fingerprint: str, result: Result) -> dict:
+    status, headers, body = result
+    return {
+        "state": "done",
+        "fingerprint": fingerprint,
+        "status": status,
+        "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in headers],
+        "body": base64.b64encode(body).decode("ascii")
+    }
+
+
+def _decode(entry: dict) -> Result:
+    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in entry["headers"]]
+    return entry["status"], headers, base64.b64decode(entry["body"])
+
+
+async def _send_json(send, status: int, body: bytes):
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class _Flight:
+    __slots__ = ("task", "fingerprint", "waiters", "abandon")
+
+    def __init__(self, task: asyncio.Task, fingerprint: str):
+        self.task = task
+        self.fingerprint = fingerprint
+        self.waiters = 0
+        # Cancels the work when no retry attaches within the grace period
+        self.abandon: Optional[asyncio.TimerHandle] = None
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware: run POST requests with an Idempotency-Key once and replay their response"""
+
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = frozenset(paths)
+        self._inflight: dict = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        idempotency_key = _header(scope, IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            await _send_json(send, 400, b'{"detail":"Idempotency-Key must be 1 to 255 characters"}')
+            return
+
+        body = await _read_body(receive)
+        if body is None:
+            return
+        key = hashlib.sha256(f"{scope['path']}\n{idempotency_key}".encode("utf-8")).hexdigest()
+        fingerprint = hashlib.sha256(scope.get("query_string", b"") + b"\n" + body).hexdigest()
+
+        outcome, result = await self._resolve(scope, key, fingerprint, body)
+        if result is None:
+            metrics.incr("idempotency", "mismatched")
+            await _send_json(send, 422, b'{"detail":"Idempotency-Key was already used for a different request"}')
+            return
+        status, headers, response_body = result
+        if outcome != "executed":
+            headers = headers + [REPLAYED_HEADER]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": response_body})
+
+    async def _resolve(self, scope: dict, key: str, fingerprint: str, body: bytes) -> Tuple[str, Optional[Result]]:
+        """Attach to, replay or run the keyed work; (outcome, None) when the key belongs to another request"""
+        waiting_on_other_worker = False
+        while True:
+            flight = self._inflight.get(key)
+            if flight is not None:
+                if flight.fingerprint != fingerprint:
+                    return "mismatched", None
+                metrics.incr("idempotency", "attached")
+                return "attached", await self._wait(flight)
+
+            entry = cache.get(NAMESPACE, key)
+            if entry is not None:
+                if entry["fingerprint"] != fingerprint:
+                    return "mismatched", None
+                if entry["state"] == "done":
+                    metrics.incr("idempotency", "replayed")
+                    return "replayed", _decode(entry)
+                # Running in another worker: wait until it is stored, or its claim
+                # is released or expires (then this request runs it)
+                if not waiting_on_other_worker:
+                    metrics.incr("idempotency", "attached_other_worker")
+                    waiting_on_other_worker = True
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+
+            if cache.add(NAMESPACE, key, {"state": "running", "fingerprint": fingerprint}, ttl=CLAIM_TTL_SECONDS):
+                metrics.incr("idempotency", "executed")
+                return "executed", await self._wait(self._start(scope, key, fingerprint, body))
+
+    async def _wait(self, flight: _Flight) -> Result:
+        """Wait for the keyed work; the last waiter to leave starts its grace period"""
+        if flight.abandon is not None:
+            flight.abandon.cancel()
+            flight.abandon = None
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.abandon = asyncio.get_running_loop().call_later(
+                    IDEMPOTENCY_GRACE_SECONDS, self._abandon, flight
+                )
+
+    def _abandon(self, flight: _Flight):
+        flight.abandon = None
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+            metrics.incr("idempotency", "abandoned")
+            metrics.incr("cancellation", "idempotent_work_cancelled")
+
+    def _start(self, scope: dict, key: str, fingerprint: str, body: bytes) -> _Flight:
+        # The task keeps the deadline of the request that started it (copied context),
+        # but not its cancellation: the client may already be retrying. It is
+        # cancelled once nobody has waited for it for the grace period (_wait)
+        flight = _Flight(asyncio.get_running_loop().create_task(self._run(scope, key, fingerprint, body)), fingerprint)
+        self._inflight[key] = flight
+        flight.task.add_done_callback(lambda task: self._landed(key, flight))
+        return flight
+
+    def _landed(self, key: str, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if flight.abandon is not None:
+            flight.abandon.cancel()
+        if not flight.task.cancelled():
+            # Mark the exception as retrieved when every waiter is gone
+            flight.task.exception()
+
+    async def _run(self, scope: dict, key: str, fingerprint: str, body: bytes) -> Result:
+        response = {"status": 500, "headers": [], "body": []}
+        body_sent = False
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # Detached from any client, so there is never a disconnect to report
+            await asyncio.get_running_loop().create_future()
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        except BaseException:
+            cache.delete(NAMESPACE, key)
+            raise
+
+        result = (response["status"], response["headers"], b"".join(response["body"]))
+        if 200 <= result[0] < 300 and len(result[2]) <= IDEMPOTENCY_MAX_BODY_BYTES:
+            cache.set(NAMESPACE, key, _encode(fingerprint, result), ttl=IDEMPOTENCY_TTL_SECONDS)
+            metrics.incr("idempotency", "stored")
+        else:
+            cache.delete(NAMESPACE, key)
+        return result
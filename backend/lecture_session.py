@@ -0,0 +1,201 @@
+"""
+WebSocket session for one lecture.
+
+The client opens /ws/lecture, sends an "open" message naming the video,
+and the transcript is loaded once into the session. After that it can
+send any number of requests over the same connection:
+
+    {"id": "1", "type": "chapters"}
+    {"id": "2", "type": "quiz"}
+    {"id": "3", "type": "question", "question": "What is recursion?"}
+    {"id": "4", "type": "cancel", "target": "2"}
+
+Requests run concurrently and every reply carries the request's id:
+"accepted" when work starts, then "result" or "error". Results are sent
+as soon as each finishes, not in request order. Chapters and quizzes are
+computed once per session and replayed for repeated requests.
+
+Backpressure: at most SESSION_MAX_IN_FLIGHT requests run at a time, and
+no further messages are read from the socket until one finishes, so a
+client that sends faster than it is served is slowed down by TCP flow
+control. A request keeps its slot until its reply has been written, so
+a slow reader also holds back new work. The session is closed after
+SESSION_IDLE_TIMEOUT seconds without messages or running requests.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+
+import metrics
+
+SESSION_IDLE_TIMEOUT_SECONDS = float(os.getenv("SESSION_IDLE_TIMEOUT", 300))
+SESSION_MAX_IN_FLIGHT = int(os.getenv("SESSION_MAX_IN_FLIGHT", 4))
+# Request types whose result does not depend on the message and can be replayed
+MEMOIZED_TYPES = {"chapters", "quiz", "transcript"}
+
+# WebSocket close codes (4000-4999 are free for applications)
+CLOSE_IDLE = 4000
+CLOSE_BAD_OPEN = 4400
+CLOSE_NO_TRANSCRIPT = 4404
+
+Handler = Callable[["LectureSession", dict], Awaitable[Any]]
+
+
+class LectureSession:
+    """State and message loop for one connected lecture screen"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        open_session: Handler,
+        handlers: Dict[str, Handler]
+    ):
+        self.websocket = websocket
+        self.open_session = open_session
+        self.handlers = handlers
+        # Filled in from the "open" message
+        self.video_id: Optional[str] = None
+        self.video_title = ""
+        self.provider = "gemini"
+        self.transcript: Optional[dict] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._memo: Dict[str, asyncio.Future] = {}
+        self._slots = asyncio.Semaphore(SESSION_MAX_IN_FLIGHT)
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: dict):
+        # One writer at a time; awaiting the write is what pushes back on
+        # handlers when the client reads slowly
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    async def _receive(self, timeout: float) -> dict:
+        message = await asyncio.wait_for(self.websocket.receive_json(), timeout)
+        if not isinstance(message, dict):
+            raise ValueError("Messages must be JSON objects")
+        return message
+
+    async def run(self):
+        await self.websocket.accept()
+        metrics.incr("lecture_session", "opened")
+        try:
+            if not await self._open():
+                return
+            await self._loop()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in list(self._tasks.values()) + list(self._memo.values()):
+                task.cancel()
+            metrics.incr("lecture_session", "closed")
+
+    async def _open(self) -> bool:
+        try:
+            message = await self._receive(SESSION_IDLE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            await self.websocket.close(code=CLOSE_IDLE, reason="Idle timeout")
+            return False
+        except ValueError:
+            message = {}
+        if message.get("type") != "open" or not message.get("video_url"):
+            await self.send({"type": "error", "status": 400, "detail": "First message must be {\"type\": \"open\", \"video_url\": ...}"})
+            await self.websocket.close(code=CLOSE_BAD_OPEN)
+            return False
+
+        self.video_title = message.get("video_title") or ""
+        self.provider = message.get("api_provider") or "gemini"
+        try:
+            ready = await self.open_session(self, message)
+        except HTTPException as e:
+            await self.send({"type": "error", "status": e.status_code, "detail": e.detail})
+            await self.websocket.close(code=CLOSE_NO_TRANSCRIPT if e.status_code == 404 else CLOSE_BAD_OPEN)
+            return False
+        await self.send(dict(ready, type="ready"))
+        return True
+
+    async def _loop(self):
+        while True:
+            # Backpressure: wait for a free slot before reading the next request
+            await self._slots.acquire()
+            try:
+                message = await self._receive(SESSION_IDLE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                self._slots.release()
+                if self._tasks:
+                    continue
+                metrics.incr("lecture_session", "idle_closed")
+                await self.websocket.close(code=CLOSE_IDLE, reason="Idle timeout")
+                return
+            except ValueError:
+                self._slots.release()
+                await self.send({"type": "error", "status": 400, "detail": "Messages must be JSON objects"})
+                continue
+            except BaseException:
+                self._slots.release()
+                raise
+
+            if not self._dispatch(message):
+                self._slots.release()
+
+    def _dispatch(self, message: dict) -> bool:
+        """Start a request; returns True when it took the slot"""
+        request_id = str(message.get("id", ""))
+        kind = message.get("type")
+
+        if kind == "ping":
+            asyncio.ensure_future(self.send({"id": request_id, "type": "pong"}))
+            return False
+        if kind == "cancel":
+            task = self._tasks.get(str(message.get("target", "")))
+            if task is not None:
+                task.cancel()
+            return False
+        if kind not in self.handlers:
+            asyncio.ensure_future(self.send({
+                "id": request_id, "type": "error", "status": 400, "detail": f"Unknown request type: {kind}"
+            }))
+            return False
+        if not request_id or request_id in self._tasks:
+            asyncio.ensure_future(self.send({
+                "id": request_id, "type": "error", "status": 400, "detail": "Each request needs a unique id"
+            }))
+            return False
+
+        metrics.incr("lecture_session", f"{kind}_requests")
+        self._tasks[request_id] = asyncio.ensure_future(self._serve(request_id, kind, message))
+        return True
+
+    async def _result(self, kind: str, message: dict) -> Any:
+        if kind not in MEMOIZED_TYPES:
+            return await self.handlers[kind](self, message)
+        pending = self._memo.get(kind)
+        if pending is None or (pending.done() and (pending.cancelled() or pending.exception() is not None)):
+            pending = self._memo[kind] = asyncio.ensure_future(self.handlers[kind](self, message))
+        else:
+            metrics.incr("lecture_session", f"{kind}_replayed")
+        return await asyncio.shield(pending)
+
+    async def _serve(self, request_id: str, kind: str, message: dict):
+        started = time.perf_counter()
+        try:
+            await self.send({"id": request_id, "type": "accepted", "kind": kind})
+            try:
+                result = await self._result(kind, message)
+                reply = {"id": request_id, "type": "result", "kind": kind, "data": result}
+            except asyncio.CancelledError:
+                reply = {"id": request_id, "type": "cancelled", "kind": kind}
+            except HTTPException as e:
+                reply = {"id": request_id, "type": "error", "kind": kind, "status": e.status_code, "detail": e.detail}
+            except Exception as e:
+                reply = {"id": request_id, "type": "error", "kind": kind, "status": 500, "detail": str(e)}
+            metrics.observe_latency(f"ws:{kind}", time.perf_counter() - started)
+            await self.send(reply)
+        except (WebSocketDisconnect, RuntimeError):
+            # The client went away while we were answering
+            pass
+        finally:
+            self._tasks.pop(request_id, None)
+            self._slots.release()
@@ -1,26 +1,65 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, HttpUrl
-from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
 import os
 from dotenv import load_dotenv
-import httpx
 from typing import List, Optional
 import re
-import google.genai as genai
-from google.genai import types
 import json
-import yt_dlp
+import time
+import asyncio
 # Load environment variables
 load_dotenv()
 
+# Local modules read their settings from the environment at import time
+from transcripts import fetch_transcript, cached_transcripts, transcript_duration
+import search_index
+from summaries import worth_summarizing, get_sections, format_outline, relevant_windows
+from offline_chapters import FALLBACK_STATUS_CODES, OFFLINE_CHAPTERS_FALLBACK, extract_chapters
+from quiz import generate_quiz_questions, merge_questions, QUIZ_QUESTIONS
+from metadata import get_video_metadata, get_video_metadata_batch
+from pdf_notes import get_pdf_context
+from context_cache import generate_with_context, evict_context_cache, list_context_caches, context_cache_report, estimate_tokens
+import metrics
+from credentials import credential_usage
+import usage
+import artifacts
+from refresh import REFRESH_INTERVAL_SECONDS, refresh_loop, refresh_report
+from prefetch import Prefetcher
+from response_cache import response_key, solution_cache
+from providers import generate, GEMINI_DEFAULT_MODEL, OPENROUTER_DEFAULT_MODEL
+from model_policy import select_model, policy_report
+from lecture_session import LectureSession
+from deadlines import DeadlineMiddleware
+from scheduler import PriorityMiddleware, scheduler_report
+from idempotency import IdempotencyMiddleware
+from streaming import join_lines, leading_text, json_response, segment_items
+from attendance import attendance_store, check_in_batcher, class_summary, session_summary, student_summary
+
 app = FastAPI(
     title="YouTube Transcript & Chapter Generator API",
     description="API to fetch YouTube transcripts and generate chapters using AI",
     version="1.0.0"
 )
 
+# Requests may lower the priority of their provider calls with X-Priority (see scheduler.py)
+app.add_middleware(PriorityMiddleware)
+
+# Retries of AI requests that send an Idempotency-Key attach to or replay the
+# first attempt (inside DeadlineMiddleware: the keyed work keeps the first
+# attempt's deadline, and outlives a disconnect only for IDEMPOTENCY_GRACE
+# seconds, waiting for a retry)
+app.add_middleware(
+    IdempotencyMiddleware,
+    paths=("/analyze", "/generate-quiz", "/ai-question", "/lecture-bundle")
+)
+
+# Per-request deadline and cancellation on client disconnect (inside CORS,
+# so its 504s still carry CORS headers)
+app.add_middleware(DeadlineMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -33,7 +72,7 @@ app.add_middleware(
 # Models
 class VideoRequest(BaseModel):
     video_url: str
-    model: Optional[str] = "anthropic/claude-3-haiku"
+    model: Optional[str] = None  # pin a model; by default one is picked per request (see model_policy.py)
     languages: Optional[List[str]] = None  # e.g., ['hi', 'en', 'es']
     api_provider: Optional[str] = "openrouter"  # 'openrouter' or 'gemini'
 
@@ -63,6 +102,11 @@ class VideoResponse(BaseModel):
     transcript: List[TranscriptSegment]
     chapters: List[Chapter]
     summary: str
+    source: Optional[str] = None  # 'artifact', 'ai' or 'offline' (see offline_chapters.py)
+
+# Routes that stream their body (json_response) skip FastAPI's response
+# validation, so the schema is only documented, not declared as response_model
+STREAMED_VIDEO_RESPONSE = {200: {"model": VideoResponse, "description": "Streamed JSON body"}}
 
 # Helper functions
 def extract_video_id(url: str) -> str:
@@ -91,27 +135,48 @@ def format_timestamp(seconds: float) -> str:
         return f"{hours:02d}:{minutes:02d}:{secs:02d}"
     return f"{minutes:02d}:{secs:02d}"
 
-async def call_openrouter(transcript_text: str, model: str, video_duration: str = None, video_duration_seconds: float = None) -> dict:
-    """Call OpenRouter API to generate chapters and summary"""
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="OpenRouter API key not configured")
-    
+def format_video_info(metadata: dict) -> dict:
+    """Shape a metadata lookup into the /video-info response"""
+    if metadata.get("error"):
+        # Fallback to 0:00 if the lookup failed
+        return {
+            "video_id": metadata["video_id"],
+            "duration": "0:00",
+            "duration_seconds": 0
+        }
+    duration_seconds = metadata.get("duration_seconds", 0)
+    return {
+        "video_id": metadata["video_id"],
+        "duration": format_timestamp(duration_seconds),
+        "duration_seconds": duration_seconds,
+        "source": metadata.get("source")
+    }
+
+def build_chapter_prompt(transcript_text: str, video_duration: str = None, video_duration_seconds: float = None, outline: bool = False) -> str:
+    """
+    Build the prompt that asks for chapters and an overall summary.
+    With outline=True, transcript_text is a section outline (see summaries.py) instead of the raw transcript.
+    """
     duration_info = f"\nVideo Duration: {video_duration} (max {int(video_duration_seconds)} seconds)" if video_duration else ""
+    source = "outline" if outline else "transcript"
+    description = (
+        "outline of the video (a summary of each section followed by the topics it covers)"
+        if outline else "video transcript"
+    )
     
-    prompt = f"""You are a helpful assistant that analyzes YouTube video transcripts and creates structured chapters with summaries.
+    return f"""You are a helpful assistant that analyzes YouTube video transcripts and creates structured chapters with summaries.
 {duration_info}
 
-Given the following video transcript with timestamps in [MM:SS] or [HH:MM:SS] format, please:
+Given the following {description} with timestamps in [MM:SS] or [HH:MM:SS] format, please:
 1. Identify major topic changes and create 5-8 chapters
-2. For each chapter, YOU MUST extract the EXACT timestamp_seconds from the [HH:MM:SS] or [MM:SS] markers in the transcript
+2. For each chapter, YOU MUST extract the EXACT timestamp_seconds from the [HH:MM:SS] or [MM:SS] markers in the {source}
 3. Parse the timestamps like this: [00:45] = 45 seconds, [02:30] = 150 seconds, [01:15:20] = 4520 seconds
 4. CRITICAL: All timestamp_seconds MUST be between 0 and {int(video_duration_seconds)} (the video duration)
-5. Use timestamps that actually appear in the transcript - do NOT make up timestamps
+5. Use timestamps that actually appear in the {source} - do NOT make up timestamps
 6. Provide a descriptive title and brief summary (2-3 sentences) for each chapter
 7. Create an overall video summary (3-4 sentences)
 
-Transcript:
+{source.capitalize()}:
 {transcript_text}
 
 Please respond in the following JSON format:
@@ -126,88 +191,33 @@ Please respond in the following JSON format:
     "overall_summary": "Overall video summary"
 }}"""
 
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        try:
-            print(f"🔄 Calling OpenRouter API with model: {model}")
-            response = await client.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "HTTP-Referer": "http://localhost:8000",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": model,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "response_format": {"type": "json_object"}
-                }
-            )
-            
-            # Check response status
-            if not response.is_success:
-                error_text = response.text
-                print(f"❌ OpenRouter API error: {response.status_code} - {error_text}")
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"OpenRouter API error: {response.status_code} - {error_text[:200]}"
-                )
-            
-            result = response.json()
-            
-            # Check for error in response
-            if "error" in result:
-                error_msg = result["error"].get("message", str(result["error"]))
-                print(f"❌ OpenRouter returned error: {error_msg}")
-                raise HTTPException(status_code=500, detail=f"OpenRouter error: {error_msg}")
-            
-            # Parse the AI response
-            ai_content = result["choices"][0]["message"]["content"]
-            parsed_content = json.loads(ai_content)
-            
-            print(f"✓ OpenRouter API call successful")
-            return parsed_content
-            
-        except httpx.HTTPError as e:
-            print(f"❌ HTTP error calling OpenRouter: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"OpenRouter API error: {str(e)}")
-        except (KeyError, json.JSONDecodeError) as e:
-            print(f"❌ Failed to parse OpenRouter response: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to parse AI response: {str(e)}")
-        except httpx.HTTPError as e:
-            raise HTTPException(status_code=500, detail=f"OpenRouter API error: {str(e)}")
-        except (KeyError, json.JSONDecodeError) as e:
-            raise HTTPException(status_code=500, detail=f"Failed to parse AI response: {str(e)}")
-
-async def call_gemini(transcript_text: str, model: str = "gemini-3-flash-preview", video_duration: str = None, video_duration_seconds: float = None) -> dict:
-    """Call Google Gemini API to generate chapters and summary"""
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="Gemini API key not configured")
-    
-    try:
-        # Create Gemini client
-        client = genai.Client(api_key=api_key)
-        
-        duration_info = f"\nVideo Duration: {video_duration} (max {int(video_duration_seconds)} seconds)" if video_duration else ""
-        
-        prompt = f"""You are a helpful assistant that analyzes YouTube video transcripts and creates structured chapters with summaries.
-{duration_info}
+def build_bundle_prompt(transcript_text: str, video_title: str, video_duration: str, video_duration_seconds: float, outline: bool = False, quiz_questions: int = QUIZ_QUESTIONS) -> str:
+    """
+    One prompt asking for chapters, the overall summary and a quiz together,
+    so the transcript (or section outline) is sent once instead of per endpoint
+    """
+    source = "outline" if outline else "transcript"
+    description = (
+        "outline of the video (a summary of each section, the topics it covers and its key points)"
+        if outline else "video transcript"
+    )
+
+    return f"""You are a helpful assistant that turns lecture videos into study material.
 
-Given the following video transcript with timestamps in [MM:SS] or [HH:MM:SS] format, please:
+Video Title: {video_title}
+Video Duration: {video_duration} (max {int(video_duration_seconds)} seconds)
+
+Given the following {description} with timestamps in [MM:SS] or [HH:MM:SS] format, please:
 1. Identify major topic changes and create 5-8 chapters
-2. For each chapter, YOU MUST extract the EXACT timestamp_seconds from the [HH:MM:SS] or [MM:SS] markers in the transcript
+2. For each chapter, YOU MUST extract the EXACT timestamp_seconds from the [HH:MM:SS] or [MM:SS] markers in the {source}
 3. Parse the timestamps like this: [00:45] = 45 seconds, [02:30] = 150 seconds, [01:15:20] = 4520 seconds
 4. CRITICAL: All timestamp_seconds MUST be between 0 and {int(video_duration_seconds)} (the video duration)
-5. Use timestamps that actually appear in the transcript - do NOT make up timestamps
+5. Use timestamps that actually appear in the {source} - do NOT make up timestamps
 6. Provide a descriptive title and brief summary (2-3 sentences) for each chapter
 7. Create an overall video summary (3-4 sentences)
+8. Create a quiz with {quiz_questions} multiple-choice questions that test understanding of KEY CONCEPTS actually discussed, spread across the whole video, each with 4 options (A, B, C, D) where only one is correct
 
-Transcript:
+{source.capitalize()}:
 {transcript_text}
 
 Please respond in the following JSON format:
@@ -219,24 +229,127 @@ Please respond in the following JSON format:
             "summary": "Brief summary of this chapter"
         }}
     ],
-    "overall_summary": "Overall video summary"
+    "overall_summary": "Overall video summary",
+    "quiz": [
+        {{
+            "question": "What is...",
+            "options": ["A) First option", "B) Second option", "C) Third option", "D) Fourth option"],
+            "correct": "A"
+        }}
+    ]
 }}"""
-        
-        # Generate content with proper model name
-        response = client.models.generate_content(
-            model=model,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json"
-            )
-        )
-        
-        # Parse response
-        parsed_content = json.loads(response.text)
-        return parsed_content
-        
+
+def parse_ai_json(ai_text: str):
+    """Parse a JSON response from the AI provider"""
+    try:
+        return json.loads(ai_text)
+    except (TypeError, json.JSONDecodeError) as e:
+        print(f"❌ Failed to parse AI response: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to parse AI response: {str(e)}")
+
+def requested_languages(languages: Optional[List[str]]) -> Optional[List[str]]:
+    """Requested languages without blanks and placeholder values like 'string' (Swagger UI's default); None when none are left"""
+    if not languages:
+        return None
+    return [
+        lang.strip() for lang in languages
+        if lang and lang.strip() and lang.strip().lower() not in ['string', 'none', 'null']
+    ] or None
+
+async def load_transcript(video_id: str, languages: Optional[List[str]] = None) -> dict:
+    """Fetch the best transcript for a video, mapping missing captions to 404s"""
+    try:
+        return await fetch_transcript(video_id, languages)
+    except TranscriptsDisabled:
+        print(f"❌ Transcripts disabled for video {video_id}")
+        raise HTTPException(status_code=404, detail="Transcripts are disabled for this video")
+    except NoTranscriptFound:
+        print(f"❌ No transcript found for video {video_id}")
+        raise HTTPException(status_code=404, detail="No transcript found for this video")
+
+async def load_sections(transcript: dict, video_title: str, provider: str):
+    """
+    Section summaries for long transcripts, or None when the raw transcript
+    should be used (short video, or summarizing failed)
+    """
+    if not worth_summarizing(transcript):
+        return None
+    try:
+        return await get_sections(transcript, video_title, provider)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Gemini API error: {str(e)}")
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        print(f"⚠️  Section summaries unavailable for {transcript['video_id']}, using raw transcript: {str(detail)[:200]}")
+        metrics.incr("segment_summaries", "failed")
+        return None
+
+def timestamped_text(segments: List[dict]) -> str:
+    """Transcript as one "[MM:SS] text" line per segment"""
+    return join_lines(f"[{format_timestamp(segment['start'])}] {segment['text']}" for segment in segments)
+
+def format_chapters(ai_response: dict) -> List[Chapter]:
+    return [
+        Chapter(
+            timestamp=format_timestamp(ch["timestamp_seconds"]),
+            title=ch["title"],
+            summary=ch["summary"]
+        )
+        for ch in ai_response.get("chapters", [])
+    ]
+
+async def generate_chapters(transcript: dict, provider: str = "gemini", model: Optional[str] = None):
+    """Return (chapters, overall_summary) for a transcript"""
+    segments = transcript["segments"]
+    
+    # Format transcript for AI
+    transcript_text = timestamped_text(segments)
+    
+    # Get video duration from last timestamp
+    video_duration_seconds = segments[-1]["start"] if segments else 0
+    video_duration_formatted = format_timestamp(video_duration_seconds)
+    
+    # Long videos are chaptered from their cached section summaries
+    sections = await load_sections(transcript, "", provider)
+    if sections:
+        transcript_text = format_outline(sections, key_points=False, topics=True)
+    
+    # Get AI analysis with automatic fallback
+    ai_text, used_provider = await generate(
+        build_chapter_prompt(transcript_text, video_duration_formatted, video_duration_seconds, outline=bool(sections)),
+        provider=provider,
+        endpoint="/analyze",
+        json_mode=True,
+        gemini_model=model if provider == "gemini" else None,
+        openrouter_model=model if provider != "gemini" else None,
+        openrouter_timeout=120.0
+    )
+    ai_response = parse_ai_json(ai_text)
+    
+    # Format chapters
+    chapters = format_chapters(ai_response)
+    
+    # Log which provider was used
+    print(f"✓ Chapters generated successfully using: {used_provider}")
+    return chapters, ai_response.get("overall_summary", "")
+
+def offline_chapters(transcript: dict):
+    """Return (chapters, overall_summary) extracted from the transcript without a provider call"""
+    started = time.perf_counter()
+    result = extract_chapters(transcript["segments"])
+    metrics.observe_latency("offline_chapters", time.perf_counter() - started)
+    return format_chapters(result), result["overall_summary"]
+
+async def chapters_or_offline(transcript: dict, provider: str = "gemini", model: Optional[str] = None):
+    """Return (chapters, overall_summary, source): AI chapters, or offline ones when no provider will answer"""
+    try:
+        chapters, summary = await generate_chapters(transcript, provider, model)
+        return chapters, summary, "ai"
+    except HTTPException as e:
+        if not OFFLINE_CHAPTERS_FALLBACK or e.status_code not in FALLBACK_STATUS_CODES:
+            raise
+        print(f"⚠️  AI chapters unavailable for {transcript['video_id']}, using offline chapters: {str(e.detail)[:200]}")
+        metrics.incr("offline_chapters", "fallback")
+        chapters, summary = offline_chapters(transcript)
+        return chapters, summary, "offline"
 
 # Routes
 @app.get("/")
@@ -245,11 +358,12 @@ async def root():
         "message": "YouTube Transcript & Chapter Generator API",
         "endpoints": {
             "POST /analyze": "Analyze a YouTube video and generate chapters",
+            "POST /analyze/offline": "Chapters extracted without AI, as a placeholder",
             "GET /transcript/{video_id}": "Get transcript only for a video"
         }
     }
 
-@app.post("/analyze", response_model=VideoResponse)
+@app.post("/analyze", responses=STREAMED_VIDEO_RESPONSE)
 async def analyze_video(request: VideoRequest):
     """
     Analyze a YouTube video: fetch transcript and generate chapters with AI
@@ -260,206 +374,39 @@ async def analyze_video(request: VideoRequest):
         video_id = extract_video_id(request.video_url)
         print(f"🎬 Processing video ID: {video_id}")
         
-        # Fetch transcript
+        valid_languages = requested_languages(request.languages)
+        if valid_languages:
+            print(f"📝 User requested languages: {valid_languages}")
+        
+        # Requested languages are preferred; otherwise the best available track is used
         try:
-            ytt_api = YouTubeTranscriptApi()
-            
-            # Clean up languages - filter out invalid values
-            valid_languages = None
-            if request.languages:
-                # Filter out placeholder values like 'string', empty strings, etc.
-                valid_languages = [
-                    lang.strip() for lang in request.languages 
-                    if lang and lang.strip() and lang.strip().lower() not in ['string', 'none', 'null']
-                ]
-                if not valid_languages:
-                    valid_languages = None
-                else:
-                    print(f"📝 User requested languages: {valid_languages}")
-            
-            # Auto-detect and fetch the best available transcript
-            if valid_languages:
-                # User specified valid languages - try those first
-                try:
-                    fetched_transcript = ytt_api.fetch(video_id, languages=valid_languages)
-                    print(f"✓ Found transcript in requested languages")
-                except NoTranscriptFound:
-                    # Fall back to auto-detection
-                    print(f"⚠️  Requested languages not found, auto-detecting...")
-                    valid_languages = None
-            
-            if not valid_languages:
-                # Auto-detect: List all available transcripts and pick the best one
-                print(f"🔍 Auto-detecting best available transcript...")
-                transcript_list = ytt_api.list(video_id)
-                
-                # Show what's available
-                available_info = []
-                for t in transcript_list:
-                    status = "MANUAL" if not t.is_generated else "AUTO"
-                    available_info.append(f"{t.language_code} ({t.language}) [{status}]")
-                print(f"📋 Available transcripts: {', '.join(available_info)}")
-                
-                # Priority order for auto-selection:
-                # 1. Manually created English
-                # 2. Manually created in common languages (hi, es, fr, de, pt, ru, ja, ko, zh)
-                # 3. Auto-generated English
-                # 4. Auto-generated in common languages
-                # 5. Any other available transcript
-                
-                selected_transcript = None
-                common_langs = ['en', 'hi', 'es', 'fr', 'de', 'pt', 'ru', 'ja', 'ko', 'zh-Hans', 'zh-Hant']
-                
-                # Try manually created English first
-                for t in transcript_list:
-                    if not t.is_generated and t.language_code == 'en':
-                        selected_transcript = t
-                        print(f"✓ Selected: Manual English transcript")
-                        break
-                
-                # Try manually created common languages
-                if not selected_transcript:
-                    for lang in common_langs:
-                        for t in transcript_list:
-                            if not t.is_generated and t.language_code == lang:
-                                selected_transcript = t
-                                print(f"✓ Selected: Manual {t.language} transcript")
-                                break
-                        if selected_transcript:
-                            break
-                
-                # Try auto-generated English
-                if not selected_transcript:
-                    for t in transcript_list:
-                        if t.is_generated and t.language_code == 'en':
-                            selected_transcript = t
-                            print(f"✓ Selected: Auto-generated English transcript")
-                            break
-                
-                # Try auto-generated common languages
-                if not selected_transcript:
-                    for lang in common_langs:
-                        for t in transcript_list:
-                            if t.is_generated and t.language_code == lang:
-                                selected_transcript = t
-                                print(f"✓ Selected: Auto-generated {t.language} transcript")
-                                break
-                        if selected_transcript:
-                            break
-                
-                # Fall back to first available
-                if not selected_transcript:
-                    selected_transcript = next(iter(transcript_list), None)
-                    if selected_transcript:
-                        print(f"✓ Selected: {selected_transcript.language} transcript (first available)")
-                
-                if selected_transcript:
-                    fetched_transcript = selected_transcript.fetch()
-                else:
-                    print(f"❌ No transcripts available")
-                    raise NoTranscriptFound(video_id, [], None)
-                        
-        except TranscriptsDisabled as e:
-            print(f"❌ Transcripts disabled for video {video_id}: {str(e)}")
-            raise HTTPException(status_code=404, detail="Transcripts are disabled for this video")
-        except NoTranscriptFound as e:
-            print(f"❌ No transcript found for video {video_id}: {str(e)}")
-            raise HTTPException(status_code=404, detail="No transcript found for this video in any language")
+            transcript = await load_transcript(video_id, valid_languages)
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"❌ Unexpected error fetching transcript: {str(e)}")
             import traceback
             traceback.print_exc()
             raise HTTPException(status_code=500, detail=f"Error fetching transcript: {str(e)}")
+        segments = transcript["segments"]
         
-        # Format transcript for AI
-        transcript_text = "\n".join([
-            f"[{format_timestamp(snippet.start)}] {snippet.text}"
-            for snippet in fetched_transcript.snippets
-        ])
-        
-        # Get video duration from last timestamp
-        video_duration_seconds = fetched_transcript.snippets[-1].start if fetched_transcript.snippets else 0
-        video_duration_formatted = format_timestamp(video_duration_seconds)
-        
-        # Get AI analysis with automatic fallback
-        ai_response = None
-        used_provider = request.api_provider or "gemini"
-        
-        # Try Gemini first (if requested or as default)
-        if used_provider == "gemini":
-            try:
-                ai_response = await call_gemini(
-                    transcript_text, 
-                    request.model or "gemini-2.0-flash-exp",
-                    video_duration_formatted,
-                    video_duration_seconds
-                )
-            except HTTPException as e:
-                # Check if it's a quota/rate limit error (429)
-                if "429" in str(e.detail) or "RESOURCE_EXHAUSTED" in str(e.detail) or "quota" in str(e.detail).lower():
-                    print(f"⚠️  Gemini quota exceeded, falling back to OpenRouter...")
-                    # Check if OpenRouter is available
-                    if os.getenv("OPENROUTER_API_KEY"):
-                        try:
-                            ai_response = await call_openrouter(
-                                transcript_text, 
-                                "anthropic/claude-3-haiku",
-                                video_duration_formatted,
-                                video_duration_seconds
-                            )
-                            used_provider = "openrouter (fallback)"
-                            print(f"✓ Successfully used OpenRouter as fallback")
-                        except Exception as fallback_error:
-                            raise HTTPException(
-                                status_code=503, 
-                                detail=f"Gemini quota exceeded and OpenRouter fallback failed. Please try again later or configure OPENROUTER_API_KEY. Error: {str(fallback_error)}"
-                            )
-                    else:
-                        raise HTTPException(
-                            status_code=503,
-                            detail="Gemini quota exceeded. Please configure OPENROUTER_API_KEY in .env for automatic fallback, or wait for quota reset."
-                        )
-                else:
-                    # Re-raise if it's not a quota error
-                    raise
+        # Exported artifacts first, unless a model is pinned
+        artifact = None if request.model else await cached_artifact(video_id, transcript, "/analyze")
+        if artifact is not None:
+            chapters, summary, source = artifact["chapters"], artifact["summary"], "artifact"
         else:
-            # Use OpenRouter directly if requested
-            ai_response = await call_openrouter(
-                transcript_text, 
-                request.model or "anthropic/claude-3-haiku",
-                video_duration_formatted,
-                video_duration_seconds
-            )
-        
-        # Format chapters
-        chapters = [
-            Chapter(
-                timestamp=format_timestamp(ch["timestamp_seconds"]),
-                title=ch["title"],
-                summary=ch["summary"]
-            )
-            for ch in ai_response.get("chapters", [])
-        ]
-        
-        # Format transcript segments
-        transcript_segments = [
-            TranscriptSegment(
-                text=snippet.text,
-                start=snippet.start,
-                duration=snippet.duration
-            )
-            for snippet in fetched_transcript.snippets
-        ]
+            provider = request.api_provider or "gemini"
+            chapters, summary, source = await chapters_or_offline(transcript, provider, request.model)
+            chapters = [chapter.model_dump() for chapter in chapters]
         
-        # Log which provider was used
-        print(f"✓ Chapters generated successfully using: {used_provider}")
-        
-        return VideoResponse(
-            video_id=video_id,
-            transcript=transcript_segments,
-            chapters=chapters,
-            summary=ai_response.get("overall_summary", "")
-        )
+        # Streamed (same shape as VideoResponse) so long transcripts are never encoded in one piece
+        return json_response({
+            "video_id": video_id,
+            "transcript": segment_items(segments),
+            "chapters": chapters,
+            "summary": summary,
+            "source": source
+        })
         
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -469,6 +416,27 @@ async def analyze_video(request: VideoRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
+@app.post("/analyze/offline", responses=STREAMED_VIDEO_RESPONSE)
+async def analyze_video_offline(request: VideoRequest):
+    """
+    Chapters extracted from the transcript without AI, in milliseconds.
+    Meant as a placeholder shown while /analyze generates the real chapters.
+    """
+    try:
+        video_id = extract_video_id(request.video_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    transcript = await load_transcript(video_id, requested_languages(request.languages))
+    chapters, summary = offline_chapters(transcript)
+    metrics.incr("offline_chapters", "placeholder")
+    return json_response({
+        "video_id": video_id,
+        "transcript": segment_items(transcript["segments"]),
+        "chapters": [chapter.model_dump() for chapter in chapters],
+        "summary": summary,
+        "source": "offline"
+    })
+
 @app.get("/transcript/{video_id:path}")
 async def get_transcript(video_id: str):
     """
@@ -489,46 +457,16 @@ async def get_transcript(video_id: str):
             actual_video_id = video_id
             print(f"🎬 Using video ID: {actual_video_id}")
         
-        ytt_api = YouTubeTranscriptApi()
-        
-        # Try to fetch transcript
-        try:
-            fetched_transcript = ytt_api.fetch(actual_video_id, languages=['en'])
-            print(f"✓ English transcript found")
-        except NoTranscriptFound:
-            print(f"⚠️  English not found, trying other languages...")
-            transcript_list = ytt_api.list(actual_video_id)
-            
-            available_langs = [t.language_code for t in transcript_list]
-            print(f"📋 Available languages: {available_langs}")
-            
-            first_transcript = next(iter(transcript_list), None)
-            if first_transcript:
-                print(f"✓ Using transcript in language: {first_transcript.language_code}")
-                fetched_transcript = first_transcript.fetch()
-            else:
-                raise NoTranscriptFound(actual_video_id, [], None)
-        
-        transcript_segments = [
-            TranscriptSegment(
-                text=snippet.text,
-                start=snippet.start,
-                duration=snippet.duration
-            )
-            for snippet in fetched_transcript.snippets
-        ]
+        segments = (await load_transcript(actual_video_id))["segments"]
+        prefetcher.schedule(actual_video_id)
         
-        return {
+        return json_response({
             "video_id": actual_video_id,
-            "transcript": transcript_segments
-        }
+            "transcript": segment_items(segments)
+        })
         
-    except TranscriptsDisabled:
-        print(f"❌ Transcripts disabled")
-        raise HTTPException(status_code=404, detail="Transcripts are disabled for this video")
-    except NoTranscriptFound:
-        print(f"❌ No transcript found")
-        raise HTTPException(status_code=404, detail="No transcript found for this video")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         import traceback
@@ -549,45 +487,15 @@ async def get_transcript_by_url(request: TranscriptRequest):
         video_id = extract_video_id(request.video_url)
         print(f"🎬 Fetching transcript for video ID: {video_id}")
         
-        ytt_api = YouTubeTranscriptApi()
-        
-        # Fetch transcript
-        try:
-            if request.languages:
-                print(f"📝 Fetching transcript in languages: {request.languages}")
-                fetched_transcript = ytt_api.fetch(video_id, languages=request.languages)
-            else:
-                # Try English first, then any available
-                try:
-                    fetched_transcript = ytt_api.fetch(video_id, languages=['en'])
-                    print(f"✓ English transcript found")
-                except NoTranscriptFound:
-                    print(f"⚠️  English not found, trying other languages...")
-                    transcript_list = ytt_api.list(video_id)
-                    first_transcript = next(iter(transcript_list), None)
-                    if first_transcript:
-                        print(f"✓ Using transcript in language: {first_transcript.language_code}")
-                        fetched_transcript = first_transcript.fetch()
-                    else:
-                        raise NoTranscriptFound(video_id, [], None)
-        except TranscriptsDisabled:
-            raise HTTPException(status_code=404, detail="Transcripts are disabled for this video")
-        except NoTranscriptFound:
-            raise HTTPException(status_code=404, detail="No transcript found for this video")
-        
-        transcript_segments = [
-            TranscriptSegment(
-                text=snippet.text,
-                start=snippet.start,
-                duration=snippet.duration
-            )
-            for snippet in fetched_transcript.snippets
-        ]
+        if request.languages:
+            print(f"📝 Preferred transcript languages: {request.languages}")
+        segments = (await load_transcript(video_id, request.languages))["segments"]
+        prefetcher.schedule(video_id, languages=request.languages)
         
-        return {
+        return json_response({
             "video_id": video_id,
-            "transcript": transcript_segments
-        }
+            "transcript": segment_items(segments)
+        })
         
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid YouTube URL: {str(e)}")
@@ -612,121 +520,61 @@ async def answer_note_question(request: NoteQuestionRequest):
     Answer student questions about a note using AI based on the note content and optional PDF
     """
     try:
-        # Prompt construction
-        prompt_text = f"""You are an educational assistant helping students understand their study notes.
-
-Note Title: {request.note_title}
-
-Note Content (Markdown/Text):
-{request.note_content}
-
-PDF Attachment: {request.note_pdf_url if request.note_pdf_url else "None"}
-
-Student Question: {request.question}
-
-Based on the note content and the linked PDF (if provided), provide a detailed answer to the student's question. 
-If there is a PDF link, please analyze its content to answer the question.
+        # Pull only the PDF pages relevant to this question (downloaded and indexed once per PDF)
+        pdf_section = "PDF Attachment: None"
+        if request.note_pdf_url:
+            try:
+                pdf_context = await get_pdf_context(request.note_pdf_url, request.question)
+                pdf_section = f"Relevant PDF Excerpts:\n{pdf_context}" if pdf_context else "PDF Attachment: (no extractable text)"
+            except Exception as e:
+                print(f"⚠️  Could not read note PDF {request.note_pdf_url}: {str(e)}")
+                pdf_section = "PDF Attachment: (could not be read, answering based on text content only)"
+        
+        # The note body is identical for every question on this note, so it is
+        # kept separate to be cached on the provider side
+        instructions = """Based on the note content and the PDF excerpts (if provided), provide a detailed answer to the student's question. 
+Cite PDF page numbers when you use an excerpt.
 Include:
 - Direct references to the note content
 - Clear explanations
 - Examples if applicable
 
 If the question cannot be answered from the note content, politely explain that the information is not in the notes."""
+        
+        context_text = f"""Note Title: {request.note_title}
 
-        # Try Gemini first, fallback to OpenRouter on quota error
-        ai_response = None
-        used_provider = request.api_provider or "gemini"
+Note Content (Markdown/Text):
+{request.note_content}"""
         
-        # Prepare contents for Gemini
-        gemini_contents = [prompt_text]
+        question_text = f"""{pdf_section}
+
+Student Question: {request.question}"""
         
-        if used_provider == "gemini":
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                raise HTTPException(status_code=500, detail="Gemini API key not configured")
-            
-            try:
-                client = genai.Client(api_key=api_key)
-                response = client.models.generate_content(
-                    model="gemini-3-flash-preview",
-                    contents=prompt
-                )
-                ai_response = response.text
-            except Exception as e:
-                # Check if it's a quota error
-                error_str = str(e)
-                if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower():
-                    print(f"⚠️  Gemini quota exceeded for note question, falling back to OpenRouter...")
-                    # Fallback to OpenRouter (Text only support for now)
-                    if os.getenv("OPENROUTER_API_KEY"):
-                        try:
-                            # Append note regarding missing PDF support in fallback
-                            fallback_prompt = prompt_text
-                            if request.note_pdf_url:
-                                fallback_prompt += "\n\n(Note: PDF attachment could not be processed due to quota limits, answering based on text content only.)"
-
-                            api_key = os.getenv("OPENROUTER_API_KEY")
-                            async with httpx.AsyncClient(timeout=60.0) as client:
-                                response = await client.post(
-                                    "https://openrouter.ai/api/v1/chat/completions",
-                                    headers={
-                                        "Authorization": f"Bearer {api_key}",
-                                        "Content-Type": "application/json"
-                                    },
-                                    json={
-                                        "model": "anthropic/claude-3-haiku",
-                                        "messages": [{"role": "user", "content": fallback_prompt}]
-                                    }
-                                )
-                                
-                                if response.is_success:
-                                    result = response.json()
-                                    ai_response = result["choices"][0]["message"]["content"]
-                                    used_provider = "openrouter (fallback - text only)"
-                                    print(f"✓ Successfully used OpenRouter as fallback for note question")
-                                else:
-                                    raise HTTPException(status_code=500, detail=f"OpenRouter fallback failed: {response.status_code}")
-                        except Exception as fallback_error:
-                            raise HTTPException(
-                                status_code=503,
-                                detail=f"Gemini quota exceeded and OpenRouter fallback failed: {str(fallback_error)}"
-                            )
-                    else:
-                        raise HTTPException(
-                            status_code=503,
-                            detail="Gemini quota exceeded. Please configure OPENROUTER_API_KEY for automatic fallback."
-                        )
-                else:
-                    # Re-raise if not a quota error
-                    raise HTTPException(status_code=500, detail=f"Gemini API error: {error_str}")
-        else:
-            # Use OpenRouter directly if specified (Text only)
-            fallback_prompt = prompt_text
-            if request.note_pdf_url:
-               fallback_prompt += "\n\n(Note: PDF attachment not supported with this provider yet, answering based on text content only.)"
-
-            api_key = os.getenv("OPENROUTER_API_KEY")
-            if not api_key:
-                raise HTTPException(status_code=500, detail="OpenRouter API key not configured")
-            
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "anthropic/claude-3-haiku",
-                        "messages": [{"role": "user", "content": fallback_prompt}]
-                    }
-                )
-                
-                if not response.is_success:
-                    raise HTTPException(status_code=500, detail=f"OpenRouter API error: {response.status_code}")
-                
-                result = response.json()
-                ai_response = result["choices"][0]["message"]["content"]
+        # Prompt construction
+        prompt_text = f"""You are an educational assistant helping students understand their study notes.
+
+{context_text}
+
+{question_text}
+
+{instructions}"""
+
+        # Try Gemini first, fallback to OpenRouter on quota error
+        gemini_model = select_model("gemini", "/ai-note-question", estimate_tokens(prompt_text))
+        ai_response, used_provider = await generate(
+            prompt_text,
+            provider=request.api_provider or "gemini",
+            endpoint="/ai-note-question",
+            gemini_model=gemini_model,
+            gemini_call=lambda: generate_with_context(
+                gemini_model,
+                endpoint="/ai-note-question",
+                system_instruction=f"You are an educational assistant helping students understand their study notes.\n\n{instructions}",
+                context=context_text,
+                question=question_text,
+                full_prompt=prompt_text
+            )
+        )
         
         # Return the response
         print(f"✓ AI note question answered using: {used_provider}")
@@ -743,20 +591,14 @@ class QuestionSolutionRequest(BaseModel):
     question_type: str
     api_provider: Optional[str] = "gemini"
 
-@app.post("/ai-question-solution")
-async def get_question_solution(request: QuestionSolutionRequest):
-    """
-    Generate a detailed solution for a question (theory or PYQ)
-    """
-    try:
-        # Prompt construction
-        prompt = f"""You are an expert tutor helping students with their questions.
+def build_solution_prompt(question_title: str, question_content: str, question_type: str) -> str:
+    return f"""You are an expert tutor helping students with their questions.
 
-Question Title: {request.question_title}
-Question Type: {request.question_type}
+Question Title: {question_title}
+Question Type: {question_type}
 
 Question:
-{request.question_content}
+{question_content}
 
 Please provide a comprehensive and detailed solution or answer to this question.
 - If it's a theory question, explain the concepts clearly.
@@ -764,135 +606,107 @@ Please provide a comprehensive and detailed solution or answer to this question.
 - Use formatting (bullet points, bold text) to make it easy to read.
 """
 
+def solution_key(question_title: str, question_content: str, question_type: str, model: str) -> str:
+    return response_key(
+        model,
+        question_title=question_title,
+        question_content=question_content,
+        question_type=question_type
+    )
+
+async def solve_question(question_title: str, question_content: str, question_type: str, api_provider: str = "gemini"):
+    """
+    Return (solution, cache_status) for a question, served from the response
+    cache when the same normalized question was solved before
+    """
+    provider = api_provider or "gemini"
+    # Keyed by the provider's default model rather than the one picked per
+    # request, so routing changes do not split the cache
+    model = GEMINI_DEFAULT_MODEL if provider == "gemini" else OPENROUTER_DEFAULT_MODEL
+    key = solution_key(question_title, question_content, question_type, model)
+    
+    async def compute():
         # Try Gemini first, fallback to OpenRouter on quota error
-        ai_response = None
-        used_provider = request.api_provider or "gemini"
-        
-        if used_provider == "gemini":
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                raise HTTPException(status_code=500, detail="Gemini API key not configured")
-            
-            try:
-                client = genai.Client(api_key=api_key)
-                response = client.models.generate_content(
-                    model="gemini-3-flash-preview",
-                    contents=prompt
-                )
-                ai_response = response.text
-            except Exception as e:
-                # Check if it's a quota error
-                error_str = str(e)
-                if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower():
-                    print(f"⚠️  Gemini quota exceeded for question solution, falling back to OpenRouter...")
-                    # Fallback to OpenRouter
-                    if os.getenv("OPENROUTER_API_KEY"):
-                        try:
-                            api_key = os.getenv("OPENROUTER_API_KEY")
-                            async with httpx.AsyncClient(timeout=60.0) as client:
-                                response = await client.post(
-                                    "https://openrouter.ai/api/v1/chat/completions",
-                                    headers={
-                                        "Authorization": f"Bearer {api_key}",
-                                        "Content-Type": "application/json"
-                                    },
-                                    json={
-                                        "model": "anthropic/claude-3-haiku",
-                                        "messages": [{"role": "user", "content": prompt}]
-                                    }
-                                )
-                                
-                                if response.is_success:
-                                    result = response.json()
-                                    ai_response = result["choices"][0]["message"]["content"]
-                                    used_provider = "openrouter (fallback)"
-                                    print(f"✓ Successfully used OpenRouter as fallback for question solution")
-                                else:
-                                    raise HTTPException(status_code=500, detail=f"OpenRouter fallback failed: {response.status_code}")
-                        except Exception as fallback_error:
-                            raise HTTPException(
-                                status_code=503,
-                                detail=f"Gemini quota exceeded and OpenRouter fallback failed: {str(fallback_error)}"
-                            )
-                    else:
-                        raise HTTPException(
-                            status_code=503,
-                            detail="Gemini quota exceeded. Please configure OPENROUTER_API_KEY for automatic fallback."
-                        )
-                else:
-                    # Re-raise if not a quota error
-                    raise HTTPException(status_code=500, detail=f"Gemini API error: {error_str}")
-        else:
-            # Use OpenRouter directly if specified
-            api_key = os.getenv("OPENROUTER_API_KEY")
-            if not api_key:
-                raise HTTPException(status_code=500, detail="OpenRouter API key not configured")
-            
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "anthropic/claude-3-haiku",
-                        "messages": [{"role": "user", "content": prompt}]
-                    }
-                )
-                
-                if not response.is_success:
-                    raise HTTPException(status_code=500, detail=f"OpenRouter API error: {response.status_code}")
-                
-                result = response.json()
-                ai_response = result["choices"][0]["message"]["content"]
+        ai_response, used_provider = await generate(
+            build_solution_prompt(question_title, question_content, question_type),
+            provider=provider,
+            endpoint="/ai-question-solution"
+        )
+        print(f"✓ AI question solution generated using: {used_provider}")
+        return ai_response
+    
+    return await solution_cache.get_or_compute(key, compute)
+
+@app.post("/ai-question-solution")
+async def get_question_solution(request: QuestionSolutionRequest):
+    """
+    Generate a detailed solution for a question (theory or PYQ)
+    """
+    try:
+        solution, cache_status = await solve_question(
+            request.question_title,
+            request.question_content,
+            request.question_type,
+            request.api_provider
+        )
         
         # Return the response
-        print(f"✓ AI question solution generated using: {used_provider}")
-        return {"solution": ai_response}
+        return {"solution": solution, "cache": cache_status}
                 
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate solution: {str(e)}")
 
-@app.post("/ai-question")
-async def answer_question(request: AIQuestionRequest):
-    """
-    Answer student questions about a video using AI based on the video transcript
-    """
-    try:
-        # Extract video ID and fetch transcript
-        video_id = extract_video_id(request.video_url)
-        
-        try:
-            fetched_transcript = YouTubeTranscriptApi().fetch(video_id, languages=['en'])
-        except NoTranscriptFound:
-            # Try to get any available transcript
-            transcript_list = YouTubeTranscriptApi().list(video_id)
-            first_transcript = next(iter(transcript_list), None)
-            if first_transcript:
-                fetched_transcript = first_transcript.fetch()
-            else:
-                raise HTTPException(status_code=404, detail="No transcript available for this video")
-        except TranscriptsDisabled:
-            raise HTTPException(status_code=404, detail="Transcripts are disabled for this video")
-        
-        # Format transcript for AI
-        transcript_text = " ".join([snippet.text for snippet in fetched_transcript.snippets])
-        
-        # Limit transcript length to avoid token limits (use first ~10000 characters)
-        if len(transcript_text) > 10000:
-            transcript_text = transcript_text[:10000] + "..."
-        
-        prompt = f"""You are an educational assistant helping students understand video content.
+async def answer_video_question(transcript: dict, video_title: str, question: str, provider: str = "gemini") -> str:
+    """Answer a student question about a video from its transcript"""
+    # Format transcript for AI, limited to avoid token limits (first ~10000 characters)
+    transcript_text = leading_text(transcript["segments"], 10000)
+    
+    # Long videos: section summaries cover the whole video, and only the
+    # parts of the transcript that match the question are sent verbatim
+    excerpts = ""
+    sections = await load_sections(transcript, video_title, provider)
+    if sections:
+        hits = await asyncio.to_thread(search_index.search_index.search, question, [transcript["video_id"]], 8)
+        excerpts = relevant_windows(transcript, [hit["start"] for hit in hits], 10000)
+    
+    # The transcript part is identical for every question on this video,
+    # so it is kept separate to be cached on the provider side
+    system_instruction = """You are an educational assistant helping students understand video content.
 
-Video Title: {request.video_title}
+Based on the video transcript provided, provide a detailed answer to the student's question. Include:
+- Direct references to what was said in the video
+- Relevant concepts and definitions from the transcript
+- Formulas or steps mentioned (if applicable)
+- Examples from the video content
+- Clear explanations with headings and bullet points
+
+If the question cannot be answered from the transcript, politely explain that the information is not covered in this video."""
+    
+    if sections:
+        context_text = f"""Video Title: {video_title}
+
+Video Section Summaries:
+{format_outline(sections)}"""
+    else:
+        context_text = f"""Video Title: {video_title}
 
 Video Transcript:
-{transcript_text}
+{transcript_text}"""
+    
+    question_text = f"Student Question: {question}"
+    if excerpts:
+        question_text = f"""Relevant Transcript Excerpts:
+{excerpts}
+
+{question_text}"""
+    
+    prompt = f"""You are an educational assistant helping students understand video content.
 
-Student Question: {request.question}
+{context_text}
+
+{question_text}
 
 Based on the video transcript above, provide a detailed answer to the student's question. Include:
 - Direct references to what was said in the video
@@ -903,91 +717,40 @@ Based on the video transcript above, provide a detailed answer to the student's
 
 If the question cannot be answered from the transcript, politely explain that the information is not covered in this video."""
 
-        # Try Gemini first, fallback to OpenRouter on quota error
-        ai_response = None
-        used_provider = request.api_provider or "gemini"
+    # Try Gemini first, fallback to OpenRouter on quota error
+    gemini_model = select_model("gemini", "/ai-question", estimate_tokens(prompt))
+    ai_response, used_provider = await generate(
+        prompt,
+        provider=provider,
+        endpoint="/ai-question",
+        gemini_model=gemini_model,
+        gemini_call=lambda: generate_with_context(
+            gemini_model,
+            endpoint="/ai-question",
+            system_instruction=system_instruction,
+            context=context_text,
+            question=question_text,
+            full_prompt=prompt
+        )
+    )
+    print(f"✓ AI question answered using: {used_provider}")
+    return ai_response
+
+@app.post("/ai-question")
+async def answer_question(request: AIQuestionRequest):
+    """
+    Answer student questions about a video using AI based on the video transcript
+    """
+    try:
+        # Extract video ID and fetch transcript
+        video_id = extract_video_id(request.video_url)
         
-        if used_provider == "gemini":
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                raise HTTPException(status_code=500, detail="Gemini API key not configured")
-            
-            try:
-                client = genai.Client(api_key=api_key)
-                response = client.models.generate_content(
-                    model="gemini-3-flash-preview",
-                    contents=prompt
-                )
-                ai_response = response.text
-            except Exception as e:
-                # Check if it's a quota error
-                error_str = str(e)
-                if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower():
-                    print(f"⚠️  Gemini quota exceeded for AI question, falling back to OpenRouter...")
-                    # Fallback to OpenRouter
-                    if os.getenv("OPENROUTER_API_KEY"):
-                        try:
-                            api_key = os.getenv("OPENROUTER_API_KEY")
-                            async with httpx.AsyncClient(timeout=60.0) as client:
-                                response = await client.post(
-                                    "https://openrouter.ai/api/v1/chat/completions",
-                                    headers={
-                                        "Authorization": f"Bearer {api_key}",
-                                        "Content-Type": "application/json"
-                                    },
-                                    json={
-                                        "model": "anthropic/claude-3-haiku",
-                                        "messages": [{"role": "user", "content": prompt}]
-                                    }
-                                )
-                                
-                                if response.is_success:
-                                    result = response.json()
-                                    ai_response = result["choices"][0]["message"]["content"]
-                                    used_provider = "openrouter (fallback)"
-                                    print(f"✓ Successfully used OpenRouter as fallback for AI question")
-                                else:
-                                    raise HTTPException(status_code=500, detail=f"OpenRouter fallback failed: {response.status_code}")
-                        except Exception as fallback_error:
-                            raise HTTPException(
-                                status_code=503,
-                                detail=f"Gemini quota exceeded and OpenRouter fallback failed: {str(fallback_error)}"
-                            )
-                    else:
-                        raise HTTPException(
-                            status_code=503,
-                            detail="Gemini quota exceeded. Please configure OPENROUTER_API_KEY for automatic fallback."
-                        )
-                else:
-                    # Re-raise if not a quota error
-                    raise HTTPException(status_code=500, detail=f"Gemini API error: {error_str}")
-        else:
-            # Use OpenRouter directly if specified
-            api_key = os.getenv("OPENROUTER_API_KEY")
-            if not api_key:
-                raise HTTPException(status_code=500, detail="OpenRouter API key not configured")
-            
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "anthropic/claude-3-haiku",
-                        "messages": [{"role": "user", "content": prompt}]
-                    }
-                )
-                
-                if not response.is_success:
-                    raise HTTPException(status_code=500, detail=f"OpenRouter API error: {response.status_code}")
-                
-                result = response.json()
-                ai_response = result["choices"][0]["message"]["content"]
+        transcript = await load_transcript(video_id)
+        ai_response = await answer_video_question(
+            transcript, request.video_title, request.question, request.api_provider or "gemini"
+        )
         
         # Return the response
-        print(f"✓ AI question answered using: {used_provider}")
         return {"answer": ai_response}
                 
     except HTTPException:
@@ -995,43 +758,99 @@ If the question cannot be answered from the transcript, politely explain that th
 @app.post("/video-info")
 async def get_video_info(request: VideoRequest):
     """
-    Get video duration based on metadata using yt-dlp
+    Get video duration from cached metadata, a cached transcript or yt-dlp
     """
     try:
-        video_url = request.video_url
+        video_id = extract_video_id(request.video_url)
+        metadata = await get_video_metadata(video_id)
+        # Chapters or the quiz are usually asked for next
+        prefetcher.schedule(video_id, video_title=metadata.get("title"), languages=request.languages)
+        return format_video_info(metadata)
         
-        # Configure yt-dlp
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'skip_download': True,
-            'format': 'best',
-        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting video info: {str(e)}")
+
+class VideoInfoBatchRequest(BaseModel):
+    video_urls: List[str]
+
+@app.post("/video-info/batch")
+async def get_video_info_batch(request: VideoInfoBatchRequest):
+    """
+    Get durations for many videos in one request
+    """
+    try:
+        video_ids = []
+        for video_url in request.video_urls:
+            try:
+                video_ids.append(extract_video_id(video_url))
+            except ValueError:
+                # Accept bare video IDs as well as URLs
+                video_ids.append(video_url.strip())
         
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_url, download=False)
-                duration_seconds = info.get('duration', 0)
-                
-                return {
-                    "video_id": info.get('id'),
-                    "duration": format_timestamp(duration_seconds),
-                    "duration_seconds": duration_seconds
-                }
-                
-        except Exception as e:
-            print(f"Error fetching metadata with yt-dlp: {e}")
-            
-        # Fallback to 0:00 if everything fails
-        return {
-            "video_id": extract_video_id(video_url),
-            "duration": "0:00",
-            "duration_seconds": 0
-        }
+        results = await get_video_metadata_batch(video_ids)
+        return {"videos": [format_video_info(metadata) for metadata in results]}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting video info: {str(e)}")
 
+class SearchRequest(BaseModel):
+    query: str
+    video_urls: Optional[List[str]] = None  # restrict to these videos (URLs or IDs), e.g. one subject's lectures
+    limit: Optional[int] = 20
+
+@app.post("/search")
+async def search_transcripts(request: SearchRequest):
+    """
+    Full-text search across all fetched transcripts, returning ranked timestamp hits
+    """
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    
+    video_ids = None
+    if request.video_urls:
+        video_ids = []
+        for video_url in request.video_urls:
+            try:
+                video_ids.append(extract_video_id(video_url))
+            except ValueError:
+                video_ids.append(video_url.strip())
+    
+    started = time.perf_counter()
+    try:
+        hits = await asyncio.to_thread(search_index.search_index.search, request.query, video_ids, request.limit or 20)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+    took = time.perf_counter() - started
+    metrics.observe_latency("/search", took)
+    
+    return {
+        "query": request.query,
+        "hits": [dict(hit, timestamp=format_timestamp(hit["start"])) for hit in hits],
+        "took_ms": round(took * 1000, 2)
+    }
+
+@app.get("/search/stats")
+async def get_search_stats():
+    """Size of the transcript search index"""
+    return search_index.search_index.stats()
+
+@app.on_event("startup")
+async def backfill_search_index():
+    """Index transcripts that were cached before search existed (runs in the background)"""
+    async def run():
+        count = await asyncio.to_thread(search_index.backfill, cached_transcripts())
+        if count:
+            print(f"🔎 Indexed {count} cached transcripts for search")
+    asyncio.ensure_future(run())
+
+@app.on_event("startup")
+async def start_transcript_refresh():
+    """Re-check the transcripts of videos with generated content in the background (see refresh.py)"""
+    if REFRESH_INTERVAL_SECONDS > 0:
+        asyncio.ensure_future(refresh_loop(export_artifact))
+
 
 @app.post("/generate-quiz")
 async def generate_quiz(request: QuizRequest):
@@ -1042,153 +861,332 @@ async def generate_quiz(request: QuizRequest):
         # Extract video ID and fetch transcript
         video_id = extract_video_id(request.video_url)
         
-        try:
-            fetched_transcript = YouTubeTranscriptApi().fetch(video_id, languages=['en'])
-        except NoTranscriptFound:
-            # Try to get any available transcript
-            transcript_list = YouTubeTranscriptApi().list(video_id)
-            first_transcript = next(iter(transcript_list), None)
-            if first_transcript:
-                fetched_transcript = first_transcript.fetch()
-            else:
-                raise HTTPException(status_code=404, detail="No transcript available for this video")
-        except TranscriptsDisabled:
-            raise HTTPException(status_code=404, detail="Transcripts are disabled for this video")
-        
-        # Format transcript for AI
-        transcript_text = " ".join([snippet.text for snippet in fetched_transcript.snippets])
+        transcript = await load_transcript(video_id)
+        artifact = await cached_artifact(video_id, transcript, "/generate-quiz")
+        if artifact is not None and artifact["quiz"]:
+            return {"quiz": artifact["quiz"]}
         
-        # Limit transcript length to avoid token limits
-        if len(transcript_text) > 8000:
-            transcript_text = transcript_text[:8000] + "..."
+        # Long videos are quizzed part by part (from their cached section
+        # summaries when available) so the questions cover the whole video
+        provider = request.api_provider or "gemini"
+        sections = await load_sections(transcript, request.video_title, provider)
+        quiz_data = await generate_quiz_questions(transcript, request.video_title, provider, sections)
         
-        prompt = f"""Based on the following video transcript, generate a quiz with 5 multiple-choice questions.
+        # Return the quiz
+        print(f"✓ Quiz generated with {len(quiz_data)} questions")
+        return {"quiz": quiz_data}
+                
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate quiz: {str(e)}")
 
-Video Title: {request.video_title}
+class LectureBundleRequest(BaseModel):
+    video_url: str
+    video_title: Optional[str] = ""
+    languages: Optional[List[str]] = None
+    api_provider: Optional[str] = "gemini"  # 'openrouter' or 'gemini'
+    mode: Optional[str] = "combined"  # 'combined' (one LLM call) or 'concurrent' (chapter and quiz calls in parallel)
+    include_transcript: Optional[bool] = False
 
-Video Transcript:
-{transcript_text}
+async def generate_bundle_combined(transcript: dict, video_title: str, provider: str, sections: Optional[List[dict]]):
+    """Return (chapters, overall_summary, quiz) from a single LLM call"""
+    segments = transcript["segments"]
+    duration_seconds = segments[-1]["start"] if segments else 0
+    if sections:
+        source_text = format_outline(sections, key_points=True, topics=True)
+    else:
+        source_text = timestamped_text(segments)
 
-Create questions that:
-- Test understanding of KEY CONCEPTS actually discussed in the video
-- Cover different parts of the video content
-- Have 4 options (A, B, C, D) where only one is correct
-- Include the correct answer
-
-Return ONLY a JSON array with this exact structure (no additional text):
-[
-  {{
-    "question": "What is...",
-    "options": ["A) First option", "B) Second option", "C) Third option", "D) Fourth option"],
-    "correct": "A"
-  }}
-]"""
+    prompt = build_bundle_prompt(source_text, video_title, format_timestamp(duration_seconds), duration_seconds, outline=bool(sections))
+    ai_text, used_provider = await generate(
+        prompt,
+        provider=provider,
+        endpoint="/lecture-bundle",
+        json_mode=True,
+        openrouter_timeout=120.0
+    )
+    ai_response = parse_ai_json(ai_text)
+    chapters = format_chapters(ai_response)
 
-        # Try Gemini first, fallback to OpenRouter on quota error
-        quiz_data = None
-        used_provider = request.api_provider or "gemini"
-        
-        if used_provider == "gemini":
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                raise HTTPException(status_code=500, detail="Gemini API key not configured")
-            
-            try:
-                client = genai.Client(api_key=api_key)
-                response = client.models.generate_content(
-                    model="gemini-3-flash-preview",
-                    contents=prompt,
-                    config=types.GenerateContentConfig(
-                        response_mime_type="application/json"
-                    )
-                )
-                quiz_data = json.loads(response.text)
-            except Exception as e:
-                # Check if it's a quota error
-                error_str = str(e)
-                if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "quota" in error_str.lower():
-                    print(f"⚠️  Gemini quota exceeded for quiz generation, falling back to OpenRouter...")
-                    # Fallback to OpenRouter
-                    if os.getenv("OPENROUTER_API_KEY"):
-                        try:
-                            api_key = os.getenv("OPENROUTER_API_KEY")
-                            async with httpx.AsyncClient(timeout=60.0) as client:
-                                response = await client.post(
-                                    "https://openrouter.ai/api/v1/chat/completions",
-                                    headers={
-                                        "Authorization": f"Bearer {api_key}",
-                                        "Content-Type": "application/json"
-                                    },
-                                    json={
-                                        "model": "anthropic/claude-3-haiku",
-                                        "messages": [{"role": "user", "content": prompt}],
-                                        "response_format": {"type": "json_object"}
-                                    }
-                                )
-                                
-                                if response.is_success:
-                                    result = response.json()
-                                    quiz_text = result["choices"][0]["message"]["content"]
-                                    quiz_data = json.loads(quiz_text)
-                                    used_provider = "openrouter (fallback)"
-                                    print(f"✓ Successfully used OpenRouter as fallback for quiz generation")
-                                else:
-                                    raise HTTPException(status_code=500, detail=f"OpenRouter fallback failed: {response.status_code}")
-                        except Exception as fallback_error:
-                            raise HTTPException(
-                                status_code=503,
-                                detail=f"Gemini quota exceeded and OpenRouter fallback failed: {str(fallback_error)}"
-                            )
-                    else:
-                        raise HTTPException(
-                            status_code=503,
-                            detail="Gemini quota exceeded. Please configure OPENROUTER_API_KEY for automatic fallback."
-                        )
-                else:
-                    # Re-raise if not a quota error
-                    raise HTTPException(status_code=500, detail=f"Gemini API error: {error_str}")
+    quiz = ai_response.get("quiz")
+    quiz = merge_questions([quiz]) if isinstance(quiz, list) else []
+    if len(quiz) < QUIZ_QUESTIONS:
+        # The combined answer came back without a usable quiz; ask for it on its own
+        print(f"⚠️  Combined response had {len(quiz)} quiz questions, generating the quiz separately")
+        metrics.incr("lecture_bundle", "quiz_fallback")
+        quiz = await generate_quiz_questions(transcript, video_title, provider, sections)
+
+    print(f"✓ Lecture bundle generated using: {used_provider}")
+    return chapters, ai_response.get("overall_summary", ""), quiz
+
+async def export_artifact(transcript: dict, video_title: str, provider: str) -> str:
+    """Generate chapters, summary and quiz in one call and write them as a static artifact; returns its hash"""
+    sections = await load_sections(transcript, video_title, provider)
+    chapters, summary, quiz = await generate_bundle_combined(transcript, video_title, provider, sections)
+    duration_seconds = transcript_duration(transcript["segments"])
+    return artifacts.write_artifact(artifacts.build_artifact(
+        transcript,
+        format_timestamp(duration_seconds),
+        duration_seconds,
+        [chapter.model_dump() for chapter in chapters],
+        summary,
+        quiz
+    ))
+
+# Speculative exports for lectures that were just opened (see prefetch.py)
+prefetcher = Prefetcher(export_artifact)
+
+async def cached_artifact(video_id: str, transcript: dict, endpoint: str) -> Optional[dict]:
+    """Exported or prefetched artifact for this transcript, waiting for a prefetch of it that is still running"""
+    await prefetcher.join(video_id)
+    artifact = artifacts.lookup(video_id, transcript["content_hash"], endpoint)
+    prefetcher.observe(video_id, artifact is not None)
+    return artifact
+
+@app.post("/lecture-bundle")
+async def get_lecture_bundle(request: LectureBundleRequest):
+    """
+    Duration, chapters, summary and quiz for a lecture in one request.
+    Replaces /video-info + /analyze + /generate-quiz: the transcript is
+    fetched once, the duration is read from it, and the generated content
+    comes from one combined LLM call (or, with mode='concurrent', the
+    chapter and quiz calls run in parallel on the same prepared context).
+    """
+    mode = request.mode or "combined"
+    if mode not in ("combined", "concurrent"):
+        raise HTTPException(status_code=400, detail="mode must be 'combined' or 'concurrent'")
+    try:
+        video_id = extract_video_id(request.video_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    started = time.perf_counter()
+    try:
+        transcript = await load_transcript(video_id, request.languages)
+        duration_seconds = transcript_duration(transcript["segments"])
+
+        artifact = await cached_artifact(video_id, transcript, "/lecture-bundle")
+        if artifact is not None:
+            chapters, summary, quiz = artifact["chapters"], artifact["summary"], artifact["quiz"]
+            source = "artifact"
         else:
-            # Use OpenRouter directly if specified
-            api_key = os.getenv("OPENROUTER_API_KEY")
-            if not api_key:
-                raise HTTPException(status_code=500, detail="OpenRouter API key not configured")
-            
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "anthropic/claude-3-haiku",
-                        "messages": [{"role": "user", "content": prompt}],
-                        "response_format": {"type": "json_object"}
-                    }
+            # Section summaries (long videos only) are built once and shared by every part
+            provider = request.api_provider or "gemini"
+            video_title = request.video_title or ""
+            sections = await load_sections(transcript, video_title, provider)
+            if mode == "combined":
+                chapters, summary, quiz = await generate_bundle_combined(transcript, video_title, provider, sections)
+            else:
+                (chapters, summary), quiz = await asyncio.gather(
+                    generate_chapters(transcript, provider),
+                    generate_quiz_questions(transcript, video_title, provider, sections)
                 )
-                
-                if not response.is_success:
-                    raise HTTPException(status_code=500, detail=f"OpenRouter API error: {response.status_code}")
-                
-                result = response.json()
-                quiz_text = result["choices"][0]["message"]["content"]
-                quiz_data = json.loads(quiz_text)
-        
-        # Return the quiz
-        print(f"✓ Quiz generated using: {used_provider}")
-        return {"quiz": quiz_data}
-                
+            chapters = [chapter.model_dump() for chapter in chapters]
+            source = mode
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate quiz: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to build lecture bundle: {str(e)}")
+    took = time.perf_counter() - started
+    metrics.observe_latency(f"/lecture-bundle:{source}", took)
+    metrics.incr("lecture_bundle", source)
+
+    response = {
+        "video_id": video_id,
+        "duration": format_timestamp(duration_seconds),
+        "duration_seconds": duration_seconds,
+        "language_code": transcript.get("language_code"),
+        "chapters": chapters,
+        "summary": summary,
+        "quiz": quiz,
+        "mode": mode,
+        "took_ms": round(took * 1000, 2)
+    }
+    if request.include_transcript:
+        response["transcript"] = segment_items(transcript["segments"])
+    return json_response(response)
+
+async def open_lecture_session(session: LectureSession, message: dict) -> dict:
+    """Load the session's transcript once; later requests reuse it"""
+    try:
+        session.video_id = extract_video_id(message["video_url"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    session.transcript = await load_transcript(session.video_id, message.get("languages"))
+    duration_seconds = transcript_duration(session.transcript["segments"])
+    return {
+        "video_id": session.video_id,
+        "duration": format_timestamp(duration_seconds),
+        "duration_seconds": duration_seconds,
+        "language_code": session.transcript.get("language_code")
+    }
+
+async def session_chapters(session: LectureSession, message: dict) -> dict:
+    if not message.get("model"):
+        artifact = await cached_artifact(session.video_id, session.transcript, "ws:chapters")
+        if artifact is not None:
+            return {"chapters": artifact["chapters"], "summary": artifact["summary"], "source": "artifact"}
+    chapters, summary, source = await chapters_or_offline(session.transcript, session.provider, message.get("model"))
+    return {"chapters": [chapter.model_dump() for chapter in chapters], "summary": summary, "source": source}
+
+async def session_quiz(session: LectureSession, message: dict) -> dict:
+    artifact = await cached_artifact(session.video_id, session.transcript, "ws:quiz")
+    if artifact is not None and artifact["quiz"]:
+        return {"quiz": artifact["quiz"]}
+    sections = await load_sections(session.transcript, session.video_title, session.provider)
+    quiz_data = await generate_quiz_questions(session.transcript, session.video_title, session.provider, sections)
+    return {"quiz": quiz_data}
+
+async def session_question(session: LectureSession, message: dict) -> dict:
+    question = (message.get("question") or "").strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question must not be empty")
+    answer = await answer_video_question(session.transcript, session.video_title, question, session.provider)
+    return {"answer": answer}
+
+async def session_transcript(session: LectureSession, message: dict) -> dict:
+    return {"video_id": session.video_id, "transcript": session.transcript["segments"]}
+
+@app.websocket("/ws/lecture")
+async def lecture_session(websocket: WebSocket):
+    """
+    One connection per lecture screen: the transcript is loaded once and
+    chapter, quiz and question requests are multiplexed over the socket
+    (protocol in lecture_session.py)
+    """
+    session = LectureSession(websocket, open_lecture_session, {
+        "chapters": session_chapters,
+        "quiz": session_quiz,
+        "question": session_question,
+        "transcript": session_transcript
+    })
+    await session.run()
+
+class CheckInRequest(BaseModel):
+    session_id: str
+    student_email: str  # one record per (session_id, student_email)
+    student_id: Optional[str] = None  # derived from the email on the device, as in the app
+    student_name: Optional[str] = None
+    latitude: float
+    longitude: float
+    altitude: Optional[float] = None
+    accuracy: Optional[float] = None  # GPS accuracy in meters
+
+CHECK_IN_STATUS_CODES = {"marked": 200, "already_marked": 200, "rejected": 403, "session_closed": 409, "error": 500}
+
+@app.post("/attendance/check-in")
+async def check_in(request: CheckInRequest):
+    """
+    Mark a student present. The location is verified on the server against
+    the campus geofence, and check-ins arriving together are written in one
+    batch (see attendance.py)
+    """
+    result = await check_in_batcher.submit(request.model_dump())
+    return JSONResponse(status_code=CHECK_IN_STATUS_CODES.get(result["status"], 500), content=result)
+
+@app.get("/attendance/stats/sessions/{session_id}")
+async def get_session_attendance_stats(session_id: str):
+    """Present/late/absent counts and rates for one session"""
+    row = await attendance_store.session_stats(session_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="No attendance stats for this session")
+    return session_summary(row)
+
+@app.get("/attendance/stats/classes/{class_id}")
+async def get_class_attendance_stats(class_id: str):
+    """Counts and rates over every session of a class"""
+    row = await attendance_store.class_stats(class_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="No attendance stats for this class")
+    return class_summary(row)
+
+@app.get("/attendance/stats/students/{student_email}")
+async def get_student_attendance_stats(student_email: str):
+    """A student's counts and attendance rate per class and overall"""
+    return student_summary(student_email, await attendance_store.student_stats(student_email))
+
+@app.get("/artifacts/{video_id}")
+async def get_latest_artifact(
+    video_id: str,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Latest exported chapters, summary and quiz for a video (see artifacts.py)"""
+    return artifacts.serve(video_id, None, accept_encoding, if_none_match)
+
+@app.get("/artifacts/{video_id}/{artifact_hash}.json")
+async def get_artifact(
+    video_id: str,
+    artifact_hash: str,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    """One exported artifact by content hash; it never changes, so it can be cached forever"""
+    return artifacts.serve(video_id, artifact_hash, accept_encoding, if_none_match)
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """Counters, latency percentiles and context-cache savings per endpoint"""
+    return {
+        **metrics.snapshot(),
+        "context_cache": context_cache_report()
+    }
+
+@app.get("/models/policy")
+async def get_model_policy():
+    """Model tiers, latency SLOs and observed per-model latency used for model selection"""
+    return policy_report()
+
+@app.get("/usage")
+async def get_token_usage(days: int = 7):
+    """Token usage and cost per endpoint and per day from the ledger, and today's budget state"""
+    return usage.report(days)
+
+@app.get("/prefetch")
+async def get_prefetch():
+    """Speculative prefetch queue, budget and hit rate"""
+    return prefetcher.report()
+
+@app.get("/scheduler")
+async def get_scheduler():
+    """Provider call slots, queued calls and queue wait per priority class"""
+    return scheduler_report()
+
+@app.get("/transcripts/refresh")
+async def get_transcript_refresh():
+    """Last transcript refresh run (changed and re-timed videos) and today's checks and spend"""
+    return refresh_report()
+
+@app.get("/credentials/usage")
+async def get_credential_usage():
+    """Per-key request counts, remaining per-minute quota and quarantine state"""
+    return credential_usage()
+
+@app.get("/context-cache")
+async def get_context_caches():
+    """List the provider-side context caches currently in use"""
+    return {"caches": list_context_caches()}
+
+@app.delete("/context-cache/{content_hash}")
+async def delete_context_cache(content_hash: str):
+    """Explicitly evict the provider-side caches for a content hash"""
+    evicted = await evict_context_cache(content_hash)
+    return {"evicted": evicted}
+
 if __name__ == "__main__":
-    import uvicorn
-    port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    import sys
+    if "--production" in sys.argv:
+        # Multiple worker processes sharing the on-disk cache (see serve.py)
+        import serve
+        sys.argv.remove("--production")
+        serve.main()
+    else:
+        import uvicorn
+        port = int(os.getenv("PORT", 8000))
+        uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+Video metadata service with a persistent cache.
+
+Duration lookups are served from the cache first, then from a cached
+transcript, and only on a miss from yt-dlp in its lightest extraction mode.
+Failed lookups are cached briefly so a broken video does not hit YouTube
+on every screen open.
+"""
+import asyncio
+import os
+from typing import List
+
+import yt_dlp
+
+from cache import cache
+from deadlines import bounded, shared
+from transcripts import get_cached_transcript, transcript_duration
+
+METADATA_NAMESPACE = "video_meta"
+METADATA_TTL_SECONDS = int(os.getenv("VIDEO_META_TTL", 30 * 24 * 3600))
+METADATA_FAILURE_TTL_SECONDS = int(os.getenv("VIDEO_META_FAILURE_TTL", 300))
+METADATA_BATCH_CONCURRENCY = int(os.getenv("VIDEO_META_BATCH_CONCURRENCY", 4))
+
+# Only the info dict is needed: skip format resolution, manifests and the
+# player JS that is otherwise downloaded to decipher stream URLs
+YTDLP_LIGHT_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True,
+    'noplaylist': True,
+    'extractor_args': {'youtube': {'skip': ['dash', 'hls'], 'player_skip': ['js']}},
+}
+
+# Lookups currently running, so concurrent misses share one yt-dlp call
+_inflight: dict = {}
+
+
+def _extract_with_ytdlp(video_id: str) -> dict:
+    """Blocking yt-dlp lookup without format processing"""
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    with yt_dlp.YoutubeDL(YTDLP_LIGHT_OPTS) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+    return {
+        "video_id": info.get('id') or video_id,
+        "title": info.get('title'),
+        "duration_seconds": info.get('duration') or 0,
+        "source": "yt-dlp"
+    }
+
+
+async def _lookup(video_id: str) -> dict:
+    transcript = get_cached_transcript(video_id)
+    if transcript and transcript.get("segments"):
+        metadata = {
+            "video_id": video_id,
+            "title": None,
+            "duration_seconds": transcript_duration(transcript["segments"]),
+            "source": "transcript"
+        }
+        cache.set(METADATA_NAMESPACE, video_id, metadata, ttl=METADATA_TTL_SECONDS)
+        return metadata
+
+    try:
+        metadata = await asyncio.to_thread(_extract_with_ytdlp, video_id)
+    except Exception as e:
+        print(f"Error fetching metadata with yt-dlp: {e}")
+        failure = {"video_id": video_id, "error": str(e)[:200]}
+        cache.set(METADATA_NAMESPACE, video_id, failure, ttl=METADATA_FAILURE_TTL_SECONDS)
+        return failure
+
+    cache.set(METADATA_NAMESPACE, video_id, metadata, ttl=METADATA_TTL_SECONDS)
+    return metadata
+
+
+async def get_video_metadata(video_id: str) -> dict:
+    """
+    Return {"video_id", "duration_seconds", "source", ...} for a video.
+    Failed lookups return {"video_id", "error"} and are cached for a short TTL.
+    """
+    cached = cache.get(METADATA_NAMESPACE, video_id)
+    if cached is not None:
+        return cached
+
+    return await bounded(shared(_inflight, video_id, lambda: _lookup(video_id)), "metadata lookup")
+
+
+async def get_video_metadata_batch(video_ids: List[str]) -> List[dict]:
+    """Look up many videos at once with bounded yt-dlp concurrency"""
+    semaphore = asyncio.Semaphore(METADATA_BATCH_CONCURRENCY)
+
+    async def lookup(video_id: str) -> dict:
+        async with semaphore:
+            return await get_video_metadata(video_id)
+
+    return await asyncio.gather(*(lookup(video_id) for video_id in video_ids))
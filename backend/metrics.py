@@ -0,0 +1,54 @@
+"""
+In-process counters and latency windows, exposed at GET /metrics.
+"""
+import math
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict, Optional
+
+LATENCY_WINDOW_SIZE = 500
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+_latencies: Dict[str, Deque[float]] = {}
+
+
+def incr(group: str, name: str, value: float = 1):
+    """Add value to the counter group[name]"""
+    with _lock:
+        _counters[group][name] += value
+
+
+def observe_latency(name: str, seconds: float):
+    """Record one latency sample in the rolling window for name"""
+    with _lock:
+        window = _latencies.get(name)
+        if window is None:
+            window = _latencies[name] = deque(maxlen=LATENCY_WINDOW_SIZE)
+        window.append(seconds)
+
+
+def latency_percentile(name: str, percentile: float, min_samples: int = 1) -> Optional[float]:
+    """Return the given percentile (0-100) of the rolling window, or None without enough samples"""
+    with _lock:
+        samples = sorted(_latencies.get(name, ()))
+    if len(samples) < max(min_samples, 1):
+        return None
+    rank = max(0, math.ceil(percentile / 100 * len(samples)) - 1)
+    return samples[rank]
+
+
+def snapshot() -> dict:
+    """Counters plus p50/p95 of every latency window"""
+    with _lock:
+        counters = {group: dict(values) for group, values in _counters.items()}
+        names = list(_latencies)
+    latencies = {
+        name: {
+            "samples": len(_latencies[name]),
+            "p50": latency_percentile(name, 50),
+            "p95": latency_percentile(name, 95)
+        }
+        for name in names
+    }
+    return {"counters": counters, "latency": latencies}
@@ -0,0 +1,182 @@
+"""
+Per-request model selection.
+
+Every provider has a fast model, a default model and a long-context
+model (configurable through the environment). For each call the policy
+estimates the input size and looks at the endpoint's latency SLO:
+
+- quick requests (short inputs, interactive endpoints) prefer the fast model
+- long inputs, such as chapters for a long lecture, prefer the
+  long-context model
+- everything else prefers the default model
+
+Models whose context window is too small are skipped, and so are models
+whose observed p95 latency for inputs of this size exceeds the
+endpoint's SLO. When no model meets the SLO, the one with the lowest
+observed latency is used. A small share of requests still goes to the
+preferred model so a model that was slow for a while can recover.
+Latencies come from the rolling windows in metrics.py, recorded by
+providers.generate.
+
+Once an endpoint is past its soft daily budget (see usage.py), the
+cheapest model that fits is used regardless of latency.
+"""
+import os
+import random
+from typing import Dict, List, Optional
+
+import metrics
+import usage
+
+LATENCY_PERCENTILE = float(os.getenv("MODEL_POLICY_PERCENTILE", 95))
+LATENCY_MIN_SAMPLES = int(os.getenv("MODEL_POLICY_MIN_SAMPLES", 10))
+SHORT_INPUT_TOKENS = int(os.getenv("MODEL_SHORT_INPUT_TOKENS", 4000))
+LONG_INPUT_TOKENS = int(os.getenv("MODEL_LONG_INPUT_TOKENS", 60000))
+# Share of requests sent to the preferred model even when it misses the SLO,
+# so its latency window keeps being refreshed and it can recover
+EXPLORE_FRACTION = float(os.getenv("MODEL_POLICY_EXPLORE", 0.05))
+TYPICAL_OUTPUT_TOKENS = 1000
+
+# name, context window (input tokens)
+MODELS = {
+    "gemini": {
+        "fast": (os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite"), 1_000_000),
+        "default": (os.getenv("GEMINI_MODEL", "gemini-3-flash-preview"), 1_000_000),
+        "long": (os.getenv("GEMINI_LONG_MODEL", "gemini-2.5-flash"), 1_000_000)
+    },
+    "openrouter": {
+        "fast": (os.getenv("OPENROUTER_FAST_MODEL", "anthropic/claude-3-haiku"), 200_000),
+        "default": (os.getenv("OPENROUTER_MODEL", "anthropic/claude-3-haiku"), 200_000),
+        "long": (os.getenv("OPENROUTER_LONG_MODEL", "google/gemini-2.5-flash"), 1_000_000)
+    }
+}
+
+# Interactive endpoints answer a student who is waiting on the screen
+INTERACTIVE_ENDPOINTS = {"/ai-question", "/ai-note-question", "/ai-question-solution"}
+
+DEFAULT_SLO_SECONDS = {
+    "/ai-question": 10,
+    "/ai-note-question": 10,
+    "/ai-question-solution": 15,
+    "/generate-quiz": 20,
+    "/analyze": 45,
+    "/lecture-bundle": 60,
+    "summaries": 60
+}
+
+
+def load_slos() -> Dict[str, float]:
+    """DEFAULT_SLO_SECONDS overridden by MODEL_SLO_SECONDS, e.g. '/ai-question=8,/analyze=30'"""
+    slos = dict(DEFAULT_SLO_SECONDS)
+    for item in os.getenv("MODEL_SLO_SECONDS", "").split(","):
+        endpoint, _, seconds = item.partition("=")
+        if endpoint.strip() and seconds.strip():
+            slos[endpoint.strip()] = float(seconds)
+    return slos
+
+
+SLO_SECONDS = load_slos()
+
+
+def size_bucket(input_tokens: int) -> str:
+    if input_tokens < SHORT_INPUT_TOKENS:
+        return "short"
+    if input_tokens < LONG_INPUT_TOKENS:
+        return "medium"
+    return "long"
+
+
+def latency_key(model: str, input_tokens: Optional[int] = None) -> str:
+    if input_tokens is None:
+        return f"model:{model}"
+    return f"model:{model}:{size_bucket(input_tokens)}"
+
+
+def observe(model: str, input_tokens: int, seconds: float):
+    """Record one call's latency for the model, overall and for its input size"""
+    metrics.observe_latency(latency_key(model), seconds)
+    metrics.observe_latency(latency_key(model, input_tokens), seconds)
+
+
+def expected_latency(model: str, input_tokens: int) -> Optional[float]:
+    """Observed latency percentile for inputs of this size (or any size), None if unknown"""
+    observed = metrics.latency_percentile(latency_key(model, input_tokens), LATENCY_PERCENTILE, LATENCY_MIN_SAMPLES)
+    if observed is None:
+        observed = metrics.latency_percentile(latency_key(model), LATENCY_PERCENTILE, LATENCY_MIN_SAMPLES)
+    return observed
+
+
+def preference(endpoint: str, input_tokens: int) -> List[str]:
+    """Model tiers in order of preference for this request"""
+    bucket = size_bucket(input_tokens)
+    if bucket == "long":
+        return ["long", "default", "fast"]
+    if bucket == "short" or endpoint in INTERACTIVE_ENDPOINTS:
+        return ["fast", "default", "long"]
+    return ["default", "fast", "long"]
+
+
+def select_model(provider: str, endpoint: str, input_tokens: int) -> str:
+    """Pick the model for one call"""
+    catalog = MODELS["gemini" if provider == "gemini" else "openrouter"]
+    slo = SLO_SECONDS.get(endpoint)
+    candidates = []
+    for tier in preference(endpoint, input_tokens):
+        model, context_window = catalog[tier]
+        if input_tokens > context_window or model in candidates:
+            continue
+        candidates.append(model)
+    if not candidates:
+        # Nothing fits; let the largest context window try
+        return max(catalog.values(), key=lambda entry: entry[1])[0]
+
+    if usage.budget_state(endpoint) == "soft":
+        # Priced for this input and an answer of about TYPICAL_OUTPUT_TOKENS
+        model = min(candidates, key=lambda m: usage.cost(m, input_tokens, TYPICAL_OUTPUT_TOKENS))
+        metrics.incr("model_policy", "budget_economy")
+        metrics.incr("model_policy", f"{endpoint}:{model}")
+        return model
+
+    if random.random() < EXPLORE_FRACTION:
+        metrics.incr("model_policy", "explored")
+        return candidates[0]
+
+    for model in candidates:
+        latency = expected_latency(model, input_tokens)
+        if slo is None or latency is None or latency <= slo:
+            metrics.incr("model_policy", f"{endpoint}:{model}")
+            return model
+
+    # Every candidate misses the SLO: take the fastest observed one
+    model = min(candidates, key=lambda m: expected_latency(m, input_tokens))
+    metrics.incr("model_policy", "slo_unmet")
+    metrics.incr("model_policy", f"{endpoint}:{model}")
+    return model
+
+
+def policy_report() -> dict:
+    """Configured tiers, SLOs and observed per-model latency"""
+    models = {}
+    for provider, catalog in MODELS.items():
+        for tier, (model, context_window) in catalog.items():
+            stats = models.setdefault(model, {"provider": provider, "tiers": [], "context_window": context_window})
+            stats["tiers"].append(tier)
+    for model, stats in models.items():
+        stats["latency"] = {
+            bucket: {
+                "p50": metrics.latency_percentile(key, 50),
+                "p95": metrics.latency_percentile(key, 95)
+            }
+            for bucket, key in [
+                ("all", latency_key(model)),
+                ("short", f"model:{model}:short"),
+                ("medium", f"model:{model}:medium"),
+                ("long", f"model:{model}:long")
+            ]
+        }
+    return {
+        "slo_seconds": SLO_SECONDS,
+        "short_input_tokens": SHORT_INPUT_TOKENS,
+        "long_input_tokens": LONG_INPUT_TOKENS,
+        "models": models
+    }
@@ -0,0 +1,263 @@
+"""
+Offline extractive chapters: no provider call, no network.
+
+When both providers are rate-limited or out of budget, /analyze would
+return nothing. This module builds chapters from the transcript alone,
+in a few milliseconds even for a two-hour lecture:
+
+1. The transcript is cut into pseudo-sentences of about UNIT_WORDS
+   words (whole caption segments, so each has a real timestamp).
+2. Each pseudo-sentence becomes a TF-IDF vector over its content words
+   and adjacent content-word pairs (NumPy).
+3. TextTiling: the cosine similarity between the BLOCK_UNITS
+   pseudo-sentences before and after every gap is smoothed, and gaps in
+   deep valleys of that curve are topic boundaries. The deepest ones
+   become chapter starts, at most one per MIN_CHAPTER_SECONDS and at
+   most MAX_CHAPTERS.
+4. A chapter's title is made from the terms most concentrated in it, and
+   its summary is the pseudo-sentence closest to the chapter's centroid.
+
+/analyze and the lecture WebSocket fall back to these chapters when the
+providers refuse (429/503) unless OFFLINE_CHAPTERS_FALLBACK=false, and
+POST /analyze/offline returns them right away, as a placeholder while
+the LLM chapters are generated.
+
+The result has the same shape as an LLM chapter response
+({"chapters": [{"timestamp_seconds", "title", "summary"}],
+"overall_summary"}), so it is formatted like one. Titles and summaries
+are extracts, not prose: this is a degraded mode and a placeholder, not
+a replacement.
+"""
+import os
+import re
+from typing import List, Tuple
+
+import numpy as np
+
+OFFLINE_CHAPTERS_FALLBACK = os.getenv("OFFLINE_CHAPTERS_FALLBACK", "true").lower() != "false"
+# Status codes of provider failures that fall back to offline chapters (rate limits, budgets, no provider left)
+FALLBACK_STATUS_CODES = {429, 503}
+
+UNIT_WORDS = 20
+BLOCK_UNITS = 6
+MIN_CHAPTER_SECONDS = 120
+MIN_CHAPTERS = 5
+MAX_CHAPTERS = 8
+TITLE_TERMS = 3
+SUMMARY_WORDS = 45
+
+WORD_PATTERN = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+# Caption annotations such as [Music] or [Applause]
+ANNOTATION_PATTERN = re.compile(r"\[[^\]]*\]|\([^)]*\)")
+
+# Function words plus the filler of spoken lectures
+STOPWORDS = frozenset("""
+a about above actually after again against all almost also although always am among an and another any anyone
+anything are aren't around as at back be because been before being below between both but by can can't cannot
+come could couldn't did didn't do does doesn't doing don't done down during each either else enough even ever
+every everything few first for from further get gets getting give go goes going gonna good got gotta had hadn't
+has hasn't have haven't having he he'd he'll he's her here here's hers herself him himself his how how's however
+i i'd i'll i'm i've if in into is isn't it it's its itself just kind know let let's like look lot lots made
+make makes many may maybe me might mine more most much must my myself need next no nor not nothing now of off
+oh ok okay on once one only or other others our ours ourselves out over own per pretty put quite rather really
+right said same say says see seen shall she she'd she'll she's should shouldn't so some something sort still
+such sure take than that that's the their theirs them themselves then there there's these they they'd they'll
+they're they've thing things think this those though through thus to today too two uh um under until up upon us
+use used using very wanna want was wasn't way we we'd we'll we're we've well were weren't what what's when
+when's where where's whether which while who who's whom whose why why's will with within without won't would
+wouldn't yeah yes yet you you'd you'll you're you've your yours yourself yourselves
+""".split())
+
+
+def _words(text: str) -> List[str]:
+    return WORD_PATTERN.findall(ANNOTATION_PATTERN.sub(" ", text).lower())
+
+
+def _terms(words: List[str]) -> List[str]:
+    """Content words and pairs of adjacent content words"""
+    terms = []
+    previous = None
+    for word in words:
+        if word in STOPWORDS or len(word) < 3:
+            previous = None
+            continue
+        terms.append(word)
+        if previous is not None:
+            terms.append(f"{previous} {word}")
+        previous = word
+    return terms
+
+
+def _units(segments: List[dict]) -> List[dict]:
+    """Consecutive caption segments joined into pseudo-sentences of about UNIT_WORDS words"""
+    units = []
+    texts, words, start = [], [], None
+    for segment in segments:
+        text = ANNOTATION_PATTERN.sub(" ", segment["text"]).strip()
+        if not text:
+            continue
+        if start is None:
+            start = segment["start"]
+        texts.append(text)
+        words += _words(text)
+        if len(words) >= UNIT_WORDS:
+            units.append({"start": start, "text": " ".join(texts), "terms": _terms(words)})
+            texts, words, start = [], [], None
+    if texts:
+        units.append({"start": start, "text": " ".join(texts), "terms": _terms(words)})
+    return units
+
+
+def _vectors(units: List[dict]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """(vocabulary, term counts per pseudo-sentence, IDF); terms in only one pseudo-sentence are dropped"""
+    document_frequency = {}
+    for unit in units:
+        for term in set(unit["terms"]):
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+    min_df = 2 if len(units) >= 10 else 1
+    vocabulary = [term for term, df in document_frequency.items() if df >= min_df]
+    index = {term: i for i, term in enumerate(vocabulary)}
+
+    rows, columns = [], []
+    for row, unit in enumerate(units):
+        for term in unit["terms"]:
+            column = index.get(term)
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+    counts = np.zeros((len(units), len(vocabulary)), dtype=np.float32)
+    np.add.at(counts, (np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)), 1)
+
+    df = np.array([document_frequency[term] for term in vocabulary], dtype=np.float32)
+    return vocabulary, counts, np.log((1 + len(units)) / (1 + df)) + 1
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(a, axis=-1) * np.linalg.norm(b, axis=-1)
+    return np.divide((a * b).sum(axis=-1), norms, out=np.zeros(norms.shape, dtype=np.float32), where=norms > 0)
+
+
+def _gap_scores(weights: np.ndarray, block: int) -> np.ndarray:
+    """Smoothed similarity of the blocks on either side of each gap (gap g precedes pseudo-sentence g + 1)"""
+    n = len(weights)
+    totals = np.vstack([np.zeros((1, weights.shape[1]), dtype=np.float32), np.cumsum(weights, axis=0)])
+    gaps = np.arange(1, n)
+    left = totals[gaps] - totals[np.maximum(gaps - block, 0)]
+    right = totals[np.minimum(gaps + block, n)] - totals[gaps]
+    scores = _cosine(left, right)
+    padded = np.pad(scores, 1, mode="edge")
+    return (padded[:-2] + padded[1:-1] + padded[2:]) / 3
+
+
+def _depths(scores: np.ndarray) -> np.ndarray:
+    """TextTiling depth: how far the score climbs on both sides of each gap before falling again"""
+    n = len(scores)
+    # The peak reached from a gap is the one reached from its neighbour, when the climb goes through it
+    left_peak = list(range(n))
+    for i in range(1, n):
+        if scores[i - 1] >= scores[i]:
+            left_peak[i] = left_peak[i - 1]
+    right_peak = list(range(n))
+    for i in range(n - 2, -1, -1):
+        if scores[i + 1] >= scores[i]:
+            right_peak[i] = right_peak[i + 1]
+    return scores[left_peak] + scores[right_peak] - 2 * scores
+
+
+def _boundaries(units: List[dict], scores: np.ndarray, duration: float) -> List[int]:
+    """Indexes of the pseudo-sentences that start a new chapter (after the first)"""
+    max_chapters = max(1, min(MAX_CHAPTERS, int(duration // MIN_CHAPTER_SECONDS)))
+    if max_chapters == 1 or len(scores) < 3:
+        return []
+    min_gap = max(MIN_CHAPTER_SECONDS / 2, duration / (max_chapters * 2))
+    depths = _depths(scores)
+    valleys = [
+        i for i in range(1, len(scores) - 1)
+        if scores[i] <= scores[i - 1] and scores[i] <= scores[i + 1] and depths[i] > 0
+    ]
+    cutoff = depths[valleys].mean() - depths[valleys].std() / 2 if valleys else 0
+    # Valleys past the cutoff first; shallower ones only to reach MIN_CHAPTERS
+    ranked = sorted(valleys, key=lambda i: (depths[i] <= cutoff, -depths[i]))
+
+    chosen: List[int] = []
+    for gap in ranked:
+        if len(chosen) >= max_chapters - 1:
+            break
+        if depths[gap] <= cutoff and len(chosen) >= min(MIN_CHAPTERS, max_chapters) - 1:
+            break
+        start = units[gap + 1]["start"]
+        if start < min_gap or duration - start < min_gap:
+            continue
+        if all(abs(start - units[other]["start"]) >= min_gap for other in chosen):
+            chosen.append(gap + 1)
+    return sorted(chosen)
+
+
+def _top_terms(vocabulary: List[str], scores: np.ndarray, limit: int) -> List[str]:
+    picked: List[str] = []
+    used = set()
+    for column in np.argsort(-scores)[:limit * 4]:
+        if scores[column] <= 0:
+            break
+        term = vocabulary[column]
+        # Terms sharing a word with one already picked would repeat it
+        if used & set(term.split()):
+            continue
+        picked.append(term)
+        used.update(term.split())
+        if len(picked) == limit:
+            break
+    return [term.title() for term in picked]
+
+
+def _title(terms: List[str]) -> str:
+    if not terms:
+        return "Untitled section"
+    return terms[0] if len(terms) == 1 else f"{', '.join(terms[:-1])} and {terms[-1]}"
+
+
+def _sentence(text: str, words: int = SUMMARY_WORDS) -> str:
+    parts = text.split()
+    clipped = " ".join(parts[:words]) + ("…" if len(parts) > words else "")
+    clipped = clipped[:1].upper() + clipped[1:]
+    return clipped if clipped[-1:] in ".!?…" else f"{clipped}."
+
+
+def _central(weights: np.ndarray, start: int, end: int) -> int:
+    """Index of the pseudo-sentence in [start, end) closest to their centroid"""
+    block = weights[start:end]
+    return start + int(np.argmax(_cosine(block, block.sum(axis=0, keepdims=True))))
+
+
+def extract_chapters(segments: List[dict]) -> dict:
+    """Chapters and an overall summary for transcript segments, shaped like the LLM's chapter response"""
+    units = _units(segments)
+    if not units:
+        return {"chapters": [], "overall_summary": ""}
+    duration = max(segments[-1]["start"] + segments[-1].get("duration", 0), units[-1]["start"])
+    vocabulary, counts, idf = _vectors(units)
+    weights = np.log1p(counts) * idf
+
+    block = max(1, min(BLOCK_UNITS, len(units) // 4))
+    scores = _gap_scores(weights, block) if len(units) > 1 else np.zeros(0, dtype=np.float32)
+    starts = [0] + _boundaries(units, scores, duration)
+    ends = starts[1:] + [len(units)]
+
+    # Terms weighted by how much of their use falls in the chapter
+    chapter_counts = np.add.reduceat(counts, starts, axis=0)
+    totals = counts.sum(axis=0)
+    concentration = np.log1p(chapter_counts) * idf * (chapter_counts / np.maximum(totals, 1))
+
+    chapters = []
+    for number, (start, end) in enumerate(zip(starts, ends)):
+        chapters.append({
+            "timestamp_seconds": 0 if number == 0 else int(units[start]["start"]),
+            "title": _title(_top_terms(vocabulary, concentration[number], TITLE_TERMS)),
+            "summary": _sentence(units[_central(weights, start, end)]["text"])
+        })
+
+    topics = _top_terms(vocabulary, np.log1p(totals) * idf, 5)
+    overall = _sentence(units[_central(weights, 0, len(units))]["text"])
+    if topics:
+        overall += f" Topics: {', '.join(topics)}."
+    return {"chapters": chapters, "overall_summary": overall}
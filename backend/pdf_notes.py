@@ -0,0 +1,192 @@
+"""
+PDF ingestion and retrieval for note questions.
+
+Each note PDF is downloaded once, its text is extracted page by page and
+split into chunks, and a small BM25 index over the chunks is cached by
+content hash (with a URL -> hash mapping in front). Questions then only
+send the most relevant chunks to the model, and repeat questions on the
+same note never download or parse the PDF again.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import re
+import tempfile
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+import httpx
+from pypdf import PdfReader
+
+from cache import cache
+from deadlines import bounded, shared
+
+PDF_URL_NAMESPACE = "pdf_url"
+PDF_INDEX_NAMESPACE = "pdf_index"
+PDF_URL_TTL_SECONDS = int(os.getenv("PDF_URL_CACHE_TTL", 7 * 24 * 3600))
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", 50 * 1024 * 1024))
+PDF_CHUNK_CHARS = int(os.getenv("PDF_CHUNK_CHARS", 1500))
+PDF_CONTEXT_CHARS = int(os.getenv("PDF_CONTEXT_CHARS", 12000))
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "in", "is", "it", "of", "on", "or", "that", "the", "this", "to", "was", "what",
+    "when", "where", "which", "who", "why", "with", "explain", "please", "tell", "me"
+}
+
+# Ingestions currently running, so concurrent questions share one download
+_inflight: dict = {}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+async def _download_pdf(url: str, path: str) -> str:
+    """Stream the PDF to disk and return its SHA-256"""
+    digest = hashlib.sha256()
+    size = 0
+    async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
+        async with client.stream("GET", url) as response:
+            if not response.is_success:
+                raise ValueError(f"PDF download failed: {response.status_code}")
+            with open(path, "wb") as f:
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > PDF_MAX_BYTES:
+                        raise ValueError(f"PDF is larger than {PDF_MAX_BYTES} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+    return digest.hexdigest()
+
+
+def _chunk_page(page_number: int, text: str) -> List[dict]:
+    """Split one page's text into roughly PDF_CHUNK_CHARS-sized chunks on paragraph breaks"""
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) > PDF_CHUNK_CHARS:
+            chunks.append({"page": page_number, "text": current})
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+        while len(current) > PDF_CHUNK_CHARS * 2:
+            chunks.append({"page": page_number, "text": current[:PDF_CHUNK_CHARS]})
+            current = current[PDF_CHUNK_CHARS:]
+    if current:
+        chunks.append({"page": page_number, "text": current})
+    return chunks
+
+
+def _build_index(path: str) -> dict:
+    """Extract text page by page and build the chunk index"""
+    reader = PdfReader(path)
+    chunks = []
+    postings: Dict[str, Dict[int, int]] = {}
+    lengths = []
+    # Pages are parsed lazily, one at a time, so memory follows the
+    # largest page rather than the whole document
+    for page_number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text() or ""
+        for chunk in _chunk_page(page_number, text):
+            chunk_id = len(chunks)
+            terms = Counter(tokenize(chunk["text"]))
+            for term, count in terms.items():
+                postings.setdefault(term, {})[chunk_id] = count
+            lengths.append(sum(terms.values()))
+            chunks.append(chunk)
+    return {
+        "page_count": len(reader.pages),
+        "chunks": chunks,
+        "lengths": lengths,
+        # JSON object keys must be strings
+        "postings": {term: {str(k): v for k, v in docs.items()} for term, docs in postings.items()}
+    }
+
+
+# Decoded indexes kept in memory, most recently used last
+_loaded_indexes: "OrderedDict[str, dict]" = OrderedDict()
+LOADED_INDEX_LIMIT = 32
+
+
+def _load_index(content_hash: str) -> Optional[dict]:
+    index = _loaded_indexes.get(content_hash)
+    if index is not None:
+        _loaded_indexes.move_to_end(content_hash)
+        return index
+    index = cache.get(PDF_INDEX_NAMESPACE, content_hash)
+    if index is not None:
+        _loaded_indexes[content_hash] = index
+        if len(_loaded_indexes) > LOADED_INDEX_LIMIT:
+            _loaded_indexes.popitem(last=False)
+    return index
+
+
+async def _ingest(url: str) -> str:
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        content_hash = await _download_pdf(url, path)
+        if cache.get(PDF_INDEX_NAMESPACE, content_hash) is None:
+            print(f"📄 Indexing PDF {url}")
+            index = await asyncio.to_thread(_build_index, path)
+            cache.set(PDF_INDEX_NAMESPACE, content_hash, index)
+            print(f"✓ Indexed {index['page_count']} pages into {len(index['chunks'])} chunks")
+        cache.set(PDF_URL_NAMESPACE, url, content_hash, ttl=PDF_URL_TTL_SECONDS)
+        return content_hash
+    finally:
+        os.remove(path)
+
+
+async def ensure_pdf_indexed(url: str) -> str:
+    """Return the content hash of an indexed PDF, ingesting it on first use"""
+    content_hash = cache.get(PDF_URL_NAMESPACE, url)
+    if content_hash is not None and _load_index(content_hash) is not None:
+        return content_hash
+
+    return await bounded(shared(_inflight, url, lambda: _ingest(url)), "PDF download")
+
+
+def search_chunks(index: dict, question: str, max_chars: int = PDF_CONTEXT_CHARS) -> List[dict]:
+    """Pick the chunks most relevant to the question (BM25), within a character budget"""
+    chunks = index["chunks"]
+    if not chunks:
+        return []
+    lengths = index["lengths"]
+    avg_length = (sum(lengths) / len(lengths)) or 1
+    k1, b = 1.5, 0.75
+
+    scores: Dict[int, float] = {}
+    for term in set(tokenize(question)):
+        docs = index["postings"].get(term)
+        if not docs:
+            continue
+        idf = math.log(1 + (len(chunks) - len(docs) + 0.5) / (len(docs) + 0.5))
+        for chunk_id, tf in docs.items():
+            chunk_id = int(chunk_id)
+            norm = tf + k1 * (1 - b + b * lengths[chunk_id] / avg_length)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (k1 + 1) / norm
+
+    # Nothing matched: fall back to the start of the document
+    ranked = sorted(scores, key=scores.get, reverse=True) or list(range(len(chunks)))
+
+    selected = []
+    used = 0
+    for chunk_id in ranked:
+        length = len(chunks[chunk_id]["text"])
+        if used + length > max_chars and selected:
+            break
+        selected.append(chunk_id)
+        used += length
+    return [chunks[chunk_id] for chunk_id in sorted(selected)]
+
+
+async def get_pdf_context(url: str, question: str) -> str:
+    """Return the relevant PDF excerpts for a question, tagged with page numbers"""
+    content_hash = await ensure_pdf_indexed(url)
+    index = _load_index(content_hash)
+    excerpts = search_chunks(index, question)
+    return "\n\n".join(f"[Page {chunk['page']}]\n{chunk['text']}" for chunk in excerpts)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Precompute AI solutions for an exported question list.
+
+Fills the /ai-question-solution response cache ahead of exam week so
+student requests are served from cache. Accepts a JSON array or a CSV
+export with question_title (or title), question_content (or question)
+and optional question_type columns.
+
+Usage:
+    python precompute_solutions.py questions.json --concurrency 4
+"""
+import argparse
+import asyncio
+import csv
+import json
+import time
+
+from main import build_solution_prompt, solution_key
+from providers import generate, GEMINI_DEFAULT_MODEL, OPENROUTER_DEFAULT_MODEL
+from response_cache import solution_cache, RESPONSE_CACHE_FRESH_TTL_SECONDS
+
+
+def load_questions(path: str) -> list:
+    """Read a JSON or CSV export into (title, content, type) tuples"""
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = json.load(f)
+
+    questions = []
+    for row in rows:
+        content = row.get("question_content") or row.get("question") or row.get("content")
+        if not content:
+            continue
+        title = row.get("question_title") or row.get("title") or ""
+        question_type = row.get("question_type") or "theory"
+        questions.append((title, content, question_type))
+    return questions
+
+
+def is_fresh(key: str) -> bool:
+    entry = solution_cache.get_entry(key)
+    return entry is not None and entry["created_at"] + RESPONSE_CACHE_FRESH_TTL_SECONDS > time.time()
+
+
+async def precompute(questions: list, provider: str, concurrency: int, force: bool) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"cached": 0, "computed": 0, "failed": 0}
+    model = GEMINI_DEFAULT_MODEL if provider == "gemini" else OPENROUTER_DEFAULT_MODEL
+
+    async def run(index: int, question: tuple):
+        title, content, question_type = question
+        key = solution_key(title, content, question_type, model)
+        label = f"[{index + 1}/{len(questions)}] {(title or content)[:60]}"
+        if not force and is_fresh(key):
+            counts["cached"] += 1
+            return
+        async with semaphore:
+            try:
+                # Stale entries are recomputed here rather than in the background
+                solution, used_provider = await generate(
+                    build_solution_prompt(title, content, question_type),
+                    provider=provider,
+                    endpoint="/ai-question-solution"
+                )
+                solution_cache.put(key, solution)
+                counts["computed"] += 1
+                print(f"✓ {label} ({used_provider})")
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"❌ {label}: {str(e)[:200]}")
+
+    await asyncio.gather(*(run(i, q) for i, q in enumerate(questions)))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute AI solutions into the response cache")
+    parser.add_argument("input", help="JSON or CSV export of questions")
+    parser.add_argument("--provider", default="gemini", choices=["gemini", "openrouter"])
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum parallel AI calls")
+    parser.add_argument("--force", action="store_true", help="Recompute even when a cached solution exists")
+    args = parser.parse_args()
+
+    questions = load_questions(args.input)
+    print(f"📚 Precomputing {len(questions)} solutions with concurrency {args.concurrency}")
+    start = time.monotonic()
+    counts = asyncio.run(precompute(questions, args.provider, args.concurrency, args.force))
+    print(f"Done in {time.monotonic() - start:.1f}s: {counts}")
+
+
+if __name__ == "__main__":
+    main()
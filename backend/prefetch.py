@@ -0,0 +1,210 @@
+"""
+Speculative prefetch of chapters, summary and quiz.
+
+A student who opens a lecture (/video-info, /transcript) usually taps
+"Chapters" or "Quiz" next, and that tap used to start the whole pipeline
+cold. With PREFETCH_ENABLED=true, those requests queue a background
+export of the video's artifact (artifacts.py) instead, so the
+follow-up request is answered from it. A follow-up that arrives while
+its prefetch is still running waits for it rather than generating the
+same content a second time.
+
+Prefetching is speculative, so it gives way to real traffic:
+
+- one video at a time per worker, at most PREFETCH_QUEUE_LIMIT queued,
+  each video at most once per PREFETCH_WINDOW seconds
+- it waits while this worker has more than PREFETCH_MAX_ACTIVE_REQUESTS
+  requests in progress, and its provider calls are in the scheduler's
+  preemptible background class (scheduler.py)
+- it is not started, and a running one is cancelled, when quota gets
+  tight: the provider's key pool has less than PREFETCH_MIN_HEADROOM of
+  its per-minute quota free, the artifact endpoints are past their
+  soft budget, or prefetch has spent PREFETCH_BUDGET USD today (its
+  calls are recorded under "prefetch" in the usage ledger)
+
+The hit rate is the share of prefetched videos whose follow-up request
+found the artifact ready. Late and unused prefetches are counted too.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import artifacts
+import metrics
+import scheduler
+import usage
+from cache import cache
+from credentials import gemini_pool, openrouter_pool
+from deadlines import active_requests, bounded
+from metadata import get_video_metadata
+from transcripts import fetch_transcript
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"
+PREFETCH_NAMESPACE = "prefetch"
+PREFETCH_ENDPOINT = "prefetch"
+PREFETCH_BUDGET_USD = float(os.getenv("PREFETCH_BUDGET", 0.5))
+PREFETCH_QUEUE_LIMIT = int(os.getenv("PREFETCH_QUEUE_LIMIT", 16))
+PREFETCH_MIN_HEADROOM = float(os.getenv("PREFETCH_MIN_HEADROOM", 0.5))
+PREFETCH_MAX_ACTIVE_REQUESTS = int(os.getenv("PREFETCH_MAX_ACTIVE_REQUESTS", 4))
+# A video is prefetched at most once per window, and a follow-up within it counts toward the hit rate
+PREFETCH_WINDOW_SECONDS = int(os.getenv("PREFETCH_WINDOW", 3600))
+# How often a running prefetch checks whether quota got tight
+WATCH_SECONDS = 1.0
+# Endpoints whose budgets the exported artifact is generated under
+BUDGET_ENDPOINTS = ("/lecture-bundle", "/analyze", "/generate-quiz")
+
+# (transcript, video_title, provider) -> artifact hash (main.export_artifact)
+Exporter = Callable[[dict, str, str], Awaitable[str]]
+
+
+def quota_tight(provider: str) -> Optional[str]:
+    """Why prefetching should stop now, or None"""
+    pool = gemini_pool if provider == "gemini" else openrouter_pool
+    if pool.configured and pool.headroom() < PREFETCH_MIN_HEADROOM:
+        return "key_quota"
+    if any(usage.budget_state(endpoint) != "ok" for endpoint in BUDGET_ENDPOINTS):
+        return "endpoint_budget"
+    if usage.spent_today(PREFETCH_ENDPOINT) >= PREFETCH_BUDGET_USD:
+        return "prefetch_budget"
+    return None
+
+
+class Prefetcher:
+    """Per-worker queue of speculative artifact exports"""
+
+    def __init__(self, export: Exporter):
+        self.export = export
+        # video_id -> (provider, video title, languages)
+        self._queue: "OrderedDict[str, Tuple[str, Optional[str], Tuple[str, ...]]]" = OrderedDict()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._worker: Optional[asyncio.Task] = None
+
+    def schedule(
+        self,
+        video_id: str,
+        provider: str = "gemini",
+        video_title: Optional[str] = None,
+        languages: Optional[List[str]] = None
+    ) -> bool:
+        """Queue a prefetch for a video that was just opened; False when it is not worth one"""
+        if not PREFETCH_ENABLED:
+            return False
+        if video_id in self._queue or video_id in self._running:
+            return False
+        if cache.get(PREFETCH_NAMESPACE, video_id) is not None:
+            metrics.incr("prefetch", "skipped_recent")
+            return False
+        if len(self._queue) >= PREFETCH_QUEUE_LIMIT:
+            metrics.incr("prefetch", "dropped_queue_full")
+            return False
+        reason = quota_tight(provider)
+        if reason is not None:
+            metrics.incr("prefetch", f"skipped_{reason}")
+            return False
+
+        self._queue[video_id] = (provider, video_title, tuple(languages or ()))
+        cache.set(PREFETCH_NAMESPACE, video_id, {"state": "queued", "queued_at": time.time()}, ttl=PREFETCH_WINDOW_SECONDS)
+        metrics.incr("prefetch", "queued")
+        if self._worker is None or self._worker.done():
+            # A fresh context: the prefetch must not inherit the triggering
+            # request's deadline or usage attribution
+            self._worker = asyncio.get_running_loop().create_task(self._work(), context=contextvars.Context())
+        return True
+
+    async def join(self, video_id: str):
+        """Wait (within the request's deadline) for a prefetch of the video running in this worker"""
+        task = self._running.get(video_id)
+        if task is None:
+            return
+        metrics.incr("prefetch", "joined")
+        try:
+            await bounded(asyncio.shield(task), "prefetch")
+        except (asyncio.CancelledError, Exception):
+            if not task.done():
+                # This request was cancelled or ran out of time
+                raise
+            # The prefetch failed or was cancelled: the request generates on its own
+
+    def observe(self, video_id: str, hit: bool):
+        """Count the first follow-up request for a prefetched video as a hit or a late prefetch"""
+        entry = cache.get(PREFETCH_NAMESPACE, video_id)
+        if entry is None or entry.get("followed_up"):
+            return
+        metrics.incr("prefetch", "hits" if hit else "late")
+        cache.set(PREFETCH_NAMESPACE, video_id, {**entry, "followed_up": True}, ttl=PREFETCH_WINDOW_SECONDS)
+
+    async def _work(self):
+        while self._queue:
+            while active_requests() > PREFETCH_MAX_ACTIVE_REQUESTS:
+                await asyncio.sleep(WATCH_SECONDS)
+            video_id, (provider, video_title, languages) = self._queue.popitem(last=False)
+            reason = quota_tight(provider)
+            if reason is not None:
+                # Quota is short for everything still queued as well
+                skipped = [video_id] + list(self._queue)
+                self._queue.clear()
+                for skipped_id in skipped:
+                    cache.delete(PREFETCH_NAMESPACE, skipped_id)
+                metrics.incr("prefetch", f"skipped_{reason}", len(skipped))
+                return
+
+            task = asyncio.get_running_loop().create_task(self._prefetch(video_id, provider, video_title, languages))
+            self._running[video_id] = task
+            try:
+                await self._watch(task, provider)
+            finally:
+                del self._running[video_id]
+
+    async def _watch(self, task: asyncio.Task, provider: str):
+        while not task.done():
+            await asyncio.wait({task}, timeout=WATCH_SECONDS)
+            reason = None if task.done() else quota_tight(provider)
+            if reason is not None:
+                task.cancel()
+                metrics.incr("prefetch", f"cancelled_{reason}")
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            print(f"⚠️  Prefetch failed: {str(detail)[:200]}")
+            metrics.incr("prefetch", "failed")
+
+    async def _prefetch(self, video_id: str, provider: str, video_title: Optional[str], languages: Tuple[str, ...]):
+        started = time.monotonic()
+        transcript = await fetch_transcript(video_id, list(languages) or None)
+        loaded = artifacts.load_artifact(video_id)
+        if loaded is not None and loaded[1]["transcript_hash"] == transcript["content_hash"]:
+            metrics.incr("prefetch", "already_current")
+            return
+        if video_title is None:
+            video_title = (await get_video_metadata(video_id)).get("title") or ""
+        with usage.attributed_to(PREFETCH_ENDPOINT), scheduler.priority("background"):
+            await self.export(transcript, video_title, provider)
+        entry = cache.get(PREFETCH_NAMESPACE, video_id) or {}
+        cache.set(PREFETCH_NAMESPACE, video_id, {**entry, "state": "done"}, ttl=PREFETCH_WINDOW_SECONDS)
+        metrics.incr("prefetch", "completed")
+        metrics.observe_latency("prefetch", time.monotonic() - started)
+        print(f"🔮 Prefetched chapters and quiz for {video_id}")
+
+    def report(self) -> dict:
+        counters = metrics.snapshot()["counters"].get("prefetch", {})
+        hits = counters.get("hits", 0)
+        late = counters.get("late", 0)
+        completed = counters.get("completed", 0)
+        return {
+            "enabled": PREFETCH_ENABLED,
+            "queued": list(self._queue),
+            "running": list(self._running),
+            "budget_usd": PREFETCH_BUDGET_USD,
+            "spent_today_usd": round(usage.spent_today(PREFETCH_ENDPOINT), 6),
+            # Follow-ups that found the prefetched artifact ready
+            "hit_rate": round(hits / (hits + late), 3) if hits + late else None,
+            # Prefetches that a follow-up request used
+            "used_rate": round(hits / completed, 3) if completed else None,
+            "counters": counters
+        }
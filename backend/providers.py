@@ -0,0 +1,328 @@
+"""
+LLM provider calls shared by all endpoints.
+
+`generate` runs a prompt on Gemini with automatic fallback to OpenRouter
+when Gemini's quota is exhausted. It can also hedge: if Gemini has not
+answered within a percentile-based delay, the same prompt is sent to
+OpenRouter, the first valid answer wins and the other call is cancelled.
+Hedging is capped to a fraction of recent traffic. API keys are drawn
+from the credential pools in credentials.py. Every call's token usage
+goes to the ledger in usage.py, and an endpoint past its hard daily
+budget gets no new calls. Each call waits for a slot from its
+provider's scheduler (scheduler.py) first.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, Tuple
+
+import google.genai as genai
+import httpx
+from fastapi import HTTPException
+from google.genai import types
+
+import metrics
+import model_policy
+import scheduler
+import usage
+from credentials import gemini_pool, is_quota_error, is_rate_limit_error, openrouter_pool
+from deadlines import bounded
+
+GEMINI_DEFAULT_MODEL = model_policy.MODELS["gemini"]["default"][0]
+OPENROUTER_DEFAULT_MODEL = model_policy.MODELS["openrouter"]["default"][0]
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+# Hedge once Gemini is slower than this percentile of its recent latencies
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY", 2.0))
+# Delay used until enough latency samples have been collected
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("HEDGE_DEFAULT_DELAY", 10.0))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+# At most this fraction of recent requests may send a hedge
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", 0.1))
+HEDGE_BUDGET_WINDOW = int(os.getenv("HEDGE_BUDGET_WINDOW", 200))
+
+
+def is_valid_json(text: str) -> bool:
+    try:
+        json.loads(text)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+async def call_gemini_text(prompt: str, model: str = GEMINI_DEFAULT_MODEL, json_mode: bool = False) -> str:
+    """Run a prompt on Gemini and return the response text"""
+    with gemini_pool.lease(is_rate_limit_error) as credential:
+        try:
+            client = genai.Client(api_key=credential.key)
+            config = types.GenerateContentConfig(response_mime_type="application/json") if json_mode else None
+            response = await client.aio.models.generate_content(
+                model=model,
+                contents=prompt,
+                config=config
+            )
+            usage.record_gemini(model, response, prompt)
+            return response.text
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Gemini API error: {str(e)}")
+
+
+async def call_openrouter_text(
+    prompt: str,
+    model: str = OPENROUTER_DEFAULT_MODEL,
+    json_mode: bool = False,
+    timeout: float = 60.0
+) -> str:
+    """Run a prompt on OpenRouter and return the response text"""
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}]
+    }
+    if json_mode:
+        payload["response_format"] = {"type": "json_object"}
+    # Ask for token counts and the charged cost in the response
+    payload["usage"] = {"include": True}
+
+    with openrouter_pool.lease(is_rate_limit_error) as credential:
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            try:
+                print(f"🔄 Calling OpenRouter API with model: {model}")
+                response = await client.post(
+                    OPENROUTER_URL,
+                    headers={
+                        "Authorization": f"Bearer {credential.key}",
+                        "HTTP-Referer": "http://localhost:8000",
+                        "Content-Type": "application/json"
+                    },
+                    json=payload
+                )
+
+                if not response.is_success:
+                    error_text = response.text
+                    print(f"❌ OpenRouter API error: {response.status_code} - {error_text}")
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"OpenRouter API error: {response.status_code} - {error_text[:200]}"
+                    )
+
+                result = response.json()
+                if "error" in result:
+                    error_msg = result["error"].get("message", str(result["error"]))
+                    print(f"❌ OpenRouter returned error: {error_msg}")
+                    raise HTTPException(status_code=500, detail=f"OpenRouter error: {error_msg}")
+
+                text = result["choices"][0]["message"]["content"]
+                usage.record_openrouter(model, result, prompt, text)
+                return text
+
+            except httpx.HTTPError as e:
+                print(f"❌ HTTP error calling OpenRouter: {str(e)}")
+                raise HTTPException(status_code=500, detail=f"OpenRouter API error: {str(e)}")
+            except (KeyError, IndexError, ValueError) as e:
+                print(f"❌ Failed to parse OpenRouter response: {str(e)}")
+                raise HTTPException(status_code=500, detail=f"Failed to parse AI response: {str(e)}")
+
+
+class HedgeBudget:
+    """Tracks which of the last N requests were hedged"""
+
+    def __init__(self, fraction: float, window: int):
+        self.fraction = fraction
+        self.recent = deque(maxlen=window)
+
+    def record_request(self):
+        self.recent.append(False)
+
+    def try_spend(self) -> bool:
+        """Mark the latest request as hedged if the budget allows it"""
+        if not self.recent:
+            return False
+        hedged = sum(self.recent)
+        if (hedged + 1) / len(self.recent) > self.fraction:
+            return False
+        self.recent[-1] = True
+        return True
+
+
+hedge_budget = HedgeBudget(HEDGE_BUDGET, HEDGE_BUDGET_WINDOW)
+
+
+def hedge_delay(endpoint: str) -> float:
+    observed = metrics.latency_percentile(f"gemini:{endpoint}", HEDGE_PERCENTILE, min_samples=HEDGE_MIN_SAMPLES)
+    if observed is None:
+        return HEDGE_DEFAULT_DELAY_SECONDS
+    return max(observed, HEDGE_MIN_DELAY_SECONDS)
+
+
+async def _timed(
+    provider: str,
+    endpoint: str,
+    call: Callable[[], Awaitable[str]],
+    model: Optional[str] = None,
+    input_tokens: int = 0
+) -> str:
+    async def scheduled() -> str:
+        # Latency is measured from when the call got its slot, not from when it was queued
+        async with scheduler.slot(provider, endpoint):
+            start = time.monotonic()
+            try:
+                result = await call()
+            except asyncio.CancelledError:
+                # A hedged call cancelled while still running took at least this long;
+                # dropping it would bias the percentile towards fast calls
+                metrics.observe_latency(f"{provider}:{endpoint}", time.monotonic() - start)
+                if model:
+                    model_policy.observe(model, input_tokens, time.monotonic() - start)
+                raise
+            metrics.observe_latency(f"{provider}:{endpoint}", time.monotonic() - start)
+            if model:
+                model_policy.observe(model, input_tokens, time.monotonic() - start)
+            return result
+
+    # The request's deadline (see deadlines.py) bounds every provider call, queueing included
+    return await bounded(scheduled(), f"{provider} call")
+
+
+async def _hedged(
+    endpoint: str,
+    primary: Callable[[], Awaitable[str]],
+    secondary: Callable[[], Awaitable[str]],
+    validate: Callable[[str], bool],
+    models: Tuple[Optional[str], Optional[str]] = (None, None),
+    input_tokens: int = 0
+) -> Tuple[str, str]:
+    """
+    Run primary; if it is slower than the hedge delay, also run secondary.
+    Returns (text, provider) from the first valid answer.
+    """
+    hedge_budget.record_request()
+    metrics.incr("hedge", "requests")
+    primary_task = asyncio.ensure_future(_timed("gemini", endpoint, primary, models[0], input_tokens))
+    try:
+        done, _ = await asyncio.wait({primary_task}, timeout=hedge_delay(endpoint))
+        if done:
+            return primary_task.result(), "gemini"
+
+        if not hedge_budget.try_spend():
+            metrics.incr("hedge", "budget_denied")
+            return await primary_task, "gemini"
+
+        print(f"⏱️  Gemini slow for {endpoint}, hedging to OpenRouter...")
+        metrics.incr("hedge", "hedged")
+        secondary_task = asyncio.ensure_future(_timed("openrouter", endpoint, secondary, models[1], input_tokens))
+        tasks = {primary_task: "gemini", secondary_task: "openrouter"}
+        pending = set(tasks)
+        first_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and validate(task.result()):
+                        metrics.incr("hedge", f"{tasks[task]}_won")
+                        return task.result(), tasks[task]
+                    if task is primary_task or first_error is None:
+                        first_error = task.exception() or HTTPException(
+                            status_code=500, detail=f"Invalid response from {tasks[task]}"
+                        )
+            raise first_error
+        finally:
+            secondary_task.cancel()
+    finally:
+        primary_task.cancel()
+
+
+async def generate(
+    prompt: str,
+    provider: str = "gemini",
+    endpoint: str = "unknown",
+    json_mode: bool = False,
+    gemini_model: Optional[str] = None,
+    openrouter_model: Optional[str] = None,
+    openrouter_timeout: float = 60.0,
+    gemini_call: Optional[Callable[[], Awaitable[str]]] = None
+) -> Tuple[str, str]:
+    """
+    Run a prompt and return (text, used_provider).
+    Gemini falls back to OpenRouter on quota errors and may be hedged;
+    gemini_call overrides how the Gemini leg is made (e.g. with a context
+    cache) and should use gemini_model. Models that are not given are
+    picked per request by model_policy.
+    """
+    if usage.budget_state(endpoint) == "hard":
+        metrics.incr("budget", f"refused:{endpoint}")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Today's AI budget for {endpoint} is used up; only cached results are available until it resets",
+            headers={"Retry-After": str(usage.seconds_until_tomorrow())}
+        )
+    with usage.attributed_to(endpoint):
+        return await _generate(
+            prompt, provider, endpoint, json_mode, gemini_model, openrouter_model, openrouter_timeout, gemini_call
+        )
+
+
+async def _generate(
+    prompt: str,
+    provider: str,
+    endpoint: str,
+    json_mode: bool,
+    gemini_model: Optional[str],
+    openrouter_model: Optional[str],
+    openrouter_timeout: float,
+    gemini_call: Optional[Callable[[], Awaitable[str]]]
+) -> Tuple[str, str]:
+    input_tokens = len(prompt) // 4
+    # Per-endpoint prompt size, so flows can be compared by tokens sent (see bench_bundle.py)
+    metrics.incr("prompt_tokens", endpoint, input_tokens)
+    metrics.incr("llm_calls", endpoint)
+    gemini_model = gemini_model or model_policy.select_model("gemini", endpoint, input_tokens)
+    openrouter_model = openrouter_model or model_policy.select_model("openrouter", endpoint, input_tokens)
+
+    def openrouter_call():
+        return call_openrouter_text(prompt, openrouter_model, json_mode, openrouter_timeout)
+
+    if provider != "gemini":
+        return await _timed("openrouter", endpoint, openrouter_call, openrouter_model, input_tokens), "openrouter"
+
+    if gemini_call is None:
+        def gemini_call():
+            return call_gemini_text(prompt, gemini_model, json_mode)
+
+    validate = is_valid_json if json_mode else (lambda text: bool(text and text.strip()))
+
+    try:
+        if HEDGE_ENABLED and openrouter_pool.configured:
+            return await _hedged(
+                endpoint, gemini_call, openrouter_call, validate,
+                models=(gemini_model, openrouter_model), input_tokens=input_tokens
+            )
+        return await _timed("gemini", endpoint, gemini_call, gemini_model, input_tokens), "gemini"
+    except HTTPException as e:
+        if not is_quota_error(str(e.detail)):
+            raise
+        error = e.detail
+    except Exception as e:
+        if not is_quota_error(str(e)):
+            raise HTTPException(status_code=500, detail=f"Gemini API error: {str(e)}")
+        error = str(e)
+
+    print(f"⚠️  Gemini quota exceeded for {endpoint}, falling back to OpenRouter...")
+    if not openrouter_pool.configured:
+        raise HTTPException(
+            status_code=503,
+            detail="Gemini quota exceeded. Please configure OPENROUTER_API_KEY in .env for automatic fallback, or wait for quota reset."
+        )
+    try:
+        text = await _timed("openrouter", endpoint, openrouter_call, openrouter_model, input_tokens)
+    except Exception as fallback_error:
+        detail = fallback_error.detail if isinstance(fallback_error, HTTPException) else str(fallback_error)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Gemini quota exceeded and OpenRouter fallback failed. Please try again later. Error: {detail}"
+        )
+    print(f"✓ Successfully used OpenRouter as fallback for {endpoint} ({str(error)[:100]})")
+    return text, "openrouter (fallback)"
@@ -0,0 +1,180 @@
+"""
+Quiz generation that covers the whole lecture.
+
+The video is split into up to QUIZ_MAX_PARTS consecutive parts, candidate
+questions are generated for every part concurrently (at most
+QUIZ_PARALLELISM calls at a time), and the candidates are merged:
+near-duplicate questions are dropped and the final questions are picked
+round-robin across parts so every part of the video is represented.
+Because the parts run in parallel, wall-clock time stays close to a
+single call.
+"""
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+import metrics
+from providers import generate
+from response_cache import normalize_text
+from summaries import split_windows, format_outline
+
+QUIZ_QUESTIONS = 5
+QUIZ_MAX_PARTS = int(os.getenv("QUIZ_MAX_PARTS", 5))
+QUIZ_PARALLELISM = int(os.getenv("QUIZ_PARALLELISM", 5))
+# Transcript characters sent per part (the old single-call limit)
+QUIZ_PART_CHARS = 8000
+# Questions sharing at least this fraction of content words count as duplicates
+QUIZ_DUPLICATE_SIMILARITY = 0.7
+
+
+def build_quiz_prompt(video_title: str, source: str, text: str, count: int = QUIZ_QUESTIONS, part: Optional[str] = None) -> str:
+    """Prompt for count multiple-choice questions on text (a transcript or section summaries)"""
+    scope = f"\nThis is part {part} of the video; only ask about this part.\n" if part else ""
+    return f"""Based on the following {source}, generate a quiz with {count} multiple-choice questions.
+
+Video Title: {video_title}
+{scope}
+{source.title()}:
+{text}
+
+Create questions that:
+- Test understanding of KEY CONCEPTS actually discussed in the video
+- Cover different parts of the video content
+- Have 4 options (A, B, C, D) where only one is correct
+- Include the correct answer
+
+Return ONLY a JSON array with this exact structure (no additional text):
+[
+  {{
+    "question": "What is...",
+    "options": ["A) First option", "B) Second option", "C) Third option", "D) Fourth option"],
+    "correct": "A"
+  }}
+]"""
+
+
+def _truncate(text: str, limit: int = QUIZ_PART_CHARS) -> str:
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+def _split_evenly(items: list, parts: int) -> List[list]:
+    size = math.ceil(len(items) / parts)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def quiz_parts(transcript: dict, sections: Optional[List[dict]] = None) -> List[dict]:
+    """
+    Split the video into parts of {"label", "source", "text"}. Section
+    summaries are used when available, raw transcript text otherwise.
+    """
+    units = sections or split_windows(transcript["segments"])
+    if len(units) <= 1:
+        text = " ".join(segment["text"] for segment in transcript["segments"])
+        return [{"label": None, "source": "video transcript", "text": _truncate(text)}]
+
+    groups = _split_evenly(units, min(QUIZ_MAX_PARTS, len(units)))
+    parts = []
+    for i, group in enumerate(groups):
+        label = f"{i + 1} of {len(groups)}"
+        if sections:
+            parts.append({"label": label, "source": "video section summaries", "text": format_outline(group)})
+        else:
+            text = "\n".join(window["text"] for window in group)
+            parts.append({"label": label, "source": "video transcript", "text": _truncate(text)})
+    return parts
+
+
+def _words(question: dict) -> set:
+    """Content words of a question (short words like 'what', 'is', 'the' are ignored)"""
+    return {word for word in re.findall(r"\w+", normalize_text(str(question.get("question", "")))) if len(word) > 3}
+
+
+def _is_duplicate(question: dict, chosen: List[dict]) -> bool:
+    words = _words(question)
+    for other in chosen:
+        other_words = _words(other)
+        union = words | other_words
+        if union and len(words & other_words) / len(union) >= QUIZ_DUPLICATE_SIMILARITY:
+            return True
+    return False
+
+
+def merge_questions(candidates: List[List[dict]], count: int = QUIZ_QUESTIONS) -> List[dict]:
+    """Pick count questions round-robin across parts, skipping near-duplicates"""
+    queues = [list(part) for part in candidates]
+    chosen = []
+    positions = []
+    while len(chosen) < count and any(queues):
+        for part_index, queue in enumerate(queues):
+            while queue:
+                question = queue.pop(0)
+                if isinstance(question, dict) and question.get("question") and not _is_duplicate(question, chosen):
+                    chosen.append(question)
+                    positions.append(part_index)
+                    break
+            if len(chosen) == count:
+                break
+    # Keep the quiz in video order
+    return [question for _, question in sorted(zip(positions, chosen), key=lambda pair: pair[0])]
+
+
+async def _generate_part(video_title: str, part: dict, count: int, provider: str, semaphore: asyncio.Semaphore) -> List[dict]:
+    async with semaphore:
+        started = time.perf_counter()
+        text, used_provider = await generate(
+            build_quiz_prompt(video_title, part["source"], part["text"], count, part["label"]),
+            provider=provider,
+            endpoint="/generate-quiz",
+            json_mode=True
+        )
+        metrics.observe_latency("/generate-quiz:part", time.perf_counter() - started)
+    questions = json.loads(text)
+    if isinstance(questions, dict):
+        # Some models wrap the array in an object
+        questions = next((value for value in questions.values() if isinstance(value, list)), [])
+    return questions
+
+
+async def generate_quiz_questions(
+    transcript: dict,
+    video_title: str,
+    provider: str = "gemini",
+    sections: Optional[List[dict]] = None
+) -> List[dict]:
+    """Generate a QUIZ_QUESTIONS-question quiz balanced across the video"""
+    parts = quiz_parts(transcript, sections)
+    # One spare question per part leaves room for dropping duplicates
+    per_part = math.ceil(QUIZ_QUESTIONS / len(parts)) + (1 if len(parts) > 1 else 0)
+    semaphore = asyncio.Semaphore(QUIZ_PARALLELISM)
+    results = await asyncio.gather(
+        *(_generate_part(video_title, part, per_part, provider, semaphore) for part in parts),
+        return_exceptions=True
+    )
+
+    candidates = []
+    errors = []
+    for result in results:
+        if isinstance(result, BaseException):
+            errors.append(result)
+            candidates.append([])
+        else:
+            candidates.append(result)
+    if errors:
+        metrics.incr("quiz", "failed_parts", len(errors))
+        print(f"⚠️  {len(errors)} of {len(parts)} quiz parts failed: {str(errors[0])[:200]}")
+    if len(errors) == len(parts):
+        error = errors[0]
+        if isinstance(error, HTTPException):
+            raise error
+        raise HTTPException(status_code=500, detail=f"Failed to parse AI response: {str(error)}")
+
+    quiz = merge_questions(candidates)
+    metrics.incr("quiz", "parts", len(parts))
+    metrics.incr("quiz", "candidates", sum(len(c) for c in candidates))
+    return quiz
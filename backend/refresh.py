@@ -0,0 +1,257 @@
+"""
+Transcript change detection and incremental regeneration.
+
+Creators edit captions, and auto-captions get replaced by manual ones,
+which leaves summaries and exported artifacts built from the old text.
+Expiring everything on a timer would regenerate videos that never
+changed, so a background job checks instead:
+
+1. Videos with generated content (cached section summaries or an
+   exported artifact) are re-checked every TRANSCRIPT_RECHECK_SECONDS,
+   least recently checked first. The check fetches the current
+   transcript from YouTube (no LLM call) and compares text_hash, which
+   ignores timing and whitespace.
+2. Unchanged transcripts are left alone. A transcript that was only
+   re-timed replaces the cached one, and its summaries and artifact are
+   pointed at it as they are, without an LLM call.
+3. A changed transcript has its summaries rebuilt, reusing every window
+   whose text did not change (summaries.py), and its artifact
+   re-exported from the updated outline. Only then does it replace the
+   cached one (and its search index entry). The changed windows are
+   reported.
+
+The job runs at low priority: one video at a time, only while this
+worker has no requests in progress, in one worker at a time (a lease in
+the shared cache), and its provider calls are in the scheduler's
+preemptible background class (scheduler.py). Each day it makes at most TRANSCRIPT_REFRESH_CHECKS
+YouTube checks and spends at most TRANSCRIPT_REFRESH_BUDGET USD. Its
+provider calls are recorded in the usage ledger under "refresh", and
+the spend is counted from there.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
+
+import artifacts
+import metrics
+import scheduler
+import usage
+from cache import cache
+from deadlines import active_requests
+from metadata import get_video_metadata
+from summaries import (
+    SUMMARY_NAMESPACE, get_sections, rebase_sections, reusable_sections, split_windows, window_hash, worth_summarizing
+)
+from transcripts import fetch_current_transcript, get_cached_transcript, save_transcript, text_hash
+
+REFRESH_NAMESPACE = "transcript_refresh"
+REFRESH_ENDPOINT = "refresh"
+# Seconds between runs of the background loop; 0 turns it off (run refresh_transcripts.py from cron instead)
+REFRESH_INTERVAL_SECONDS = float(os.getenv("TRANSCRIPT_REFRESH_INTERVAL", 6 * 3600))
+REFRESH_RECHECK_SECONDS = float(os.getenv("TRANSCRIPT_RECHECK_SECONDS", 3 * 24 * 3600))
+REFRESH_DAILY_CHECKS = int(os.getenv("TRANSCRIPT_REFRESH_CHECKS", 200))
+REFRESH_DAILY_BUDGET_USD = float(os.getenv("TRANSCRIPT_REFRESH_BUDGET", 1.0))
+REFRESH_PROVIDER = os.getenv("TRANSCRIPT_REFRESH_PROVIDER", "gemini")
+# Pause between videos, so YouTube sees a trickle rather than a burst
+REFRESH_PAUSE_SECONDS = float(os.getenv("TRANSCRIPT_REFRESH_PAUSE", 2))
+IDLE_POLL_SECONDS = 1.0
+# Per-video state is kept a while past the recheck interval
+STATE_TTL_SECONDS = 90 * 24 * 3600
+
+# (transcript, video_title, provider) -> hash of the re-exported artifact (main.export_artifact)
+Exporter = Callable[[dict, str, str], Awaitable[str]]
+
+
+def _state_key(video_id: str) -> str:
+    return f"video:{video_id}"
+
+
+def _checks_key(day: str) -> str:
+    return f"checks:{day}"
+
+
+def candidates() -> List[str]:
+    """Videos with generated content, least recently checked first"""
+    video_ids = set(cache.keys(SUMMARY_NAMESPACE))
+    versions_dir = os.path.join(artifacts.ARTIFACTS_DIR, f"v{artifacts.ARTIFACT_VERSION}")
+    if os.path.isdir(versions_dir):
+        video_ids.update(os.listdir(versions_dir))
+
+    now = time.time()
+    due = []
+    for video_id in video_ids:
+        state = cache.get(REFRESH_NAMESPACE, _state_key(video_id)) or {}
+        checked_at = state.get("checked_at", 0)
+        if now - checked_at >= REFRESH_RECHECK_SECONDS:
+            due.append((checked_at, video_id))
+    return [video_id for _, video_id in sorted(due)]
+
+
+def generated_from(video_id: str) -> set:
+    """Content hashes of the transcripts the video's summaries and artifact were generated from"""
+    hashes = set()
+    entry = cache.get(SUMMARY_NAMESPACE, video_id)
+    if entry is not None:
+        hashes.add(entry.get("content_hash"))
+    loaded = artifacts.load_artifact(video_id)
+    if loaded is not None:
+        hashes.add(loaded[1].get("transcript_hash"))
+    return hashes
+
+
+def changed_windows(old: Optional[dict], new: dict) -> List[dict]:
+    """Summary windows of the new transcript whose text is not in the old one (or in its summaries)"""
+    if old is not None:
+        old_hashes = {window_hash(window) for window in split_windows(old["segments"])}
+    else:
+        old_hashes = set(reusable_sections(new["video_id"]))
+    return [
+        {"start": window["start"], "end": window["end"]}
+        for window in split_windows(new["segments"])
+        if window_hash(window) not in old_hashes
+    ]
+
+
+def budget_left() -> float:
+    return REFRESH_DAILY_BUDGET_USD - usage.spent_today(REFRESH_ENDPOINT)
+
+
+async def _wait_until_idle():
+    while active_requests() > 0:
+        await asyncio.sleep(IDLE_POLL_SECONDS)
+
+
+def rebase(current: dict) -> dict:
+    """Replace a re-timed transcript and point what was generated from it at the new one"""
+    save_transcript(current)
+    return {
+        "summaries": rebase_sections(current),
+        "artifact": artifacts.rebase(current["video_id"], current["content_hash"])
+    }
+
+
+async def regenerate(current: dict, export: Exporter, provider: str = REFRESH_PROVIDER) -> dict:
+    """
+    Rebuild what was generated from a changed transcript, then replace the
+    cached transcript. When a provider call fails (or is preempted), the
+    old transcript stays cached, so the next check sees the change again
+    instead of taking it for a re-timing and rebasing stale content.
+    """
+    video_id = current["video_id"]
+    result = {"summaries": False, "artifact": None}
+    had_summaries = cache.get(SUMMARY_NAMESPACE, video_id) is not None
+    had_artifact = artifacts.load_artifact(video_id) is not None
+    if had_summaries or had_artifact:
+        title = (await get_video_metadata(video_id)).get("title") or ""
+        with usage.attributed_to(REFRESH_ENDPOINT), scheduler.priority("background"):
+            if worth_summarizing(current):
+                # Only the windows whose text changed are summarized again
+                await get_sections(current, title, provider)
+                result["summaries"] = True
+            if had_artifact:
+                result["artifact"] = await export(current, title, provider)
+    save_transcript(current)
+    return result
+
+
+async def check_video(video_id: str, export: Exporter) -> dict:
+    """Check one video's transcript and regenerate its content if the text changed"""
+    old = get_cached_transcript(video_id)
+    previous = cache.get(REFRESH_NAMESPACE, _state_key(video_id)) or {}
+    # The cached track's language first, so a manual track replacing an
+    # auto-generated one in that language is picked up
+    preferred = (old["language_code"],) if old and old.get("language_code") else ()
+    state = {"checked_at": time.time()}
+    try:
+        current = await asyncio.to_thread(fetch_current_transcript, video_id, preferred)
+    except (TranscriptsDisabled, NoTranscriptFound):
+        # Captions were taken down: keep serving what was generated before
+        report = {"video_id": video_id, "status": "missing"}
+    else:
+        new_hash = text_hash(current["segments"])
+        # Without a cached transcript, the text seen at the last check
+        old_hash = text_hash(old["segments"]) if old is not None else previous.get("text_hash")
+        state["text_hash"] = new_hash
+        if generated_from(video_id) <= {current["content_hash"]}:
+            report = {"video_id": video_id, "status": "unchanged"}
+        elif old_hash == new_hash:
+            report = {"video_id": video_id, "status": "retimed", **rebase(current)}
+        else:
+            windows = changed_windows(old, current)
+            regenerated = await regenerate(current, export)
+            state["changed_at"] = state["checked_at"]
+            report = {
+                "video_id": video_id,
+                "status": "changed",
+                "changed_windows": windows,
+                "windows": len(split_windows(current["segments"])),
+                **regenerated
+            }
+    cache.set(REFRESH_NAMESPACE, _state_key(video_id), {**state, "status": report["status"]}, ttl=STATE_TTL_SECONDS)
+    metrics.incr("transcript_refresh", report["status"])
+    return report
+
+
+async def run_once(export: Exporter, limit: Optional[int] = None) -> dict:
+    """Check due videos until they are done or today's checks or budget run out"""
+    started = time.time()
+    day = usage.today()
+    checks = cache.get(REFRESH_NAMESPACE, _checks_key(day), 0)
+    summary = {"started_at": started, "checked": 0, "due": 0, "stopped": None, "videos": []}
+    due = candidates()
+    summary["due"] = len(due)
+    for video_id in due[:limit]:
+        if checks >= REFRESH_DAILY_CHECKS:
+            summary["stopped"] = "daily_checks"
+            break
+        if budget_left() <= 0:
+            summary["stopped"] = "daily_budget"
+            break
+        await _wait_until_idle()
+        checks += 1
+        cache.set(REFRESH_NAMESPACE, _checks_key(day), checks, ttl=2 * 24 * 3600)
+        try:
+            report = await check_video(video_id, export)
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            print(f"⚠️  Transcript refresh failed for {video_id}: {str(detail)[:200]}")
+            metrics.incr("transcript_refresh", "failed")
+            report = {"video_id": video_id, "status": "failed", "error": str(detail)[:200]}
+        summary["checked"] += 1
+        if report["status"] != "unchanged":
+            summary["videos"].append(report)
+        await asyncio.sleep(REFRESH_PAUSE_SECONDS)
+    summary["took_seconds"] = round(time.time() - started, 1)
+    summary["spent_today_usd"] = round(usage.spent_today(REFRESH_ENDPOINT), 6)
+    cache.set(REFRESH_NAMESPACE, "last_run", summary, ttl=STATE_TTL_SECONDS)
+    return summary
+
+
+async def refresh_loop(export: Exporter):
+    """Background loop: one worker at a time runs a refresh every REFRESH_INTERVAL_SECONDS"""
+    while True:
+        # Whoever takes the lease runs this interval's refresh; the others skip it
+        if cache.add(REFRESH_NAMESPACE, "lease", {"pid": os.getpid()}, ttl=REFRESH_INTERVAL_SECONDS):
+            try:
+                summary = await run_once(export)
+                changed = sum(1 for video in summary["videos"] if video["status"] == "changed")
+                print(f"🔁 Transcript refresh: checked {summary['checked']} of {summary['due']} due, {changed} changed")
+            except Exception as e:
+                print(f"⚠️  Transcript refresh run failed: {str(e)[:200]}")
+        await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+
+
+def refresh_report() -> dict:
+    day = usage.today()
+    return {
+        "last_run": cache.get(REFRESH_NAMESPACE, "last_run"),
+        "checks_today": cache.get(REFRESH_NAMESPACE, _checks_key(day), 0),
+        "daily_checks": REFRESH_DAILY_CHECKS,
+        "spent_today_usd": round(usage.spent_today(REFRESH_ENDPOINT), 6),
+        "daily_budget_usd": REFRESH_DAILY_BUDGET_USD,
+        "interval_seconds": REFRESH_INTERVAL_SECONDS,
+        "recheck_seconds": REFRESH_RECHECK_SECONDS
+    }
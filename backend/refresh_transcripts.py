@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Run one transcript refresh (see refresh.py) outside the server.
+
+For deployments without the background loop (TRANSCRIPT_REFRESH_INTERVAL=0,
+or serverless hosts), e.g. from a daily cron job. The daily check and
+budget limits are shared with the server through the cache.
+
+Usage:
+    python refresh_transcripts.py --limit 50
+"""
+import argparse
+import asyncio
+import json
+
+from main import export_artifact
+from refresh import run_once
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-check cached transcripts and regenerate changed videos")
+    parser.add_argument("--limit", type=int, help="Check at most this many videos")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run_once(export_artifact, args.limit))
+    for video in summary["videos"]:
+        print(json.dumps(video))
+    print(
+        f"Checked {summary['checked']} of {summary['due']} due videos in {summary['took_seconds']}s, "
+        f"spent ${summary['spent_today_usd']} today" + (f", stopped: {summary['stopped']}" if summary["stopped"] else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
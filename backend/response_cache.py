@@ -0,0 +1,115 @@
+"""
+Content-addressed response cache for AI answers.
+
+Responses are keyed by a hash of the normalized prompt inputs and the
+model. A small in-memory LRU sits in front of the persistent cache.
+Entries are fresh for RESPONSE_CACHE_FRESH_TTL; after that they are
+served stale while a background refresh recomputes them, until
+RESPONSE_CACHE_STALE_TTL when they are dropped.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Set, Tuple
+
+import metrics
+from cache import cache
+from deadlines import shared
+
+RESPONSE_CACHE_FRESH_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_FRESH_TTL", 30 * 24 * 3600))
+RESPONSE_CACHE_STALE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_STALE_TTL", 180 * 24 * 3600))
+RESPONSE_CACHE_MEMORY_ENTRIES = int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", 512))
+
+
+def normalize_text(text: str) -> str:
+    """Case- and whitespace-insensitive form of a prompt input"""
+    return re.sub(r"\s+", " ", (text or "").strip()).casefold()
+
+
+def response_key(model: str, **inputs: str) -> str:
+    """Hash of the model and the normalized inputs"""
+    normalized = {name: normalize_text(value) for name, value in sorted(inputs.items())}
+    payload = json.dumps({"model": model, "inputs": normalized}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Memory LRU in front of the persistent cache, with stale-while-revalidate"""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        self._inflight: dict = {}
+        self._refreshing: Set[str] = set()
+
+    def _remember(self, key: str, entry: dict):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        if len(self._memory) > RESPONSE_CACHE_MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def get_entry(self, key: str):
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry["created_at"] + RESPONSE_CACHE_STALE_TTL_SECONDS <= time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return entry
+        entry = cache.get(self.namespace, key)
+        if entry is not None:
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, value: Any):
+        entry = {"value": value, "created_at": time.time()}
+        cache.set(self.namespace, key, entry, ttl=RESPONSE_CACHE_STALE_TTL_SECONDS)
+        self._remember(key, entry)
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Run compute once per key even if several requests miss at the same time"""
+        async def compute_and_store():
+            value = await compute()
+            self.put(key, value)
+            return value
+
+        return await shared(self._inflight, key, compute_and_store)
+
+    async def _refresh(self, key: str, compute: Callable[[], Awaitable[Any]]):
+        try:
+            await self._compute(key, compute)
+            metrics.incr(f"response_cache:{self.namespace}", "refreshed")
+        except Exception as e:
+            print(f"⚠️  Background refresh failed for {self.namespace} {key[:12]}: {str(e)[:200]}")
+        finally:
+            self._refreshing.discard(key)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Return (value, status) where status is 'hit', 'stale' or 'miss'"""
+        group = f"response_cache:{self.namespace}"
+        entry = self.get_entry(key)
+        if entry is not None and entry["created_at"] + RESPONSE_CACHE_FRESH_TTL_SECONDS <= time.time():
+            # Another worker process may already have refreshed the shared copy
+            stored = cache.get(self.namespace, key)
+            if stored is not None and stored["created_at"] > entry["created_at"]:
+                self._remember(key, stored)
+                entry = stored
+        if entry is not None:
+            if entry["created_at"] + RESPONSE_CACHE_FRESH_TTL_SECONDS > time.time():
+                metrics.incr(group, "hits")
+                return entry["value"], "hit"
+            metrics.incr(group, "stale")
+            if key not in self._refreshing:
+                self._refreshing.add(key)
+                asyncio.ensure_future(self._refresh(key, compute))
+            return entry["value"], "stale"
+
+        metrics.incr(group, "misses")
+        return await self._compute(key, compute), "miss"
+
+
+solution_cache = ResponseCache("solution")
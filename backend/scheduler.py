@@ -0,0 +1,309 @@
+"""
+Priority scheduling of provider calls.
+
+Every provider call (providers.py) takes a slot from its provider's
+scheduler first. Each worker has LLM_CONCURRENCY slots per provider,
+shared by four priority classes:
+
+- interactive: a student waiting on the screen (/ai-question, ...)
+- standard: chapters, quizzes, bundles and summaries
+- bulk: work a client marked as such with an `X-Priority: bulk` header,
+  e.g. a script importing a whole course
+- background: refresh.py and prefetch.py
+
+Waiting calls are dispatched by weighted fair queuing: each class gets
+slots in proportion to LLM_CLASS_WEIGHTS while it has calls waiting,
+so bulk work keeps moving but cannot crowd out students. Each class
+is also capped by LLM_CLASS_LIMITS. The slots above the standard cap
+are therefore only ever used by interactive calls. Queued background
+calls are preemptible. When a call of a higher class has to wait, they
+are dropped with a 503, and the background job gives up on that video
+for now. Calls that are already running are never interrupted.
+
+A call's class comes from priority() blocks (the outermost one wins),
+then the X-Priority header (PriorityMiddleware; clients can only lower
+their priority), then its endpoint. Shared work (deadlines.shared) runs
+in the highest class among the requests waiting for it. A prefetch's
+section summaries stay in the background class until a student's
+request joins them, and then their queued calls move up. Time spent
+waiting for a slot is recorded per provider and class, and GET
+/scheduler shows it.
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+from fastapi import HTTPException
+
+import metrics
+from model_policy import INTERACTIVE_ENDPOINTS
+
+# Highest priority first
+PRIORITY_CLASSES = ("interactive", "standard", "bulk", "background")
+# Classes whose queued calls are dropped when higher-priority calls wait
+PREEMPTIBLE_CLASSES = {"background"}
+# Classes a client may ask for with the X-Priority header
+REQUESTABLE_CLASSES = {"bulk", "background"}
+PRIORITY_HEADER = b"x-priority"
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 8))
+DEFAULT_WEIGHTS = {"interactive": 8, "standard": 4, "bulk": 2, "background": 1}
+DEFAULT_LIMITS = {"interactive": LLM_CONCURRENCY, "standard": 6, "bulk": 3, "background": 1}
+
+
+class Priority:
+    """A priority class that can change while calls in it are queued (see share_priority)"""
+    __slots__ = ("value",)
+
+    def __init__(self, value: Optional[str]):
+        # None: each call's endpoint decides
+        self.value = value
+
+
+# Priority set by the outermost priority() block, the X-Priority header or shared work
+_priority: contextvars.ContextVar[Optional[Priority]] = contextvars.ContextVar("priority", default=None)
+
+
+def load_class_settings(name: str, defaults: Dict[str, float]) -> Dict[str, float]:
+    """defaults overridden by the environment variable, e.g. 'bulk=2,background=1'"""
+    settings = dict(defaults)
+    for item in os.getenv(name, "").split(","):
+        priority_class, _, value = item.partition("=")
+        if priority_class.strip() in settings and value.strip():
+            settings[priority_class.strip()] = float(value)
+    return settings
+
+
+CLASS_WEIGHTS = load_class_settings("LLM_CLASS_WEIGHTS", DEFAULT_WEIGHTS)
+CLASS_LIMITS = {
+    priority_class: min(int(limit), LLM_CONCURRENCY)
+    for priority_class, limit in load_class_settings("LLM_CLASS_LIMITS", DEFAULT_LIMITS).items()
+}
+
+
+@contextlib.contextmanager
+def priority(priority_class: str) -> Iterator[None]:
+    """Run provider calls made inside the block in this class, unless an enclosing block already set one"""
+    if priority_class not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {priority_class}")
+    current = _priority.get()
+    token = _priority.set(current if current is not None else Priority(priority_class))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Optional[str]:
+    """Class set for the current context, None when each call's endpoint decides"""
+    current = _priority.get()
+    return current.value if current is not None else None
+
+
+def _rank(value: Optional[str]) -> int:
+    # No explicit class means the endpoint's own, which nothing outranks
+    return -1 if value is None else PRIORITY_CLASSES.index(value)
+
+
+def share_priority(waiting: List[Optional[str]]) -> Priority:
+    """Priority for shared work: the highest class among the requests waiting for it"""
+    return Priority(min(waiting, key=_rank))
+
+
+def bind_priority(shared: Priority):
+    """Run the current context's provider calls in a shared priority"""
+    _priority.set(shared)
+
+
+def update_priority(shared: Priority, waiting: List[Optional[str]]):
+    """Follow the classes of the requests now waiting for shared work; its queued calls change queue"""
+    value = min(waiting, key=_rank)
+    if value == shared.value:
+        return
+    shared.value = value
+    for scheduler in schedulers.values():
+        scheduler.reclassify(shared)
+
+
+def priority_class(endpoint: str, current: Optional[Priority] = None) -> str:
+    """Class of a provider call made for this endpoint under a priority (the current context's by default)"""
+    if current is None:
+        current = _priority.get()
+    if current is not None and current.value is not None:
+        return current.value
+    return "interactive" if endpoint in INTERACTIVE_ENDPOINTS else "standard"
+
+
+class _Waiter:
+    __slots__ = ("priority", "endpoint", "priority_class", "finish", "future")
+
+    def __init__(self, priority: Optional[Priority], endpoint: str, future: asyncio.Future):
+        self.priority = priority
+        self.endpoint = endpoint
+        self.future = future
+        # Set when queued, and again if its priority changes while it waits
+        self.priority_class = ""
+        self.finish = 0.0
+
+
+def priority_class_of(waiter: _Waiter) -> str:
+    return priority_class(waiter.endpoint, waiter.priority)
+
+
+class Scheduler:
+    """Weighted fair queue in front of one provider's calls in this worker"""
+
+    def __init__(self, provider: str, capacity: int, limits: Dict[str, int], weights: Dict[str, float]):
+        self.provider = provider
+        self.capacity = capacity
+        self.limits = limits
+        self.weights = weights
+        self.running = {priority_class: 0 for priority_class in PRIORITY_CLASSES}
+        self.queues: Dict[str, Deque[_Waiter]] = {priority_class: deque() for priority_class in PRIORITY_CLASSES}
+        # Self-clocked fair queuing: the finish tag of the last dispatched call,
+        # and of the last queued call per class
+        self._virtual_time = 0.0
+        self._last_finish = {priority_class: 0.0 for priority_class in PRIORITY_CLASSES}
+
+    def _enqueue(self, waiter: _Waiter):
+        priority_class = priority_class_of(waiter)
+        finish = max(self._virtual_time, self._last_finish[priority_class]) + 1 / self.weights[priority_class]
+        self._last_finish[priority_class] = finish
+        waiter.priority_class = priority_class
+        waiter.finish = finish
+        self.queues[priority_class].append(waiter)
+
+    def reclassify(self, priority: Priority):
+        """Move queued calls under this priority to the queue of its current class"""
+        moved = [
+            waiter for queue in self.queues.values() for waiter in queue
+            if waiter.priority is priority and not waiter.future.done()
+            and priority_class_of(waiter) != waiter.priority_class
+        ]
+        for waiter in moved:
+            self.queues[waiter.priority_class].remove(waiter)
+            metrics.incr("scheduler", f"reclassified:{waiter.priority_class}:{priority_class_of(waiter)}")
+            self._enqueue(waiter)
+        if moved:
+            self._dispatch()
+
+    def _dispatch(self):
+        while sum(self.running.values()) < self.capacity:
+            eligible = [
+                queue for priority_class, queue in self.queues.items()
+                if queue and self.running[priority_class] < self.limits[priority_class]
+            ]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda queue: queue[0].finish).popleft()
+            if waiter.future.done():
+                # Its caller stopped waiting
+                continue
+            self._virtual_time = waiter.finish
+            self.running[waiter.priority_class] += 1
+            waiter.future.set_result(None)
+
+    def _preempt(self, priority_class: str):
+        """Drop queued preemptible calls of lower classes than the one that has to wait"""
+        rank = PRIORITY_CLASSES.index(priority_class)
+        for lower in PRIORITY_CLASSES[rank + 1:]:
+            if lower not in PREEMPTIBLE_CLASSES:
+                continue
+            queue = self.queues[lower]
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.future.done():
+                    waiter.future.set_exception(HTTPException(
+                        status_code=503,
+                        detail=f"{self.provider.capitalize()} call deferred for higher-priority work"
+                    ))
+                    metrics.incr("scheduler", f"preempted:{lower}")
+
+    def _release(self, priority_class: str):
+        self.running[priority_class] -= 1
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, endpoint: str, priority: Optional[Priority] = None) -> AsyncIterator[None]:
+        """Hold one of the provider's slots for a call made for endpoint, waiting for it if needed"""
+        started = time.monotonic()
+        waiter = _Waiter(priority, endpoint, asyncio.get_running_loop().create_future())
+        self._enqueue(waiter)
+        self._dispatch()
+        if not waiter.future.done():
+            metrics.incr("scheduler", f"queued:{waiter.priority_class}")
+            self._preempt(waiter.priority_class)
+            try:
+                await waiter.future
+            except BaseException:
+                if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                    # The slot was granted as this caller gave up
+                    self._release(waiter.priority_class)
+                elif waiter in self.queues[waiter.priority_class]:
+                    self.queues[waiter.priority_class].remove(waiter)
+                raise
+        # The class it was dispatched in, whatever happens to its priority later
+        priority_class = waiter.priority_class
+        wait = time.monotonic() - started
+        metrics.observe_latency(f"queue_wait:{self.provider}:{priority_class}", wait)
+        metrics.incr("scheduler", f"dispatched:{priority_class}")
+        metrics.incr("scheduler", f"wait_seconds:{priority_class}", wait)
+        try:
+            yield
+        finally:
+            self._release(priority_class)
+
+    def report(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "classes": {
+                priority_class: {
+                    "weight": self.weights[priority_class],
+                    "limit": self.limits[priority_class],
+                    "running": self.running[priority_class],
+                    "queued": sum(1 for waiter in self.queues[priority_class] if not waiter.future.done()),
+                    "wait_p50": metrics.latency_percentile(f"queue_wait:{self.provider}:{priority_class}", 50),
+                    "wait_p95": metrics.latency_percentile(f"queue_wait:{self.provider}:{priority_class}", 95)
+                }
+                for priority_class in PRIORITY_CLASSES
+            }
+        }
+
+
+schedulers = {
+    provider: Scheduler(provider, LLM_CONCURRENCY, CLASS_LIMITS, CLASS_WEIGHTS)
+    for provider in ("gemini", "openrouter")
+}
+
+
+def slot(provider: str, endpoint: str):
+    """Slot for one provider call made for endpoint in the current context's priority"""
+    return schedulers[provider].slot(endpoint, _priority.get())
+
+
+def scheduler_report() -> dict:
+    return {provider: scheduler.report() for provider, scheduler in schedulers.items()}
+
+
+class PriorityMiddleware:
+    """ASGI middleware: lets a request lower its provider calls' priority with the X-Priority header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        requested = None
+        if scope["type"] == "http":
+            for name, value in scope.get("headers", ()):
+                if name == PRIORITY_HEADER:
+                    requested = value.decode("latin-1").strip().lower()
+                    break
+        if requested not in REQUESTABLE_CLASSES:
+            await self.app(scope, receive, send)
+            return
+        with priority(requested):
+            await self.app(scope, receive, send)
@@ -0,0 +1,201 @@
+"""
+Full-text search over every transcript the backend has fetched.
+
+Transcripts are split into short passages (SEARCH_WINDOW_SECONDS of
+captions each) and stored in a SQLite FTS5 index next to the cache, so
+the index lives on disk and only SQLite's page cache
+(SEARCH_CACHE_KB) is held in memory however large the corpus grows.
+The index is updated whenever a transcript is cached; a video whose
+content hash has not changed is skipped.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from cache import CACHE_DIR
+
+SEARCH_DB_PATH = os.getenv("SEARCH_DB_PATH", os.path.join(CACHE_DIR, "search.db"))
+SEARCH_WINDOW_SECONDS = float(os.getenv("SEARCH_WINDOW_SECONDS", 30))
+SEARCH_CACHE_KB = int(os.getenv("SEARCH_CACHE_KB", 16 * 1024))
+SEARCH_MAX_RESULTS = 100
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def build_passages(segments: List[dict], window_seconds: float = SEARCH_WINDOW_SECONDS) -> List[tuple]:
+    """Group caption segments into (start, text) passages of about window_seconds"""
+    passages = []
+    start = None
+    texts = []
+    for segment in segments:
+        if start is None:
+            start = segment["start"]
+        texts.append(segment["text"].replace("\n", " "))
+        if segment["start"] + segment.get("duration", 0) - start >= window_seconds:
+            passages.append((start, " ".join(texts)))
+            start, texts = None, []
+    if texts:
+        passages.append((start, " ".join(texts)))
+    return passages
+
+
+def match_expression(query: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query: every word is quoted (so user input
+    cannot inject FTS syntax) and words are OR-ed, letting bm25 rank
+    passages that match more and rarer words first.
+    """
+    terms = _TERM.findall(query.lower())
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+
+class SearchIndex:
+    """FTS5 passage index keyed by video ID"""
+
+    def __init__(self, path: str = SEARCH_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Bound the per-connection page cache; the index itself stays on disk
+            conn.execute(f"PRAGMA cache_size=-{SEARCH_CACHE_KB}")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS indexed_videos (
+                video_id TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                language_code TEXT,
+                passages INTEGER NOT NULL,
+                indexed_at REAL NOT NULL
+            )"""
+        )
+        # Porter stemming lets "recursion" match "recursive"
+        conn.execute(
+            """CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(
+                text,
+                video_id UNINDEXED,
+                start UNINDEXED,
+                tokenize = 'porter unicode61 remove_diacritics 2'
+            )"""
+        )
+        conn.commit()
+
+    def indexed_hash(self, video_id: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT content_hash FROM indexed_videos WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def index_transcript(self, transcript: dict) -> bool:
+        """Replace a video's passages; returns False when it was already up to date"""
+        video_id = transcript["video_id"]
+        if self.indexed_hash(video_id) == transcript["content_hash"]:
+            return False
+
+        passages = build_passages(transcript["segments"])
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM passages WHERE video_id = ?", (video_id,))
+            conn.executemany(
+                "INSERT INTO passages (text, video_id, start) VALUES (?, ?, ?)",
+                [(text, video_id, start) for start, text in passages]
+            )
+            conn.execute(
+                """INSERT INTO indexed_videos (video_id, content_hash, language_code, passages, indexed_at)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(video_id) DO UPDATE SET
+                       content_hash = excluded.content_hash,
+                       language_code = excluded.language_code,
+                       passages = excluded.passages,
+                       indexed_at = excluded.indexed_at""",
+                (video_id, transcript["content_hash"], transcript.get("language_code"), len(passages), time.time())
+            )
+        return True
+
+    def remove(self, video_id: str):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM passages WHERE video_id = ?", (video_id,))
+            conn.execute("DELETE FROM indexed_videos WHERE video_id = ?", (video_id,))
+
+    def search(self, query: str, video_ids: Optional[List[str]] = None, limit: int = 20) -> List[dict]:
+        """Ranked passages as {"video_id", "start", "snippet", "score"}"""
+        expression = match_expression(query)
+        if expression is None:
+            return []
+
+        sql = """SELECT video_id, start, snippet(passages, 0, '**', '**', '…', 16), bm25(passages)
+                 FROM passages WHERE passages MATCH ?"""
+        params: list = [expression]
+        if video_ids:
+            sql += f" AND video_id IN ({','.join('?' * len(video_ids))})"
+            params += video_ids
+        sql += " ORDER BY bm25(passages) LIMIT ?"
+        params.append(min(max(limit, 1), SEARCH_MAX_RESULTS))
+
+        rows = self._connect().execute(sql, params).fetchall()
+        # bm25() is negative, with better matches more negative
+        return [
+            {"video_id": video_id, "start": start, "snippet": snippet, "score": round(-score, 4)}
+            for video_id, start, snippet, score in rows
+        ]
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        videos, passages = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(passages), 0) FROM indexed_videos"
+        ).fetchone()
+        size = sum(
+            os.path.getsize(path) for path in (self.path, self.path + "-wal") if os.path.exists(path)
+        )
+        return {"videos": videos, "passages": passages, "size_bytes": size}
+
+    def optimize(self):
+        """Merge the FTS5 index segments (worth running after a large backfill)"""
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT INTO passages (passages) VALUES ('optimize')")
+
+
+search_index = SearchIndex()
+
+
+def index_transcript(transcript: dict):
+    """Index a freshly cached transcript; search problems never fail the fetch"""
+    try:
+        if search_index.index_transcript(transcript):
+            print(f"🔎 Indexed transcript of {transcript['video_id']} for search")
+    except sqlite3.Error as e:
+        print(f"⚠️  Could not index {transcript['video_id']} for search: {str(e)}")
+
+
+def backfill(transcripts: Iterable[dict]) -> int:
+    """Index already cached transcripts that are missing or outdated in the index"""
+    count = 0
+    for transcript in transcripts:
+        try:
+            if search_index.index_transcript(transcript):
+                count += 1
+        except sqlite3.Error as e:
+            print(f"⚠️  Could not index {transcript['video_id']} for search: {str(e)}")
+    if count:
+        search_index.optimize()
+    return count
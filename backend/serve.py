@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Production launcher: several uvicorn worker processes on uvloop/httptools.
+
+Workers share the SQLite cache (WAL mode, see cache.py), so a transcript
+or AI result computed in one worker is served by all of them.
+
+Usage:
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import importlib.util
+import os
+
+import uvicorn
+
+
+def default_workers() -> int:
+    return int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+
+def available(module: str, fallback: str, preferred: str) -> str:
+    """Use the fast implementation when it is installed (uvicorn[standard])"""
+    return preferred if importlib.util.find_spec(module) is not None else fallback
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with multiple worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    # Mobile clients reuse connections across screens; keep them open longer
+    # than uvicorn's 5s default so they skip TCP/TLS setup
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE_SECONDS", 75)))
+    parser.add_argument("--backlog", type=int, default=int(os.getenv("SOCKET_BACKLOG", 4096)))
+    parser.add_argument("--limit-concurrency", type=int, default=int(os.getenv("LIMIT_CONCURRENCY", 0)) or None)
+    args = parser.parse_args()
+
+    # Read by credentials.py in each worker to split per-key quotas
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+
+    print(f"🚀 Starting {args.workers} workers on {args.host}:{args.port}")
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=available("uvloop", "asyncio", "uvloop"),
+        http=available("httptools", "h11", "httptools"),
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        limit_concurrency=args.limit_concurrency,
+        access_log=False
+    )
+
+
+if __name__ == "__main__":
+    main()
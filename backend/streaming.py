@@ -0,0 +1,100 @@
+"""
+Generator pipeline for long transcripts.
+
+A 5-hour lab has tens of thousands of caption segments. Building the
+prompt with a list comprehension, wrapping every segment in a pydantic
+model and letting FastAPI encode the whole response at once keeps
+several full copies of the transcript alive together. Instead:
+
+- prompt text is assembled from a generator of lines, joined in batches
+  of PROMPT_JOIN_LINES, so apart from the prompt itself only one batch
+  of line strings exists at a time
+- responses are written by json_response(), which encodes values as it
+  goes and sends STREAM_CHUNK_BYTES chunks, so the body is never held
+  in memory in full
+
+bench_memory.py shows the peak memory of both approaches as transcripts
+grow.
+"""
+import itertools
+import json
+from typing import Any, Iterable, Iterator
+
+from fastapi.responses import StreamingResponse
+
+STREAM_CHUNK_BYTES = 64 * 1024
+PROMPT_JOIN_LINES = 512
+
+
+def join_lines(lines: Iterable[str], batch_lines: int = PROMPT_JOIN_LINES) -> str:
+    """'\\n'.join(lines) for a generator, without first collecting every line"""
+    lines = iter(lines)
+    batches = []
+    while True:
+        batch = list(itertools.islice(lines, batch_lines))
+        if not batch:
+            break
+        batches.append("\n".join(batch))
+    return "\n".join(batches)
+
+
+def leading_text(segments: Iterable[dict], limit: int) -> str:
+    """Caption text joined with spaces, cut at limit characters ('...' marks a cut)"""
+    parts = []
+    size = -1
+    for segment in segments:
+        parts.append(segment["text"])
+        size += len(segment["text"]) + 1
+        if size > limit:
+            return " ".join(parts)[:limit] + "..."
+    return " ".join(parts)
+
+
+def _encode(value: Any) -> str:
+    # Same compact form as FastAPI's JSONResponse
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def iter_json(value: Any) -> Iterator[str]:
+    """
+    Encode value piece by piece. Dicts are walked field by field; lists and
+    iterators (e.g. generators of segments) are written item by item, each
+    item encoded on its own.
+    """
+    if isinstance(value, dict):
+        yield "{"
+        for i, (key, item) in enumerate(value.items()):
+            yield ("," if i else "") + _encode(str(key)) + ":"
+            yield from iter_json(item)
+        yield "}"
+    elif isinstance(value, (list, tuple, Iterator)):
+        yield "["
+        for i, item in enumerate(value):
+            yield ("," if i else "") + _encode(item)
+        yield "]"
+    else:
+        yield _encode(value)
+
+
+def json_chunks(value: Any, chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    buffer = []
+    size = 0
+    for piece in iter_json(value):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_bytes:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def json_response(value: Any, status_code: int = 200) -> StreamingResponse:
+    """Stream value as a JSON response body"""
+    return StreamingResponse(json_chunks(value), status_code=status_code, media_type="application/json")
+
+
+def segment_items(segments: Iterable[dict]) -> Iterator[dict]:
+    """Transcript segments in the response shape {"text", "start", "duration"}"""
+    for segment in segments:
+        yield {"text": segment["text"], "start": segment["start"], "duration": segment["duration"]}
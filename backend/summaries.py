@@ -0,0 +1,231 @@
+"""
+Per-video section summaries shared by chapters, Q&A and quizzes.
+
+A transcript is cut into SUMMARY_WINDOW_SECONDS windows and each window
+is summarized once (summary, key points and timestamped topics), with
+several windows per LLM call. The result is cached per video and tied
+to the transcript's content hash, so it is rebuilt only when the
+transcript changes. A rebuild keeps the summaries of windows whose text
+did not change, so an edited caption costs one window, not the whole
+video. Endpoints then send this compact outline instead of raw
+transcript text.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from typing import List, Optional
+
+import metrics
+from cache import cache
+from context_cache import estimate_tokens
+from deadlines import bounded, shared
+from providers import generate
+
+SUMMARY_NAMESPACE = "segment_summaries"
+SUMMARY_WINDOW_SECONDS = float(os.getenv("SUMMARY_WINDOW_SECONDS", 300))
+# Transcript characters sent per summarization call
+SUMMARY_BATCH_CHARS = int(os.getenv("SUMMARY_BATCH_CHARS", 40000))
+SUMMARY_TTL_SECONDS = int(os.getenv("SUMMARY_CACHE_TTL", 30 * 24 * 3600))
+SUMMARY_VERSION = 1
+# Shorter transcripts are cheaper to send as-is than to summarize first
+SUMMARY_MIN_TOKENS = int(os.getenv("SUMMARY_MIN_TOKENS", 3000))
+
+# Builds currently running, so concurrent requests share one set of LLM calls
+_inflight: dict = {}
+
+
+def _timestamp(seconds: float) -> str:
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+def split_windows(segments: List[dict], window_seconds: float = SUMMARY_WINDOW_SECONDS) -> List[dict]:
+    """Cut caption segments into consecutive windows of window_seconds"""
+    windows = []
+    for segment in segments:
+        index = int(segment["start"] // window_seconds)
+        if not windows or windows[-1]["index"] != index:
+            windows.append({"index": index, "start": segment["start"], "end": segment["start"], "lines": []})
+        window = windows[-1]
+        window["end"] = segment["start"] + segment.get("duration", 0)
+        window["lines"].append(f"[{_timestamp(segment['start'])}] {segment['text']}")
+    return [
+        {"start": window["start"], "end": window["end"], "text": "\n".join(window["lines"])}
+        for window in windows
+    ]
+
+
+def window_hash(window: dict) -> str:
+    return hashlib.sha256(window["text"].encode("utf-8")).hexdigest()[:16]
+
+
+def _batches(windows: List[dict]) -> List[List[dict]]:
+    batches = [[]]
+    size = 0
+    for window in windows:
+        if batches[-1] and size + len(window["text"]) > SUMMARY_BATCH_CHARS:
+            batches.append([])
+            size = 0
+        batches[-1].append(window)
+        size += len(window["text"])
+    return batches
+
+
+def _summary_prompt(video_title: str, windows: List[dict]) -> str:
+    sections = "\n\n".join(
+        f"### Section {i} [{_timestamp(w['start'])} - {_timestamp(w['end'])}]\n{w['text']}"
+        for i, w in enumerate(windows)
+    )
+    return f"""You are summarizing consecutive sections of a lecture video transcript for later reuse.
+Video Title: {video_title}
+
+For EACH section below:
+1. Write a 2-3 sentence summary of what is taught
+2. List the key points (definitions, formulas, steps, examples), at most 5
+3. List the topics that start in the section, with the exact timestamp_seconds taken from the [MM:SS] or [HH:MM:SS] markers
+
+{sections}
+
+Respond with JSON in this exact format, one entry per section in order:
+{{
+    "sections": [
+        {{
+            "section": 0,
+            "summary": "...",
+            "key_points": ["..."],
+            "topics": [{{"timestamp_seconds": 0, "title": "..."}}]
+        }}
+    ]
+}}"""
+
+
+async def _summarize_batch(video_title: str, windows: List[dict], provider: str) -> List[dict]:
+    prompt = _summary_prompt(video_title, windows)
+    text, used_provider = await generate(prompt, provider=provider, endpoint="summaries", json_mode=True)
+    metrics.incr(SUMMARY_NAMESPACE, "prompt_tokens", estimate_tokens(prompt))
+    by_index = {entry.get("section"): entry for entry in json.loads(text).get("sections", [])}
+    results = []
+    for i, window in enumerate(windows):
+        entry = by_index.get(i, {})
+        results.append({
+            "start": window["start"],
+            "end": window["end"],
+            "text_hash": window_hash(window),
+            "summary": entry.get("summary", ""),
+            "key_points": entry.get("key_points", []),
+            "topics": [
+                topic for topic in entry.get("topics", [])
+                if isinstance(topic.get("timestamp_seconds"), (int, float))
+                and window["start"] - 1 <= topic["timestamp_seconds"] <= window["end"] + 1
+            ]
+        })
+    return results
+
+
+def reusable_sections(video_id: str) -> dict:
+    """Sections of the video's cached summaries (possibly of an older transcript) by window text hash"""
+    entry = cache.get(SUMMARY_NAMESPACE, video_id)
+    if entry is None or entry.get("version") != SUMMARY_VERSION or entry.get("window_seconds") != SUMMARY_WINDOW_SECONDS:
+        return {}
+    return {section["text_hash"]: section for section in entry["sections"] if "text_hash" in section}
+
+
+async def _build(transcript: dict, video_title: str, provider: str) -> List[dict]:
+    windows = split_windows(transcript["segments"])
+    reusable = reusable_sections(transcript["video_id"])
+    changed = [window for window in windows if window_hash(window) not in reusable]
+    print(f"🧩 Summarizing {len(changed)} of {len(windows)} sections of {transcript['video_id']}")
+    batches = await asyncio.gather(*(
+        _summarize_batch(video_title, batch, provider) for batch in _batches(changed) if batch
+    ))
+    summarized = {section["text_hash"]: section for batch in batches for section in batch}
+    sections = []
+    for window in windows:
+        text_hash = window_hash(window)
+        section = summarized.get(text_hash) or reusable[text_hash]
+        sections.append({**section, "start": window["start"], "end": window["end"]})
+    metrics.incr(SUMMARY_NAMESPACE, "windows_summarized", len(changed))
+    metrics.incr(SUMMARY_NAMESPACE, "windows_reused", len(windows) - len(changed))
+    cache.set(SUMMARY_NAMESPACE, transcript["video_id"], {
+        "content_hash": transcript["content_hash"],
+        "version": SUMMARY_VERSION,
+        "window_seconds": SUMMARY_WINDOW_SECONDS,
+        "sections": sections
+    }, ttl=SUMMARY_TTL_SECONDS)
+    metrics.incr(SUMMARY_NAMESPACE, "built")
+    return sections
+
+
+def worth_summarizing(transcript: dict) -> bool:
+    text_chars = sum(len(segment["text"]) + 1 for segment in transcript["segments"])
+    return text_chars // 4 >= SUMMARY_MIN_TOKENS
+
+
+def get_cached_sections(transcript: dict) -> Optional[List[dict]]:
+    """Cached sections for this exact transcript, or None"""
+    entry = cache.get(SUMMARY_NAMESPACE, transcript["video_id"])
+    if entry is None:
+        return None
+    if (
+        entry.get("content_hash") != transcript["content_hash"]
+        or entry.get("version") != SUMMARY_VERSION
+        or entry.get("window_seconds") != SUMMARY_WINDOW_SECONDS
+    ):
+        metrics.incr(SUMMARY_NAMESPACE, "invalidated")
+        return None
+    return entry["sections"]
+
+
+async def get_sections(transcript: dict, video_title: str = "", provider: str = "gemini") -> List[dict]:
+    """Section summaries for a transcript (as returned by transcripts.fetch_transcript)"""
+    sections = get_cached_sections(transcript)
+    if sections is not None:
+        metrics.incr(SUMMARY_NAMESPACE, "hits")
+        return sections
+    metrics.incr(SUMMARY_NAMESPACE, "misses")
+
+    key = f"{transcript['video_id']}:{transcript['content_hash']}"
+    return await bounded(shared(_inflight, key, lambda: _build(transcript, video_title, provider)), "section summaries")
+
+
+def rebase_sections(transcript: dict) -> bool:
+    """
+    Tie the video's cached sections to a re-timed transcript with the same
+    text, without summarizing again; False when there are none
+    """
+    entry = cache.get(SUMMARY_NAMESPACE, transcript["video_id"])
+    if entry is None:
+        return False
+    cache.set(SUMMARY_NAMESPACE, transcript["video_id"], {**entry, "content_hash": transcript["content_hash"]}, ttl=SUMMARY_TTL_SECONDS)
+    return True
+
+
+def format_outline(sections: List[dict], key_points: bool = True, topics: bool = False) -> str:
+    """Render sections as a compact timestamped outline for prompts"""
+    lines = []
+    for section in sections:
+        lines.append(f"[{_timestamp(section['start'])} - {_timestamp(section['end'])}] {section['summary']}")
+        if topics:
+            lines += [f"  * [{_timestamp(t['timestamp_seconds'])}] {t['title']}" for t in section["topics"]]
+        if key_points:
+            lines += [f"  - {point}" for point in section["key_points"]]
+    return "\n".join(lines)
+
+
+def relevant_windows(transcript: dict, passage_starts: List[float], max_chars: int) -> str:
+    """Raw text of the windows containing the given passage start times, within max_chars"""
+    windows = split_windows(transcript["segments"])
+    chosen = []
+    size = 0
+    for start in passage_starts:
+        window = next((w for w in windows if w["start"] <= start <= w["end"]), None)
+        if window is None or window in chosen:
+            continue
+        if size + len(window["text"]) > max_chars:
+            break
+        chosen.append(window)
+        size += len(window["text"])
+    chosen.sort(key=lambda w: w["start"])
+    return "\n\n".join(w["text"] for w in chosen)
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Modules read their settings at import time: keep caches and ledgers out of the tree
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="backend-tests-"))
+os.environ.setdefault("ARTIFACTS_DIR", os.path.join(os.environ["CACHE_DIR"], "artifacts"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
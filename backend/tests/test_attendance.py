@@ -0,0 +1,80 @@
+import asyncio
+import math
+
+import pytest
+
+from attendance import DEFAULT_CAMPUS_LOCATION, EARTH_RADIUS_METERS, CheckInBatcher, SQLiteAttendanceStore
+
+
+class CountingStore(SQLiteAttendanceStore):
+    """SQLite stand-in that records every upsert it is asked for"""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.upserts = []
+
+    async def upsert(self, rows):
+        self.upserts.append(len(rows))
+        return await super().upsert(rows)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CountingStore(str(tmp_path / "attendance.db"))
+    conn = store._connect()
+    with conn:
+        conn.execute("INSERT INTO attendance_sessions (id, class_id, is_active) VALUES ('open', 'ml-101', 1)")
+        conn.execute("INSERT INTO attendance_sessions (id, class_id, is_active) VALUES ('closed', 'ml-101', 0)")
+    return store
+
+
+def _check_in(student: str, north_meters: float, accuracy: float, session_id: str = "open") -> dict:
+    return {
+        "session_id": session_id,
+        "student_id": student,
+        "student_email": f"{student}@example.edu",
+        "student_name": student.title(),
+        "latitude": DEFAULT_CAMPUS_LOCATION["latitude"] + math.degrees(north_meters / EARTH_RADIUS_METERS),
+        "longitude": DEFAULT_CAMPUS_LOCATION["longitude"],
+        "altitude": None,
+        "accuracy": accuracy
+    }
+
+
+def _submit_all(batcher: CheckInBatcher, check_ins: list) -> list:
+    async def run():
+        return await asyncio.gather(*(batcher.submit(check_in) for check_in in check_ins))
+
+    return asyncio.run(run())
+
+
+def test_batch_is_verified_on_the_server_and_written_in_one_upsert(store):
+    batcher = CheckInBatcher(store, batch_size=50, wait_seconds=0.01)
+    results = _submit_all(batcher, [
+        _check_in("ada", 50, 10),
+        _check_in("grace", 60, 15),
+        _check_in("alan", 900, 10),
+        _check_in("edsger", 20, 900),
+        _check_in("ada", 55, 10),
+        _check_in("barbara", 30, 10, session_id="closed")
+    ])
+
+    assert [result["status"] for result in results] == [
+        "marked", "marked", "rejected", "rejected", "already_marked", "session_closed"
+    ]
+    assert [result["location_verified"] for result in results] == [True, True, False, False, True, True]
+    assert results[0]["distance_from_campus"] == pytest.approx(50, abs=1)
+    assert results[2]["distance_from_campus"] == pytest.approx(900, abs=1)
+    # Both verified students in a single multi-row statement, Ada's second check-in folded into her first
+    assert store.upserts == [2]
+    assert store._rows("SELECT present FROM attendance_session_stats WHERE session_id = 'open'") == [{"present": 2}]
+
+
+def test_checking_in_again_is_already_marked(store):
+    batcher = CheckInBatcher(store, batch_size=50, wait_seconds=0.01)
+    _submit_all(batcher, [_check_in("ada", 50, 10)])
+    results = _submit_all(batcher, [_check_in("ada", 40, 10), _check_in("grace", 60, 15)])
+
+    assert [result["status"] for result in results] == ["already_marked", "marked"]
+    assert store.upserts == [1, 2]
+    assert store._rows("SELECT COUNT(*) AS records FROM attendance_records") == [{"records": 2}]
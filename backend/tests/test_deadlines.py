@@ -0,0 +1,61 @@
+import asyncio
+
+from fastapi import FastAPI
+
+from deadlines import DeadlineMiddleware
+
+
+def _app(started: asyncio.Event, cancelled: asyncio.Event) -> DeadlineMiddleware:
+    app = FastAPI()
+
+    @app.get("/transcript/{video_id}")
+    async def transcript(video_id: str):
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return {"video_id": video_id}
+
+    return DeadlineMiddleware(app)
+
+
+def test_disconnect_on_get_cancels_the_handler():
+    async def run():
+        started, cancelled, gone = asyncio.Event(), asyncio.Event(), asyncio.Event()
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        sent = []
+
+        async def receive():
+            # Like uvicorn: the (empty) body, then nothing until the client goes away
+            if messages:
+                return messages.pop(0)
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/transcript/abc",
+            "raw_path": b"/transcript/abc",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"testserver")],
+            "client": ("127.0.0.1", 1234),
+            "server": ("testserver", 80)
+        }
+        request = asyncio.ensure_future(_app(started, cancelled)(scope, receive, send))
+        await asyncio.wait_for(started.wait(), 1)
+        gone.set()
+        await asyncio.wait_for(request, 1)
+        assert cancelled.is_set()
+        assert sent == []
+
+    asyncio.run(run())
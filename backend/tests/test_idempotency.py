@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+
+import idempotency
+from deadlines import DeadlineMiddleware
+from idempotency import IdempotencyMiddleware
+
+GRACE_SECONDS = 0.2
+
+
+@pytest.fixture(autouse=True)
+def grace(monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_GRACE_SECONDS", GRACE_SECONDS)
+
+
+def _app(started: asyncio.Event, release: asyncio.Event, cancelled: asyncio.Event) -> DeadlineMiddleware:
+    app = FastAPI()
+
+    @app.post("/analyze")
+    async def analyze(request: dict):
+        started.set()
+        try:
+            # Stands in for the paid LLM call
+            await release.wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return {"video_url": request["video_url"]}
+
+    return DeadlineMiddleware(IdempotencyMiddleware(app, paths=("/analyze",)))
+
+
+def _request(app, key: str, gone: asyncio.Event, sent: list) -> asyncio.Future:
+    """Send a keyed POST /analyze as raw ASGI; the client disconnects once gone is set"""
+    body = json.dumps({"video_url": "https://youtu.be/abc"}).encode("utf-8")
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/analyze",
+        "raw_path": b"/analyze",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"idempotency-key", key.encode("ascii"))
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80)
+    }
+    return asyncio.ensure_future(app(scope, receive, send))
+
+
+def test_disconnected_keyed_request_is_cancelled_after_the_grace_period():
+    async def run():
+        started, release, cancelled, gone = asyncio.Event(), asyncio.Event(), asyncio.Event(), asyncio.Event()
+        app = _app(started, release, cancelled)
+        request = _request(app, "left-the-screen", gone, [])
+        await asyncio.wait_for(started.wait(), 1)
+
+        gone.set()
+        await asyncio.wait_for(request, 1)
+        # Still running for a retry to attach to...
+        await asyncio.sleep(GRACE_SECONDS / 2)
+        assert not cancelled.is_set()
+        # ...and cancelled once none did
+        await asyncio.wait_for(cancelled.wait(), GRACE_SECONDS * 5)
+
+    asyncio.run(run())
+
+
+def test_retry_within_the_grace_period_keeps_the_work():
+    async def run():
+        started, release, cancelled, gone = asyncio.Event(), asyncio.Event(), asyncio.Event(), asyncio.Event()
+        app = _app(started, release, cancelled)
+        first = _request(app, "flaky-wifi", gone, [])
+        await asyncio.wait_for(started.wait(), 1)
+        gone.set()
+        await asyncio.wait_for(first, 1)
+
+        sent = []
+        retry = _request(app, "flaky-wifi", asyncio.Event(), sent)
+        await asyncio.sleep(GRACE_SECONDS * 2)
+        assert not cancelled.is_set()
+        release.set()
+        await asyncio.wait_for(retry, 1)
+        assert sent[0]["status"] == 200
+        assert (b"idempotent-replayed", b"true") in sent[0]["headers"]
+
+    asyncio.run(run())
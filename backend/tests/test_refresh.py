@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import refresh
+from cache import cache
+from summaries import SUMMARY_NAMESPACE
+from transcripts import content_hash, get_cached_transcript, save_transcript
+
+VIDEO_ID = "refresh-test"
+
+
+def _transcript(texts):
+    segments = [{"text": text, "start": i * 10.0, "duration": 10.0} for i, text in enumerate(texts)]
+    return {
+        "video_id": VIDEO_ID,
+        "language": "English",
+        "language_code": "en",
+        "is_generated": False,
+        "content_hash": content_hash(segments),
+        "segments": segments
+    }
+
+
+async def _no_export(transcript, title, provider):
+    raise AssertionError("the video has no artifact")
+
+
+@pytest.fixture
+def edited(monkeypatch):
+    """A video summarized from one transcript, whose captions YouTube now serves edited"""
+    old = _transcript(["gradient descent takes a step", "down the loss surface"])
+    new = _transcript(["gradient descent takes a small step", "down the loss surface"])
+    save_transcript(old)
+    cache.set(SUMMARY_NAMESPACE, VIDEO_ID, {"content_hash": old["content_hash"], "sections": []})
+
+    async def metadata(video_id):
+        return {"title": "Optimization"}
+
+    monkeypatch.setattr(refresh, "fetch_current_transcript", lambda video_id, preferred: new)
+    monkeypatch.setattr(refresh, "get_video_metadata", metadata)
+    monkeypatch.setattr(refresh, "worth_summarizing", lambda transcript: True)
+    yield old, new
+    cache.delete(SUMMARY_NAMESPACE, VIDEO_ID)
+
+
+def test_failed_regeneration_is_retried_not_rebased(edited, monkeypatch):
+    old, new = edited
+    summarized = []
+
+    async def preempted(transcript, title, provider):
+        raise HTTPException(status_code=503, detail="Gemini call deferred for higher-priority work")
+
+    async def summarize(transcript, title, provider):
+        summarized.append(transcript["content_hash"])
+        cache.set(SUMMARY_NAMESPACE, VIDEO_ID, {"content_hash": transcript["content_hash"], "sections": []})
+        return []
+
+    monkeypatch.setattr(refresh, "get_sections", preempted)
+    with pytest.raises(HTTPException):
+        asyncio.run(refresh.check_video(VIDEO_ID, _no_export))
+    # The summaries are still the old transcript's, and so is the cached transcript
+    assert get_cached_transcript(VIDEO_ID)["content_hash"] == old["content_hash"]
+
+    monkeypatch.setattr(refresh, "get_sections", summarize)
+    report = asyncio.run(refresh.check_video(VIDEO_ID, _no_export))
+    assert report["status"] == "changed"
+    assert summarized == [new["content_hash"]]
+    assert get_cached_transcript(VIDEO_ID)["content_hash"] == new["content_hash"]
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import scheduler
+from deadlines import shared
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """One Gemini slot, so every other call has to queue"""
+    single = scheduler.Scheduler("gemini", 1, {name: 1 for name in scheduler.PRIORITY_CLASSES}, scheduler.DEFAULT_WEIGHTS)
+    monkeypatch.setitem(scheduler.schedulers, "gemini", single)
+    return single
+
+
+async def _call(endpoint: str, hold: asyncio.Event = None):
+    async with scheduler.slot("gemini", endpoint):
+        if hold is not None:
+            await hold.wait()
+
+
+async def _summaries():
+    # What summaries.get_sections does for each batch of windows
+    await _call("summaries")
+    return "sections"
+
+
+def test_prefetch_summaries_queue_as_background_and_are_preempted(gemini):
+    async def run():
+        release = asyncio.Event()
+        busy = asyncio.ensure_future(_call("/analyze", release))
+        await asyncio.sleep(0)
+
+        inflight = {}
+        with scheduler.priority("background"):
+            prefetch = asyncio.ensure_future(shared(inflight, "vid", _summaries))
+        await asyncio.sleep(0.01)
+        assert len(gemini.queues["background"]) == 1
+
+        question = asyncio.ensure_future(_call("/ai-question"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as error:
+            await prefetch
+        assert error.value.status_code == 503
+
+        release.set()
+        await asyncio.gather(busy, question)
+        assert sum(gemini.running.values()) == 0
+
+    asyncio.run(run())
+
+
+def test_student_joining_background_summaries_raises_their_class(gemini):
+    async def run():
+        release = asyncio.Event()
+        busy = asyncio.ensure_future(_call("/analyze", release))
+        await asyncio.sleep(0)
+
+        inflight = {}
+        with scheduler.priority("background"):
+            prefetch = asyncio.ensure_future(shared(inflight, "vid", _summaries))
+        await asyncio.sleep(0.01)
+        student = asyncio.ensure_future(shared(inflight, "vid", _summaries))
+        await asyncio.sleep(0.01)
+        assert not gemini.queues["background"]
+        assert len(gemini.queues["standard"]) == 1
+
+        # No longer preemptible: the question waits its turn instead
+        question = asyncio.ensure_future(_call("/ai-question"))
+        await asyncio.sleep(0.01)
+        release.set()
+        assert await prefetch == "sections"
+        assert await student == "sections"
+        await asyncio.gather(busy, question)
+
+    asyncio.run(run())
+
+
+def test_shared_work_drops_back_when_the_student_leaves(gemini):
+    async def run():
+        release = asyncio.Event()
+        busy = asyncio.ensure_future(_call("/analyze", release))
+        await asyncio.sleep(0)
+
+        inflight = {}
+        with scheduler.priority("background"):
+            prefetch = asyncio.ensure_future(shared(inflight, "vid", _summaries))
+        await asyncio.sleep(0.01)
+        student = asyncio.ensure_future(shared(inflight, "vid", _summaries))
+        await asyncio.sleep(0.01)
+        student.cancel()
+        await asyncio.sleep(0.01)
+        assert len(gemini.queues["background"]) == 1
+
+        release.set()
+        assert await prefetch == "sections"
+        await busy
+
+    asyncio.run(run())
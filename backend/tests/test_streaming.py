@@ -0,0 +1,52 @@
+import json
+import tracemalloc
+
+from streaming import STREAM_CHUNK_BYTES, iter_json, json_chunks, segment_items
+
+
+def _segments(count: int) -> list:
+    return [
+        {"text": f"caption line {i} – schritt {i % 40} of the lab setup", "start": i * 2.5, "duration": 2.5}
+        for i in range(count)
+    ]
+
+
+def _payload(segments: list) -> dict:
+    # The /analyze response: the transcript goes out as a generator
+    return {
+        "video_id": "lab",
+        "transcript": segment_items(segments),
+        "chapters": [{"timestamp": "00:00", "title": "Introduction", "summary": "What the lab covers."}],
+        "summary": "Summary",
+        "source": "ai"
+    }
+
+
+def _peak_while_streaming(segments: list) -> int:
+    """Peak memory allocated on top of the segments while writing the body"""
+    tracemalloc.start()
+    try:
+        for _ in json_chunks(_payload(segments)):
+            pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_peak_memory_stays_flat_as_transcripts_grow():
+    peaks = [_peak_while_streaming(_segments(count)) for count in (2_000, 20_000, 80_000)]
+    # A 40x longer transcript (a body of ~7 MB), yet only about one chunk
+    # and its pieces in flight either way
+    assert peaks[-1] < peaks[0] * 1.5
+    assert max(peaks) < 16 * STREAM_CHUNK_BYTES
+
+
+def test_body_is_byte_identical_to_json_dumps():
+    segments = _segments(3_000)
+    expected = json.dumps(
+        {**_payload(segments), "transcript": list(segment_items(segments))},
+        ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    assert b"".join(json_chunks(_payload(segments))) == expected
+    assert b"".join(json_chunks(_payload(segments), chunk_bytes=7)) == expected
+    assert "".join(iter_json(_payload(segments))).encode("utf-8") == expected
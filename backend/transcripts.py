@@ -0,0 +1,236 @@
+"""
+Transcript acquisition engine shared by all endpoints.
+
+`fetch_transcript` is the only place that talks to YouTube for captions:
+
+1. Videos known to have no captions are answered from a negative cache
+   (TranscriptsDisabled / NoTranscriptFound results, kept for a TTL).
+2. Fetched transcripts are cached as plain segments keyed by video ID
+   (and requested languages).
+3. On a miss, the available tracks are listed once (the listing is kept
+   in memory for a while) and the best track is picked in a single pass
+   using a precomputed priority index: requested languages first, then
+   manual English, manual common languages, auto-generated English,
+   auto-generated common languages, then anything else.
+
+`fetch_current_transcript` bypasses the caches; the refresh job
+(refresh.py) uses it with `text_hash` to spot edited captions.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from youtube_transcript_api import YouTubeTranscriptApi
+from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
+
+from cache import cache
+from deadlines import bounded, shared
+from search_index import index_transcript
+
+TRANSCRIPT_NAMESPACE = "transcript"
+TRANSCRIPT_MISSING_NAMESPACE = "transcript_missing"
+TRANSCRIPT_TTL_SECONDS = int(os.getenv("TRANSCRIPT_CACHE_TTL", 7 * 24 * 3600))
+TRANSCRIPT_MISSING_TTL_SECONDS = int(os.getenv("TRANSCRIPT_MISSING_TTL", 6 * 3600))
+# Track listings hold signed caption URLs, so they are only reused briefly
+TRACK_LIST_TTL_SECONDS = int(os.getenv("TRACK_LIST_TTL", 1800))
+TRACK_LIST_LIMIT = 256
+
+COMMON_LANGUAGES = ['en', 'hi', 'es', 'fr', 'de', 'pt', 'ru', 'ja', 'ko', 'zh-Hans', 'zh-Hant']
+
+# Listings currently held in memory: video_id -> (expires_at, TranscriptList)
+_track_lists: "OrderedDict[str, tuple]" = OrderedDict()
+# Listings are read and stored from worker threads (asyncio.to_thread)
+_track_lists_lock = threading.Lock()
+# Fetches currently running, so concurrent requests share one YouTube call
+_inflight: dict = {}
+
+
+@lru_cache(maxsize=64)
+def priority_index(preferred: Tuple[str, ...] = ()) -> Dict[Tuple[bool, str], int]:
+    """Map (is_generated, language_code) to a rank; lower ranks win"""
+    order = []
+    for lang in preferred:
+        order += [(False, lang), (True, lang)]
+    order += [(False, lang) for lang in COMMON_LANGUAGES]
+    order += [(True, lang) for lang in COMMON_LANGUAGES]
+    index = {}
+    for rank, key in enumerate(order):
+        index.setdefault(key, rank)
+    return index
+
+
+def select_track(transcript_list, preferred: Tuple[str, ...] = ()):
+    """Pick the best track in one pass over the listing"""
+    index = priority_index(preferred)
+    fallback_rank = len(index)
+    best = None
+    best_rank = None
+    for position, track in enumerate(transcript_list):
+        rank = (index.get((track.is_generated, track.language_code), fallback_rank), position)
+        if best_rank is None or rank < best_rank:
+            best, best_rank = track, rank
+    return best
+
+
+def _list_tracks(video_id: str):
+    """List the video's caption tracks, reusing a recent listing"""
+    with _track_lists_lock:
+        entry = _track_lists.get(video_id)
+        if entry is not None and entry[0] > time.time():
+            _track_lists.move_to_end(video_id)
+            return entry[1]
+
+    transcript_list = YouTubeTranscriptApi().list(video_id)
+    with _track_lists_lock:
+        _track_lists[video_id] = (time.time() + TRACK_LIST_TTL_SECONDS, transcript_list)
+        if len(_track_lists) > TRACK_LIST_LIMIT:
+            _track_lists.popitem(last=False)
+    return transcript_list
+
+
+def content_hash(segments: List[dict]) -> str:
+    """Hash of the caption text and timing, used to detect transcript changes"""
+    digest = hashlib.sha256()
+    for segment in segments:
+        digest.update(f"{segment['start']:.2f}\t{segment['text']}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def text_hash(segments: List[dict]) -> str:
+    """Hash of the caption text alone (whitespace and case folded), so re-timed captions hash the same"""
+    digest = hashlib.sha256()
+    for segment in segments:
+        digest.update(" ".join(segment["text"].lower().split()).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def _cache_key(video_id: str, preferred: Tuple[str, ...]) -> str:
+    return f"{video_id}|{','.join(preferred)}" if preferred else video_id
+
+
+def _as_dict(video_id: str, fetched_transcript) -> dict:
+    segments = [
+        {"text": snippet.text, "start": snippet.start, "duration": snippet.duration}
+        for snippet in fetched_transcript.snippets
+    ]
+    return {
+        "video_id": video_id,
+        "language": getattr(fetched_transcript, "language", None),
+        "language_code": getattr(fetched_transcript, "language_code", None),
+        "is_generated": getattr(fetched_transcript, "is_generated", None),
+        "content_hash": content_hash(segments),
+        "segments": segments
+    }
+
+
+def store_transcript(video_id: str, fetched_transcript, preferred: Tuple[str, ...] = ()) -> dict:
+    """Cache a fetched transcript and return it as a plain dict"""
+    return save_transcript(_as_dict(video_id, fetched_transcript), preferred)
+
+
+def save_transcript(transcript: dict, preferred: Tuple[str, ...] = ()) -> dict:
+    """Cache a transcript dict (replacing the cached one) and index it for search"""
+    video_id = transcript["video_id"]
+    cache.set(TRANSCRIPT_NAMESPACE, _cache_key(video_id, preferred), transcript, ttl=TRANSCRIPT_TTL_SECONDS)
+    if preferred and get_cached_transcript(video_id) is None:
+        # Make the transcript available to lookups that do not know the languages
+        cache.set(TRANSCRIPT_NAMESPACE, video_id, transcript, ttl=TRANSCRIPT_TTL_SECONDS)
+    index_transcript(transcript)
+    return transcript
+
+
+def get_cached_transcript(video_id: str) -> Optional[dict]:
+    """Return the cached transcript for a video, if any"""
+    return cache.get(TRANSCRIPT_NAMESPACE, video_id)
+
+
+def cached_transcripts():
+    """Iterate over every cached transcript (one per video)"""
+    for key in cache.keys(TRANSCRIPT_NAMESPACE):
+        if "|" in key:
+            continue
+        transcript = cache.get(TRANSCRIPT_NAMESPACE, key)
+        if transcript is not None and "content_hash" in transcript:
+            yield transcript
+
+
+def _raise_missing(video_id: str, reason: str):
+    if reason == "disabled":
+        raise TranscriptsDisabled(video_id)
+    raise NoTranscriptFound(video_id, [], None)
+
+
+def _best_track(video_id: str, preferred: Tuple[str, ...]):
+    transcript_list = _list_tracks(video_id)
+    available = [
+        f"{t.language_code} ({t.language}) [{'AUTO' if t.is_generated else 'MANUAL'}]"
+        for t in transcript_list
+    ]
+    print(f"📋 Available transcripts: {', '.join(available)}")
+
+    track = select_track(transcript_list, preferred)
+    if track is None:
+        raise NoTranscriptFound(video_id, list(preferred), None)
+    print(f"✓ Selected: {'Auto-generated' if track.is_generated else 'Manual'} {track.language} transcript")
+    return track
+
+
+def _acquire(video_id: str, preferred: Tuple[str, ...]) -> dict:
+    """Blocking listing + fetch of the best track"""
+    try:
+        return store_transcript(video_id, _best_track(video_id, preferred).fetch(), preferred)
+
+    except TranscriptsDisabled:
+        cache.set(TRANSCRIPT_MISSING_NAMESPACE, video_id, {"reason": "disabled"}, ttl=TRANSCRIPT_MISSING_TTL_SECONDS)
+        raise
+    except NoTranscriptFound:
+        cache.set(TRANSCRIPT_MISSING_NAMESPACE, video_id, {"reason": "not_found"}, ttl=TRANSCRIPT_MISSING_TTL_SECONDS)
+        raise
+
+
+async def fetch_transcript(video_id: str, languages: Optional[List[str]] = None) -> dict:
+    """
+    Return {"video_id", "language", "language_code", "is_generated",
+    "content_hash", "segments"} for the best available transcript.
+    Raises TranscriptsDisabled / NoTranscriptFound when there is none.
+    """
+    preferred = tuple(languages or ())
+    missing = cache.get(TRANSCRIPT_MISSING_NAMESPACE, video_id)
+    if missing is not None:
+        print(f"⏭️  Skipping YouTube for {video_id}: cached '{missing['reason']}'")
+        _raise_missing(video_id, missing["reason"])
+
+    key = _cache_key(video_id, preferred)
+    cached = cache.get(TRANSCRIPT_NAMESPACE, key)
+    if cached is not None:
+        return cached
+
+    return await bounded(
+        shared(_inflight, key, lambda: asyncio.to_thread(_acquire, video_id, preferred)),
+        "transcript fetch"
+    )
+
+
+def fetch_current_transcript(video_id: str, preferred: Tuple[str, ...] = ()) -> dict:
+    """
+    Blocking fetch of the best track as YouTube serves it now, ignoring
+    every cache; the result is not stored. Raises TranscriptsDisabled /
+    NoTranscriptFound when there is none.
+    """
+    with _track_lists_lock:
+        _track_lists.pop(video_id, None)
+    return _as_dict(video_id, _best_track(video_id, preferred).fetch())
+
+
+def transcript_duration(segments: List[dict]) -> float:
+    """Duration implied by the transcript (end of the last caption)"""
+    if not segments:
+        return 0
+    last = segments[-1]
+    return last["start"] + last.get("duration", 0)
@@ -0,0 +1,346 @@
+"""
+Token usage and cost ledger with per-endpoint daily budgets.
+
+Every provider call records the tokens the provider reports (Gemini
+usage_metadata, OpenRouter usage) in an append-only SQLite ledger:
+endpoint, provider, model, input/cached/output tokens and the cost at
+MODEL_PRICES. When a response carries no usage, tokens are estimated
+from the text (4 characters per token) and the row is marked estimated.
+The endpoint is taken from the providers.generate call the provider call
+runs under.
+
+Budgets are USD per UTC day and endpoint, set with TOKEN_BUDGETS, e.g.
+'/analyze=2:5,/ai-question=1:3,*=5:10' (soft:hard, '*' for every other
+endpoint):
+
+- past the soft budget, model_policy picks the cheapest model that fits
+- past the hard budget, providers.generate refuses new calls with a 429
+  until the next UTC day, so the endpoint only serves cached results
+
+Today's spend per endpoint is read from the ledger at most every
+BUDGET_REFRESH_SECONDS, so all workers see each other's calls.
+"""
+import contextlib
+import contextvars
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from cache import CACHE_DIR
+
+USAGE_DB_PATH = os.getenv("USAGE_DB_PATH", os.path.join(CACHE_DIR, "usage.db"))
+BUDGET_REFRESH_SECONDS = float(os.getenv("BUDGET_REFRESH_SECONDS", 5))
+CHARS_PER_TOKEN = 4
+
+# USD per million (input, output) tokens; MODEL_PRICES adds or overrides
+# entries, e.g. '{"gemini-2.5-pro": [1.25, 10]}'
+DEFAULT_PRICES = {
+    "gemini-2.0-flash-exp": (0.10, 0.40),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-3-flash-preview": (0.50, 3.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+    "anthropic/claude-3-haiku": (0.25, 1.25),
+    "google/gemini-2.5-flash": (0.30, 2.50)
+}
+# Models without a price are charged like the most expensive default, so budgets err on the safe side
+UNKNOWN_MODEL_PRICE = (1.25, 10.00)
+# Share of the input price charged for tokens served from a context cache
+CACHED_INPUT_PRICE_FACTOR = float(os.getenv("CACHED_INPUT_PRICE_FACTOR", 0.25))
+
+
+def load_prices() -> Dict[str, Tuple[float, float]]:
+    prices = dict(DEFAULT_PRICES)
+    for model, (input_price, output_price) in json.loads(os.getenv("MODEL_PRICES") or "{}").items():
+        prices[model] = (float(input_price), float(output_price))
+    return prices
+
+
+def load_budgets() -> Dict[str, Tuple[float, float]]:
+    """TOKEN_BUDGETS, e.g. '/analyze=2:5,*=5:10', as {endpoint: (soft, hard)} in USD per day"""
+    budgets = {}
+    for item in os.getenv("TOKEN_BUDGETS", "").split(","):
+        endpoint, _, limits = item.partition("=")
+        soft, _, hard = limits.partition(":")
+        if endpoint.strip() and soft.strip():
+            soft_limit = float(soft)
+            budgets[endpoint.strip()] = (soft_limit, float(hard) if hard.strip() else soft_limit)
+    return budgets
+
+
+PRICES = load_prices()
+BUDGETS = load_budgets()
+
+# Endpoint of the providers.generate call being served, or of the
+# background job running it (see attributed_to)
+_endpoint: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("usage_endpoint", default=None)
+
+
+def price(model: str) -> Tuple[float, float]:
+    return PRICES.get(model, UNKNOWN_MODEL_PRICE)
+
+
+def cost(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+    input_price, output_price = price(model)
+    uncached = max(0, input_tokens - cached_tokens)
+    return (
+        uncached * input_price
+        + cached_tokens * input_price * CACHED_INPUT_PRICE_FACTOR
+        + output_tokens * output_price
+    ) / 1_000_000
+
+
+def today() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+
+def seconds_until_tomorrow() -> int:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(), now.tzinfo)
+    return int((tomorrow - now).total_seconds()) + 1
+
+
+class UsageLedger:
+    """Append-only SQLite table of provider calls, with per-day and per-endpoint totals"""
+
+    def __init__(self, path: str = USAGE_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript(
+            """CREATE TABLE IF NOT EXISTS usage_ledger (
+                id INTEGER PRIMARY KEY,
+                created_at REAL NOT NULL,
+                day TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                input_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                cost_usd REAL NOT NULL,
+                estimated INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_usage_ledger_day_endpoint ON usage_ledger (day, endpoint);
+            CREATE TRIGGER IF NOT EXISTS usage_ledger_no_update BEFORE UPDATE ON usage_ledger
+            BEGIN SELECT RAISE(ABORT, 'usage_ledger is append-only'); END;
+            CREATE TRIGGER IF NOT EXISTS usage_ledger_no_delete BEFORE DELETE ON usage_ledger
+            BEGIN SELECT RAISE(ABORT, 'usage_ledger is append-only'); END;"""
+        )
+        conn.commit()
+
+    def append(self, row: dict):
+        conn = self._connect()
+        conn.execute(
+            """INSERT INTO usage_ledger
+               (created_at, day, endpoint, provider, model, input_tokens, cached_tokens, output_tokens, cost_usd, estimated)
+               VALUES (:created_at, :day, :endpoint, :provider, :model, :input_tokens, :cached_tokens,
+                       :output_tokens, :cost_usd, :estimated)""",
+            row
+        )
+        conn.commit()
+
+    def _rows(self, sql: str, params: tuple) -> List[dict]:
+        cursor = self._connect().execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def spend(self, day: str, endpoint: str) -> float:
+        row = self._connect().execute(
+            "SELECT COALESCE(SUM(cost_usd), 0) FROM usage_ledger WHERE day = ? AND endpoint = ?", (day, endpoint)
+        ).fetchone()
+        return row[0]
+
+    def by_day(self, since_day: str) -> List[dict]:
+        """Totals per day, endpoint, provider and model"""
+        return self._rows(
+            """SELECT day, endpoint, provider, model, COUNT(*) AS calls,
+                      SUM(input_tokens) AS input_tokens, SUM(cached_tokens) AS cached_tokens,
+                      SUM(output_tokens) AS output_tokens, ROUND(SUM(cost_usd), 6) AS cost_usd,
+                      SUM(estimated) AS estimated_calls
+               FROM usage_ledger WHERE day >= ?
+               GROUP BY day, endpoint, provider, model
+               ORDER BY day DESC, cost_usd DESC""",
+            (since_day,)
+        )
+
+    def by_endpoint(self, since_day: str) -> List[dict]:
+        """Totals per endpoint, with the average tokens per call"""
+        return self._rows(
+            """SELECT endpoint, COUNT(*) AS calls,
+                      SUM(input_tokens) AS input_tokens, SUM(cached_tokens) AS cached_tokens,
+                      SUM(output_tokens) AS output_tokens, ROUND(SUM(cost_usd), 6) AS cost_usd,
+                      CAST(AVG(input_tokens) AS INTEGER) AS avg_input_tokens,
+                      CAST(AVG(output_tokens) AS INTEGER) AS avg_output_tokens
+               FROM usage_ledger WHERE day >= ?
+               GROUP BY endpoint
+               ORDER BY cost_usd DESC""",
+            (since_day,)
+        )
+
+
+usage_ledger = UsageLedger()
+
+# endpoint -> (day, spend, read at), refreshed from the ledger every BUDGET_REFRESH_SECONDS
+_spend_cache: Dict[str, Tuple[str, float, float]] = {}
+
+
+@contextlib.contextmanager
+def attributed_to(endpoint: str) -> Iterator[None]:
+    """
+    Record provider calls made inside the block under endpoint, unless an
+    enclosing block already attributes them (a background job such as
+    refresh.py keeps its calls under its own name and budget)
+    """
+    token = _endpoint.set(_endpoint.get() or endpoint)
+    try:
+        yield
+    finally:
+        _endpoint.reset(token)
+
+
+def record(
+    provider: str,
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    cached_tokens: int = 0,
+    cost_usd: Optional[float] = None,
+    estimated: bool = False
+):
+    """Append one provider call to the ledger"""
+    endpoint = _endpoint.get() or "unknown"
+    day = today()
+    if cost_usd is None:
+        cost_usd = cost(model, input_tokens, output_tokens, cached_tokens)
+    try:
+        usage_ledger.append({
+            "created_at": time.time(),
+            "day": day,
+            "endpoint": endpoint,
+            "provider": provider,
+            "model": model,
+            "input_tokens": input_tokens,
+            "cached_tokens": cached_tokens,
+            "output_tokens": output_tokens,
+            "cost_usd": cost_usd,
+            "estimated": int(estimated)
+        })
+    except sqlite3.Error as e:
+        print(f"⚠️  Could not record token usage for {endpoint}: {str(e)[:200]}")
+        metrics.incr("usage", "ledger_errors")
+    metrics.incr("output_tokens", endpoint, output_tokens)
+    metrics.incr("cost_usd", endpoint, cost_usd)
+
+    cached = _spend_cache.get(endpoint)
+    if cached is not None and cached[0] == day:
+        _spend_cache[endpoint] = (day, cached[1] + cost_usd, cached[2])
+
+
+def record_gemini(model: str, response, prompt: str = ""):
+    meta = getattr(response, "usage_metadata", None)
+    if meta is None or meta.prompt_token_count is None:
+        record(
+            "gemini", model, len(prompt) // CHARS_PER_TOKEN, len(response.text or "") // CHARS_PER_TOKEN,
+            estimated=True
+        )
+        return
+    record(
+        "gemini", model,
+        input_tokens=meta.prompt_token_count,
+        # Thinking tokens are billed as output
+        output_tokens=(meta.candidates_token_count or 0) + (getattr(meta, "thoughts_token_count", None) or 0),
+        cached_tokens=meta.cached_content_token_count or 0
+    )
+
+
+def record_openrouter(model: str, result: dict, prompt: str = "", text: str = ""):
+    usage = result.get("usage")
+    if not usage:
+        record(
+            "openrouter", model, len(prompt) // CHARS_PER_TOKEN, len(text or "") // CHARS_PER_TOKEN, estimated=True
+        )
+        return
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    record(
+        "openrouter", result.get("model") or model,
+        input_tokens=usage.get("prompt_tokens") or 0,
+        output_tokens=usage.get("completion_tokens") or 0,
+        cached_tokens=cached,
+        # OpenRouter reports what it charged when usage accounting is on
+        cost_usd=usage.get("cost")
+    )
+
+
+def budget_for(endpoint: str) -> Optional[Tuple[float, float]]:
+    return BUDGETS.get(endpoint) or BUDGETS.get("*")
+
+
+def spent_today(endpoint: str) -> float:
+    day = today()
+    cached = _spend_cache.get(endpoint)
+    if cached is not None and cached[0] == day and time.monotonic() - cached[2] < BUDGET_REFRESH_SECONDS:
+        return cached[1]
+    try:
+        spend = usage_ledger.spend(day, endpoint)
+    except sqlite3.Error as e:
+        print(f"⚠️  Could not read token spend for {endpoint}: {str(e)[:200]}")
+        return cached[1] if cached is not None and cached[0] == day else 0.0
+    _spend_cache[endpoint] = (day, spend, time.monotonic())
+    return spend
+
+
+def budget_state(endpoint: str) -> str:
+    """'ok', 'soft' (past the soft budget) or 'hard' (past the hard budget) for today"""
+    budget = budget_for(endpoint)
+    if budget is None:
+        return "ok"
+    spend = spent_today(endpoint)
+    if spend >= budget[1]:
+        return "hard"
+    if spend >= budget[0]:
+        return "soft"
+    return "ok"
+
+
+def report(days: int = 7) -> dict:
+    """Ledger totals for the last days (today included) and today's budget state"""
+    since = (datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=max(days, 1) - 1)).isoformat()
+    by_endpoint = usage_ledger.by_endpoint(since)
+    endpoints = sorted({row["endpoint"] for row in by_endpoint} | {e for e in BUDGETS if e != "*"})
+    budgets = {}
+    for endpoint in endpoints:
+        budget = budget_for(endpoint)
+        if budget is not None:
+            budgets[endpoint] = {
+                "spent_today_usd": round(spent_today(endpoint), 6),
+                "soft_usd": budget[0],
+                "hard_usd": budget[1],
+                "state": budget_state(endpoint)
+            }
+    return {
+        "since": since,
+        "by_endpoint": by_endpoint,
+        "by_day": usage_ledger.by_day(since),
+        "budgets": budgets
+    }
@@ -1,11 +1,16 @@
-import { useState, useCallback } from 'react';
+import { useState, useCallback, useEffect, useRef } from 'react';
 import { Keyboard, Alert, Platform } from 'react-native';
 import { supabase } from '../../lib/supabase';
+import { idempotencyKeyFor, settleIdempotencyKey } from '../../lib/idempotency';
 
 export const useAIQuestions = (video) => {
     const [userQuestion, setUserQuestion] = useState('');
     const [summary, setSummary] = useState('');
     const [loadingSummary, setLoadingSummary] = useState(false);
+    // In-flight /ai-question request, aborted when the screen is left so the backend stops working on it
+    const requestRef = useRef(null);
+
+    useEffect(() => () => requestRef.current?.abort(), []);
 
     const saveAIQuestionToDatabase = async (question, answer) => {
         if (!video.id) return;
@@ -84,10 +89,18 @@ export const useAIQuestions = (video) => {
             // Get backend URL from environment variable
             const BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
 
+            requestRef.current?.abort();
+            const controller = new AbortController();
+            requestRef.current = controller;
+            const action = `ai-question:${video.url}:${question}`;
+
             const response = await fetch(`${BACKEND_URL}/ai-question`, {
                 method: 'POST',
+                signal: controller.signal,
                 headers: {
                     'Content-Type': 'application/json',
+                    'X-Request-Timeout': '60', // seconds; the backend gives up after this
+                    'Idempotency-Key': idempotencyKeyFor(action), // a retry picks up this attempt's result
                 },
                 body: JSON.stringify({
                     video_url: video.url,
@@ -103,6 +116,7 @@ export const useAIQuestions = (video) => {
             }
 
             const data = await response.json();
+            settleIdempotencyKey(action);
 
             if (data.answer) {
                 setSummary(data.answer);
@@ -114,6 +128,7 @@ export const useAIQuestions = (video) => {
                 // setUserQuestion(question); 
             }
         } catch (error) {
+            if (error.name === 'AbortError') return;
             console.error('Summary Error:', error);
             Alert.alert('Error', 'Failed to generate answer: ' + error.message);
             setUserQuestion(question); // Restore on error so user doesn't lose text
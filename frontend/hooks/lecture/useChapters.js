@@ -1,6 +1,7 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { Alert, Platform } from 'react-native';
 import { supabase } from '../../lib/supabase';
+import { idempotencyKeyFor, settleIdempotencyKey } from '../../lib/idempotency';
 
 const chaptersCache = {};
 
@@ -8,6 +9,8 @@ export const useChapters = (video, isYouTubeVideo) => {
     const [chapters, setChapters] = useState([]);
     const [loadingChapters, setLoadingChapters] = useState(false);
     const [overallSummary, setOverallSummary] = useState('');
+    // In-flight /analyze request, aborted when the screen is left so the backend stops working on it
+    const requestRef = useRef(null);
 
     const saveChaptersToDatabase = async (chaptersData, summaryData) => {
         if (!video.id) return;
@@ -90,15 +93,23 @@ export const useChapters = (video, isYouTubeVideo) => {
 
             console.log('Using backend URL:', BACKEND_URL);
 
+            requestRef.current?.abort();
+            const controller = new AbortController();
+            requestRef.current = controller;
+            const action = `analyze:${video.url}`;
+
             const response = await fetch(`${BACKEND_URL}/analyze`, {
                 method: 'POST',
+                signal: controller.signal,
                 headers: {
                     'Content-Type': 'application/json',
+                    'X-Request-Timeout': '180', // seconds; the backend gives up after this
+                    'Idempotency-Key': idempotencyKeyFor(action), // a retry picks up this attempt's result
                 },
                 body: JSON.stringify({
                     video_url: video.url,
                     api_provider: 'gemini', // or 'openrouter'
-                    model: 'gemini-2.0-flash-exp', // or 'anthropic/claude-3.5-sonnet' for openrouter
+                    // model: 'gemini-2.0-flash-exp', // pin a model; by default the backend picks one per request
                 }),
             });
 
@@ -108,6 +119,7 @@ export const useChapters = (video, isYouTubeVideo) => {
             }
 
             const data = await response.json();
+            settleIdempotencyKey(action);
 
             // Update state with chapters and summary
             setChapters(data.chapters || []);
@@ -118,6 +130,7 @@ export const useChapters = (video, isYouTubeVideo) => {
 
             Alert.alert('Success', 'Chapters generated successfully!');
         } catch (error) {
+            if (error.name === 'AbortError') return;
             console.error('Chapter Generation Error:', error);
 
             // Provide more helpful error messages
@@ -144,6 +157,8 @@ export const useChapters = (video, isYouTubeVideo) => {
         fetchSavedChapters();
     }, [fetchSavedChapters]);
 
+    useEffect(() => () => requestRef.current?.abort(), []);
+
     return {
         chapters,
         loadingChapters,
@@ -1,6 +1,7 @@
 import { useState, useEffect, useCallback } from 'react';
 import { Alert } from 'react-native';
 import { supabase } from '../../lib/supabase';
+import { idempotencyKeyFor, settleIdempotencyKey } from '../../lib/idempotency';
 
 const quizCache = {};
 
@@ -79,11 +80,13 @@ export const useQuiz = (video) => {
         try {
             // Get backend URL from environment variable
             const BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
+            const action = `generate-quiz:${video.url}:${video.title}`;
 
             const response = await fetch(`${BACKEND_URL}/generate-quiz`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Idempotency-Key': idempotencyKeyFor(action), // a retry picks up this attempt's result
                 },
                 body: JSON.stringify({
                     video_url: video.url,
@@ -98,6 +101,7 @@ export const useQuiz = (video) => {
             }
 
             const data = await response.json();
+            settleIdempotencyKey(action);
 
             if (data.quiz && Array.isArray(data.quiz) && data.quiz.length > 0) {
                 setQuiz(data.quiz);
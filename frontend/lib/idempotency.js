@@ -0,0 +1,18 @@
+// Idempotency keys for backend AI requests. Retries of the same action (same video,
+// same question) reuse one key until a request succeeds, so the backend replays or
+// attaches to the first attempt instead of starting another LLM call.
+const pendingKeys = {};
+
+const newKey = () => `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+
+export const idempotencyKeyFor = (action) => {
+    if (!pendingKeys[action]) {
+        pendingKeys[action] = newKey();
+    }
+    return pendingKeys[action];
+};
+
+// Call once the action succeeded; the next request for it starts fresh
+export const settleIdempotencyKey = (action) => {
+    delete pendingKeys[action];
+};
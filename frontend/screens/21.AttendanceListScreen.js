@@ -13,6 +13,7 @@ export default function AttendanceListScreen({ navigation, route }) {
     const [absentStudents, setAbsentStudents] = useState([]);
     const [loading, setLoading] = useState(true);
     const [sessionInfo, setSessionInfo] = useState(null);
+    const [sessionStats, setSessionStats] = useState(null);
 
     const sessionId = route.params?.sessionId;
 
@@ -30,6 +31,7 @@ export default function AttendanceListScreen({ navigation, route }) {
         if (attendanceCache[sessionId] && loading) {
             const cached = attendanceCache[sessionId];
             setSessionInfo(cached.session);
+            setSessionStats(cached.stats);
             setPresentStudents(cached.present);
             setAbsentStudents(cached.absent);
             setLoading(false);
@@ -55,7 +57,8 @@ export default function AttendanceListScreen({ navigation, route }) {
                 return;
             }
 
-            // Fetch attendance records
+            // Fetch attendance records (for the lists; the counts come from fetchStats)
+            const statsRequest = fetchStats();
             const { data: records, error: recordsError } = await supabase
                 .from('attendance_records')
                 .select('*')
@@ -70,13 +73,15 @@ export default function AttendanceListScreen({ navigation, route }) {
             // Separate present and absent
             const present = records.filter(r => r.status === 'present');
             const absent = records.filter(r => r.status === 'absent');
+            const stats = await statsRequest;
 
             setSessionInfo(session);
+            setSessionStats(stats);
             setPresentStudents(present);
             setAbsentStudents(absent);
 
             // Update cache
-            attendanceCache[sessionId] = { session, present, absent };
+            attendanceCache[sessionId] = { session, stats, present, absent };
         } catch (error) {
             console.error('Error:', error);
         } finally {
@@ -84,6 +89,21 @@ export default function AttendanceListScreen({ navigation, route }) {
         }
     };
 
+    // Counts are precomputed on the backend; counting the records here is the fallback
+    const fetchStats = async () => {
+        try {
+            const BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
+            const response = await fetch(`${BACKEND_URL}/attendance/stats/sessions/${encodeURIComponent(sessionId)}`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return await response.json();
+        } catch (error) {
+            console.error('Error fetching attendance stats:', error);
+            return null;
+        }
+    };
+
     const getInitials = (name) => {
         if (!name) return '??';
         const parts = name.split(' ');
@@ -113,6 +133,10 @@ export default function AttendanceListScreen({ navigation, route }) {
         student.student_email?.toLowerCase().includes(searchQuery.toLowerCase())
     );
 
+    // While searching, the badges count the matching students instead
+    const presentCount = sessionStats && !searchQuery ? sessionStats.present : filteredPresentStudents.length;
+    const absentCount = sessionStats && !searchQuery ? sessionStats.absent : filteredAbsentStudents.length;
+
     return (
         <View style={styles.container}>
             <Background />
@@ -175,7 +199,7 @@ export default function AttendanceListScreen({ navigation, route }) {
                                     <Text style={styles.sectionTitle}>PRESENT STUDENTS</Text>
                                 </View>
                                 <View style={styles.countBadgePresent}>
-                                    <Text style={styles.countTextPresent}>{filteredPresentStudents.length}</Text>
+                                    <Text style={styles.countTextPresent}>{presentCount}</Text>
                                 </View>
                             </View>
 
@@ -225,7 +249,7 @@ export default function AttendanceListScreen({ navigation, route }) {
                                     <Text style={[styles.sectionTitle, { color: '#F87171' }]}>ABSENT STUDENTS</Text>
                                 </View>
                                 <View style={styles.countBadgeAbsent}>
-                                    <Text style={styles.countTextAbsent}>{filteredAbsentStudents.length}</Text>
+                                    <Text style={styles.countTextAbsent}>{absentCount}</Text>
                                 </View>
                             </View>
 
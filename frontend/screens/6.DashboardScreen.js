@@ -439,7 +439,8 @@ export default function DashboardScreen({ navigation }) {
                 visible: true,
                 session: session,
                 distance: distance.toFixed(1),
-                accuracy: userLocation.accuracy.toFixed(1)
+                accuracy: userLocation.accuracy.toFixed(1),
+                location: userLocation
             });
         } catch (error) {
             console.error('Location error:', error);
@@ -457,9 +458,10 @@ export default function DashboardScreen({ navigation }) {
         const session = confirmModal.session;
         const distance = confirmModal.distance;
         const accuracy = confirmModal.accuracy;
+        const location = confirmModal.location;
         setConfirmModal({ visible: false, session: null, distance: 0, accuracy: 0 });
 
-        if (!session || !user) return;
+        if (!session || !user || !location) return;
 
         const userEmail = user.email;
         const userName = user.name || user.given_name || user.nickname || 'Student';
@@ -472,36 +474,49 @@ export default function DashboardScreen({ navigation }) {
             }
             const studentId = generateUUIDFromString(userEmail);
 
-            // Check if already marked
-            const { data: existingRecord } = await supabase
-                .from('attendance_records')
-                .select('id')
-                .eq('session_id', session.id)
-                .eq('student_email', userEmail)
-                .single();
+            // The backend re-checks the location against the campus geofence and
+            // writes the record; a second check-in for the session is reported as already marked
+            const BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
+            const response = await fetch(`${BACKEND_URL}/attendance/check-in`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    session_id: session.id,
+                    student_id: studentId,
+                    student_email: userEmail,
+                    student_name: userName,
+                    latitude: location.latitude,
+                    longitude: location.longitude,
+                    altitude: location.altitude,
+                    accuracy: location.accuracy,
+                }),
+            });
+            const result = await response.json();
 
-            if (existingRecord) {
+            if (result.status === 'already_marked') {
                 setFeedbackModal({ visible: true, title: 'Already Marked', message: 'You have already marked attendance for this session', type: 'info' });
                 return;
             }
 
-            // Insert attendance record with location data
-            const { error } = await supabase
-                .from('attendance_records')
-                .insert({
-                    session_id: session.id,
-                    student_id: studentId,
-                    student_email: userEmail,
-                    student_name: userName,
-                    status: 'present',
-                    marked_at: new Date().toISOString(),
-                    distance_from_campus: parseFloat(distance),
-                    gps_accuracy: parseFloat(accuracy),
-                    location_verified: true,
+            if (result.status === 'rejected') {
+                setFeedbackModal({
+                    visible: true,
+                    title: 'Location Verification Failed',
+                    message: `You must be within ${result.allowed_distance}m of campus to mark attendance.\n\nYour distance: ${result.distance_from_campus}m\nGPS accuracy: ±${accuracy}m`,
+                    type: 'error'
                 });
+                return;
+            }
 
-            if (error) {
-                console.error('Error marking attendance:', error);
+            if (result.status === 'session_closed') {
+                setFeedbackModal({ visible: true, title: 'Session Closed', message: 'This attendance session is no longer active', type: 'info' });
+                return;
+            }
+
+            if (!response.ok || result.status !== 'marked') {
+                console.error('Error marking attendance:', result);
                 setFeedbackModal({ visible: true, title: 'Error', message: 'Failed to mark attendance. Please try again.', type: 'error' });
                 return;
             }
@@ -74,7 +74,7 @@ export default function StudentAttendanceScreen({ navigation }) {
                 calculateStats([]);
             } else {
                 setAttendanceRecords(data || []);
-                calculateStats(data || []);
+                await fetchStats(userEmail, data || []);
             }
         } catch (error) {
             console.error('Error:', error);
@@ -86,6 +86,28 @@ export default function StudentAttendanceScreen({ navigation }) {
         }
     };
 
+    // Totals are precomputed on the backend; counting the records here is the fallback
+    const fetchStats = async (userEmail, records) => {
+        try {
+            const BACKEND_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
+            const response = await fetch(`${BACKEND_URL}/attendance/stats/students/${encodeURIComponent(userEmail)}`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            const data = await response.json();
+            setStats({
+                total: data.sessions,
+                present: data.present,
+                absent: data.absent,
+                late: data.late,
+                percentage: Math.round(data.rates.present * 100)
+            });
+        } catch (error) {
+            console.error('Error fetching attendance stats:', error);
+            calculateStats(records);
+        }
+    };
+
     const calculateStats = (records) => {
         const total = records.length;
         const present = records.filter(r => r.status === 'present').length;
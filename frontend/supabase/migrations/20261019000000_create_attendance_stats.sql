@@ -0,0 +1,258 @@
+-- Incrementally maintained attendance aggregates
+-- Present/late/absent counts per session, per class and per student (within a class),
+-- kept up to date by triggers in the same transaction as the attendance write, so the
+-- backend's /attendance/stats endpoints read one row instead of scanning attendance_records
+
+CREATE TABLE IF NOT EXISTS attendance_session_stats (
+  session_id uuid PRIMARY KEY,
+  class_id uuid NOT NULL,
+  present integer NOT NULL DEFAULT 0,
+  late integer NOT NULL DEFAULT 0,
+  absent integer NOT NULL DEFAULT 0,
+  updated_at timestamptz DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS attendance_class_stats (
+  class_id uuid PRIMARY KEY REFERENCES classes(id) ON DELETE CASCADE,
+  sessions integer NOT NULL DEFAULT 0,
+  present integer NOT NULL DEFAULT 0,
+  late integer NOT NULL DEFAULT 0,
+  absent integer NOT NULL DEFAULT 0,
+  updated_at timestamptz DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS attendance_student_stats (
+  class_id uuid NOT NULL REFERENCES attendance_class_stats(class_id) ON DELETE CASCADE,
+  student_email text NOT NULL,
+  present integer NOT NULL DEFAULT 0,
+  late integer NOT NULL DEFAULT 0,
+  absent integer NOT NULL DEFAULT 0,
+  updated_at timestamptz DEFAULT now(),
+  PRIMARY KEY (class_id, student_email)
+);
+
+CREATE INDEX IF NOT EXISTS idx_attendance_session_stats_class ON attendance_session_stats(class_id);
+CREATE INDEX IF NOT EXISTS idx_attendance_student_stats_email ON attendance_student_stats(student_email);
+
+-- Apply a set of record changes (delta +1 for a new row, -1 for a removed one) to all
+-- three tables, one UPDATE per session and class however many rows changed
+CREATE OR REPLACE FUNCTION apply_attendance_stats(
+  p_session_ids uuid[],
+  p_emails text[],
+  p_statuses text[],
+  p_deltas integer[]
+)
+RETURNS void
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+  WITH changes AS (
+    SELECT c.session_id, c.student_email, s.class_id,
+           CASE WHEN c.status = 'present' THEN c.delta ELSE 0 END AS present,
+           CASE WHEN c.status = 'late' THEN c.delta ELSE 0 END AS late,
+           CASE WHEN c.status = 'absent' THEN c.delta ELSE 0 END AS absent
+    FROM unnest(p_session_ids, p_emails, p_statuses, p_deltas) AS c(session_id, student_email, status, delta)
+    -- Records of a session that is being deleted were already taken out of the stats
+    JOIN attendance_session_stats s ON s.session_id = c.session_id
+  ),
+  by_session AS (
+    UPDATE attendance_session_stats t
+       SET present = t.present + d.present, late = t.late + d.late, absent = t.absent + d.absent, updated_at = now()
+      FROM (SELECT session_id, sum(present) AS present, sum(late) AS late, sum(absent) AS absent
+              FROM changes GROUP BY session_id) d
+     WHERE t.session_id = d.session_id
+  ),
+  by_class AS (
+    UPDATE attendance_class_stats t
+       SET present = t.present + d.present, late = t.late + d.late, absent = t.absent + d.absent, updated_at = now()
+      FROM (SELECT class_id, sum(present) AS present, sum(late) AS late, sum(absent) AS absent
+              FROM changes GROUP BY class_id) d
+     WHERE t.class_id = d.class_id
+  )
+  INSERT INTO attendance_student_stats (class_id, student_email, present, late, absent)
+  SELECT class_id, student_email, sum(present), sum(late), sum(absent)
+    FROM changes
+   WHERE student_email IS NOT NULL
+   GROUP BY class_id, student_email
+  ON CONFLICT (class_id, student_email) DO UPDATE
+    SET present = attendance_student_stats.present + EXCLUDED.present,
+        late = attendance_student_stats.late + EXCLUDED.late,
+        absent = attendance_student_stats.absent + EXCLUDED.absent,
+        updated_at = now();
+$$;
+
+-- Statement-level triggers see every row of a batched upsert at once (transition tables)
+CREATE OR REPLACE FUNCTION attendance_records_stats_insert()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  PERFORM apply_attendance_stats(
+    array_agg(session_id), array_agg(student_email), array_agg(status), array_agg(1)
+  ) FROM new_rows;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION attendance_records_stats_delete()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  PERFORM apply_attendance_stats(
+    array_agg(session_id), array_agg(student_email), array_agg(status), array_agg(-1)
+  ) FROM old_rows;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION attendance_records_stats_update()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  PERFORM apply_attendance_stats(
+    array_agg(session_id), array_agg(student_email), array_agg(status), array_agg(delta)
+  ) FROM (
+    SELECT session_id, student_email, status, -1 AS delta FROM old_rows
+    UNION ALL
+    SELECT session_id, student_email, status, 1 AS delta FROM new_rows
+  ) changes;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS attendance_records_stats_insert ON attendance_records;
+CREATE TRIGGER attendance_records_stats_insert
+  AFTER INSERT ON attendance_records
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION attendance_records_stats_insert();
+
+DROP TRIGGER IF EXISTS attendance_records_stats_delete ON attendance_records;
+CREATE TRIGGER attendance_records_stats_delete
+  AFTER DELETE ON attendance_records
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION attendance_records_stats_delete();
+
+DROP TRIGGER IF EXISTS attendance_records_stats_update ON attendance_records;
+CREATE TRIGGER attendance_records_stats_update
+  AFTER UPDATE ON attendance_records
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION attendance_records_stats_update();
+
+-- A new session counts towards its class; a deleted one takes its records out of the
+-- class and student stats before they are removed by the cascade
+CREATE OR REPLACE FUNCTION attendance_sessions_stats()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO attendance_class_stats (class_id, sessions) VALUES (NEW.class_id, 1)
+    ON CONFLICT (class_id) DO UPDATE
+      SET sessions = attendance_class_stats.sessions + 1, updated_at = now();
+    INSERT INTO attendance_session_stats (session_id, class_id) VALUES (NEW.id, NEW.class_id)
+    ON CONFLICT (session_id) DO NOTHING;
+    RETURN NEW;
+  END IF;
+
+  UPDATE attendance_student_stats t
+     SET present = t.present - r.present, late = t.late - r.late, absent = t.absent - r.absent, updated_at = now()
+    FROM (SELECT student_email,
+                 count(*) FILTER (WHERE status = 'present') AS present,
+                 count(*) FILTER (WHERE status = 'late') AS late,
+                 count(*) FILTER (WHERE status = 'absent') AS absent
+            FROM attendance_records
+           WHERE session_id = OLD.id AND student_email IS NOT NULL
+           GROUP BY student_email) r
+   WHERE t.class_id = OLD.class_id AND t.student_email = r.student_email;
+
+  UPDATE attendance_class_stats c
+     SET sessions = c.sessions - 1, present = c.present - s.present, late = c.late - s.late,
+         absent = c.absent - s.absent, updated_at = now()
+    FROM attendance_session_stats s
+   WHERE s.session_id = OLD.id AND c.class_id = s.class_id;
+
+  DELETE FROM attendance_session_stats WHERE session_id = OLD.id;
+  RETURN OLD;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS attendance_sessions_stats_insert ON attendance_sessions;
+CREATE TRIGGER attendance_sessions_stats_insert
+  AFTER INSERT ON attendance_sessions
+  FOR EACH ROW EXECUTE FUNCTION attendance_sessions_stats();
+
+DROP TRIGGER IF EXISTS attendance_sessions_stats_delete ON attendance_sessions;
+CREATE TRIGGER attendance_sessions_stats_delete
+  BEFORE DELETE ON attendance_sessions
+  FOR EACH ROW EXECUTE FUNCTION attendance_sessions_stats();
+
+-- Recompute everything from attendance_records (backfill, or to repair drift)
+CREATE OR REPLACE FUNCTION refresh_attendance_stats()
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  DELETE FROM attendance_student_stats;
+  DELETE FROM attendance_class_stats;
+  DELETE FROM attendance_session_stats;
+
+  INSERT INTO attendance_session_stats (session_id, class_id, present, late, absent)
+  SELECT s.id, s.class_id,
+         count(r.id) FILTER (WHERE r.status = 'present'),
+         count(r.id) FILTER (WHERE r.status = 'late'),
+         count(r.id) FILTER (WHERE r.status = 'absent')
+    FROM attendance_sessions s
+    LEFT JOIN attendance_records r ON r.session_id = s.id
+   GROUP BY s.id, s.class_id;
+
+  INSERT INTO attendance_class_stats (class_id, sessions, present, late, absent)
+  SELECT class_id, count(*), sum(present), sum(late), sum(absent)
+    FROM attendance_session_stats
+   GROUP BY class_id;
+
+  INSERT INTO attendance_student_stats (class_id, student_email, present, late, absent)
+  SELECT s.class_id, r.student_email,
+         count(*) FILTER (WHERE r.status = 'present'),
+         count(*) FILTER (WHERE r.status = 'late'),
+         count(*) FILTER (WHERE r.status = 'absent')
+    FROM attendance_records r
+    JOIN attendance_sessions s ON s.id = r.session_id
+   WHERE r.student_email IS NOT NULL
+   GROUP BY s.class_id, r.student_email;
+END;
+$$;
+
+SELECT refresh_attendance_stats();
+
+-- Enable Row Level Security (rows are only written by the triggers above)
+ALTER TABLE attendance_session_stats ENABLE ROW LEVEL SECURITY;
+ALTER TABLE attendance_class_stats ENABLE ROW LEVEL SECURITY;
+ALTER TABLE attendance_student_stats ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Anyone can view session stats" ON attendance_session_stats;
+CREATE POLICY "Anyone can view session stats"
+  ON attendance_session_stats FOR SELECT
+  USING (true);
+
+DROP POLICY IF EXISTS "Anyone can view class stats" ON attendance_class_stats;
+CREATE POLICY "Anyone can view class stats"
+  ON attendance_class_stats FOR SELECT
+  USING (true);
+
+DROP POLICY IF EXISTS "Anyone can view student stats" ON attendance_student_stats;
+CREATE POLICY "Anyone can view student stats"
+  ON attendance_student_stats FOR SELECT
+  USING (true);